@@ -0,0 +1,55 @@
+"""
+Benchmark clock alignment and fusion on a synthetic multi-million sample run:
+a jig RPM trace and an ESC RPM trace on a clock with a known offset and drift.
+Reports the fitted offset/drift error and the time to fit and to fuse.
+"""
+import argparse
+import time
+import numpy as np
+
+from src.alignment import ClockFit, aligned_frame, fit_cross_correlation, fuse
+
+
+def timed(name, fcn):
+    start = time.perf_counter()
+    result = fcn()
+    print(f"{name:>18}: {(time.perf_counter() - start) * 1e3:9.1f} ms")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark clock alignment")
+    parser.add_argument("--samples", type=int, default=2_000_000)
+    parser.add_argument("--offset", type=float, default=123.456)
+    parser.add_argument("--drift-ppm", type=float, default=50.0)
+    parser.add_argument("--segments", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    jig_time = np.cumsum(rng.uniform(0.004, 0.006, args.samples))
+    # Throttle steps of random length, so they don't all fall on ESC samples
+    lengths = rng.integers(500, 1500, args.samples // 500 + 1)
+    steps = rng.uniform(0, 8000, len(lengths))
+    jig_rpm = np.repeat(steps, lengths)[: args.samples] + rng.normal(
+        0, 50, args.samples
+    )
+    true_fit = ClockFit(1 + args.drift_ppm * 1e-6, args.offset)
+    esc_time = true_fit.apply(jig_time)[::4]
+    esc_rpm = jig_rpm[::4] + rng.normal(0, 50, len(esc_time))
+    print(f"{args.samples} jig samples, {len(esc_time)} ESC samples")
+
+    fit = timed(
+        "cross correlation",
+        lambda: fit_cross_correlation(
+            jig_time, jig_rpm, esc_time, esc_rpm, segments=args.segments
+        ),
+    )
+    print(
+        f"offset error {(fit.offset - true_fit.offset) * 1e3:.2f} ms, "
+        f"drift {fit.drift_ppm:.1f} ppm (true {true_fit.drift_ppm:.1f}), "
+        f"residual {fit.residual * 1e3:.2f} ms"
+    )
+    jig = aligned_frame(jig_time, {"rpm": jig_rpm}, fit, prefix="jig_")
+    esc = aligned_frame(esc_time, {"rpm": esc_rpm}, prefix="esc_")
+    fused = timed("merge_asof fuse", lambda: fuse(jig, [esc], tolerance=0.05))
+    print(f"fused {fused.shape}, {fused['esc_rpm'].isna().mean() * 100:.2f}% unmatched")
@@ -0,0 +1,152 @@
+"""
+Benchmark parsing DataFlash .bin logs directly against loading the equivalent
+.mat export, in MB/s of .bin log. Uses --log if given, otherwise writes a
+synthetic log with a few interleaved message types.
+"""
+import argparse
+import struct
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+import scipy.io
+
+from src.dataflash import FMT_LENGTH, FMT_TYPE, DataFlashMat
+from src.log_analysis import Log
+
+SYNTHETIC_FORMATS = [
+    (FMT_TYPE, "FMT", "BBnNZ", "Type,Length,Name,Format,Columns"),
+    (10, "BAT", "QBfffffcf", "TimeUS,Inst,Volt,VoltR,Curr,CurrTot,EnrgTot,Temp,Res"),
+    (
+        11,
+        "IMU",
+        "QBffffffIIfBB",
+        "TimeUS,I,GyrX,GyrY,GyrZ,AccX,AccY,AccZ,EG,EA,T,GH,AH",
+    ),
+    (
+        12,
+        "RCOU",
+        "QHHHHHHHHHHHHHH",
+        "TimeUS,C1,C2,C3,C4,C5,C6,C7,C8,C9,C10,C11,C12,C13,C14",
+    ),
+    (13, "MSG", "QZ", "TimeUS,Message"),
+]
+STRUCT_CHARS = {
+    "B": "B",
+    "H": "H",
+    "I": "I",
+    "Q": "Q",
+    "f": "f",
+    "c": "h",
+    "n": "4s",
+    "N": "16s",
+    "Z": "64s",
+}
+
+
+def write_synthetic_log(file_path, num_messages):
+    structs = {
+        msg_type: struct.Struct("<3s" + "".join(STRUCT_CHARS[c] for c in fmt))
+        for msg_type, _, fmt, _ in SYNTHETIC_FORMATS
+    }
+    rng = np.random.default_rng(0)
+    with open(file_path, "wb") as log_file:
+        for msg_type, name, fmt, columns in SYNTHETIC_FORMATS:
+            log_file.write(
+                structs[FMT_TYPE].pack(
+                    bytes([0xA3, 0x95, FMT_TYPE]),
+                    msg_type,
+                    structs[msg_type].size,
+                    name.encode(),
+                    fmt.encode(),
+                    columns.encode(),
+                )
+            )
+        for i in range(num_messages):
+            time_us = i * 1000
+            header = bytes([0xA3, 0x95])
+            kind = i % 10
+            if kind < 6:
+                # Float payloads occasionally contain header-like byte pairs
+                values = rng.normal(size=6).tolist()
+                msg = structs[11].pack(
+                    header + b"\x0b", time_us, i % 2, *values, 0, 0, 25.0, 1, 1
+                )
+            elif kind < 9:
+                msg = structs[12].pack(
+                    header + b"\x0c", time_us, *rng.integers(1000, 2000, 14).tolist()
+                )
+            elif i % 100 == 99:
+                msg = structs[13].pack(
+                    header + b"\x0d", time_us, b"\xa3\x95 fake header"
+                )
+            else:
+                msg = structs[10].pack(
+                    header + b"\x0a",
+                    time_us,
+                    0,
+                    16.0,
+                    16.1,
+                    10 * rng.random(),
+                    i / 1e3,
+                    i / 1e4,
+                    2500,
+                    0.01,
+                )
+            log_file.write(msg)
+
+
+def timed(name, fcn, num_bytes):
+    start = time.perf_counter()
+    result = fcn()
+    elapsed = time.perf_counter() - start
+    print(f"{name:>18}: {elapsed * 1e3:8.1f} ms, {num_bytes / 1e6 / elapsed:7.1f} MB/s")
+    return result
+
+
+if __name__ == "__main__":
+    assert struct.calcsize("<3sBB4s16s64s") == FMT_LENGTH
+    parser = argparse.ArgumentParser(description="Benchmark .bin vs .mat log loading")
+    parser.add_argument("--log", type=Path, default=None)
+    parser.add_argument("--messages", type=int, default=500_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bin_path = args.log
+        if bin_path is None:
+            bin_path = Path(tmp_dir) / "synthetic.bin"
+            write_synthetic_log(bin_path, args.messages)
+        mat_path = Path(tmp_dir) / "export.mat"
+        mat = DataFlashMat(bin_path)
+        scipy.io.savemat(mat_path, {key: mat[key] for key in mat})
+        num_bytes = bin_path.stat().st_size
+        print(
+            f"{bin_path}: {num_bytes / 1e6:.1f} MB, {len(mat.dataflash.positions)} messages"
+        )
+
+        def get_bat(log):
+            return log.get_data("BAT_label", "BAT_0", "Curr")
+
+        bin_data = timed("bin parse + BAT", lambda: get_bat(Log(bin_path)), num_bytes)
+
+        def get_all(fresh_mat):
+            return [fresh_mat[key] for key in fresh_mat]
+
+        timed("bin parse + all", lambda: get_all(DataFlashMat(bin_path)), num_bytes)
+        mat_data = timed(
+            "mat load + BAT", lambda: get_bat(Log(mat_path, lazy=False)), num_bytes
+        )
+        assert all(np.array_equal(a, b) for a, b in zip(bin_data, mat_data))
+
+        try:
+            from pymavlink import DFReader
+        except ImportError:
+            DFReader = None
+        if DFReader is not None:
+            # Per-message decoding, as done by the .bin -> .mat conversion tools
+            def read_all():
+                reader = DFReader.DFReader_binary(str(bin_path))
+                while reader.recv_msg() is not None:
+                    pass
+
+            timed("pymavlink DFReader", read_all, num_bytes)
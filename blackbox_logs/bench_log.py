@@ -0,0 +1,99 @@
+"""
+Benchmark signal extraction from a long log: the original per-call label
+lookup and Python loop windowing against the cached label index,
+searchsorted windowing and the batch window API. Uses --log if given,
+otherwise a synthetic BAT-only log.
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+import scipy.io
+
+from src.log_analysis import Log
+
+SIGNALS = ["LineNo", "TimeUS", "Volt", "VoltR", "Curr", "CurrTot", "EnrgTot", "Temp"]
+
+
+def write_synthetic_log(file_path, num_samples):
+    labels = np.empty((len(SIGNALS), 1), dtype=object)
+    for i, signal in enumerate(SIGNALS):
+        labels[i, 0] = np.array([signal])
+    data = np.random.default_rng(0).normal(size=(num_samples, len(SIGNALS)))
+    data[:, 0] = np.arange(num_samples) * 10  # LineNo, log time base
+    scipy.io.savemat(file_path, {"BAT_label": labels, "BAT_0": data})
+
+
+def legacy_get_data(log, label_msg_name, data_msg_name, signal_name, start, end):
+    """
+    get_data as it was before the label index and searchsorted windowing.
+    """
+    labels = np.array([val[0][0] for val in log.log[label_msg_name]])
+    time_idx = np.where(labels == "LineNo")[0][0]
+    time_data = log.log[data_msg_name][:, time_idx] / 1e3
+    signal_idx = np.where(labels == signal_name)[0][0]
+    signal_data = log.log[data_msg_name][:, signal_idx]
+    start_i = 0
+    for i, t in enumerate(time_data):
+        if t >= start:
+            start_i = i
+            break
+    end_i = len(time_data)
+    for i, t in enumerate(time_data):
+        if t >= end:
+            end_i = i
+            break
+    return time_data[start_i:end_i], signal_data[start_i:end_i]
+
+
+def timed(name, fcn):
+    start = time.perf_counter()
+    fcn()
+    elapsed = time.perf_counter() - start
+    print(f"{name:>16}: {elapsed * 1e3:9.1f} ms")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Log.get_data")
+    parser.add_argument("--log", type=Path, default=None)
+    parser.add_argument("--samples", type=int, default=200_000)
+    parser.add_argument("--windows", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_path = args.log
+        if log_path is None:
+            log_path = Path(tmp_dir) / "synthetic.mat"
+            write_synthetic_log(log_path, args.samples)
+        log = Log(log_path, lazy=False)
+        time_data = log._get_raw_time()
+        edges = np.linspace(time_data[0], time_data[-1], args.windows + 1)
+        windows = list(zip(edges[:-1], edges[1:]))
+        signals = SIGNALS[1:]
+        print(
+            f"{len(time_data)} samples, {len(signals)} signals, {len(windows)} windows"
+        )
+
+        legacy = timed(
+            "legacy",
+            lambda: [
+                legacy_get_data(log, "BAT_label", "BAT_0", signal, start, end)
+                for signal in signals
+                for start, end in windows
+            ],
+        )
+        indexed = timed(
+            "get_data",
+            lambda: [
+                log.get_data("BAT_label", "BAT_0", signal, start, end)
+                for signal in signals
+                for start, end in windows
+            ],
+        )
+        batch = timed(
+            "get_data_windows",
+            lambda: log.get_data_windows("BAT_label", "BAT_0", signals, windows),
+        )
+        print(f"Speedup: {legacy / indexed:.0f}x get_data, {legacy / batch:.0f}x batch")
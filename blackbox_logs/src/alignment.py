@@ -0,0 +1,237 @@
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+import csv
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+import scipy.signal
+
+from .mat_log import CACHE_DIR
+
+ALIGNMENT_CACHE_NAME = "alignment"
+
+
+@dataclass(frozen=True)
+class ClockFit:
+    """
+    Linear map from one clock to another, target = scale * source + offset.
+    `scale` - 1 is the relative drift between the clocks.
+    """
+
+    scale: float = 1.0
+    offset: float = 0.0
+    method: str = ""
+    residual: float = 0.0
+    points: int = 0
+
+    @property
+    def drift_ppm(self):
+        return (self.scale - 1) * 1e6
+
+    def apply(self, time_data):
+        return self.scale * np.asarray(time_data, dtype=np.float64) + self.offset
+
+    def inverse(self):
+        return ClockFit(
+            1 / self.scale,
+            -self.offset / self.scale,
+            f"inverse {self.method}",
+            self.residual,
+            self.points,
+        )
+
+    def then(self, other):
+        """
+        Map through this clock fit and then `other`.
+        """
+        return ClockFit(
+            other.scale * self.scale,
+            other.scale * self.offset + other.offset,
+            f"{self.method} + {other.method}",
+            np.hypot(other.scale * self.residual, other.residual),
+            min(self.points, other.points),
+        )
+
+
+def fit_pairs(source, target, method="pairs", envelope=False):
+    """
+    Least squares clock fit from matching (source, target) timestamps. With
+    `envelope`, target stamps are taken as arrival times that include a
+    variable transport delay, and the offset follows the earliest arrivals
+    rather than the mean.
+    """
+    source = np.asarray(source, dtype=np.float64)
+    target = np.asarray(target, dtype=np.float64)
+    valid = np.isfinite(source) & np.isfinite(target)
+    source, target = source[valid], target[valid]
+    if len(source) == 0:
+        raise ValueError("No timestamp pairs to fit")
+    if len(source) == 1 or np.ptp(source) == 0:
+        scale = 1.0
+        offset = float(np.median(target - source))
+    else:
+        scale, offset = np.polyfit(source, target, 1)
+    residuals = target - (scale * source + offset)
+    if envelope:
+        shift = np.percentile(residuals, 5)
+        offset += shift
+        residuals -= shift
+    return ClockFit(
+        float(scale),
+        float(offset),
+        method,
+        float(np.sqrt(np.mean(residuals**2))),
+        len(source),
+    )
+
+
+def read_event_log(file_path):
+    """
+    Read the events of a pymavlink_client test log ("Start", "Armed",
+    "Arm system time", ...), skipping the per-command rows. Timestamps become
+    unix seconds, other values floats.
+    Returns {event: value}
+    """
+    events = {}
+    with open(file_path, newline="") as log_file:
+        for row in csv.reader(log_file):
+            if len(row) < 2 or not row[0] or row[0].lstrip("-").isdigit():
+                continue
+            try:
+                events[row[0]] = datetime.fromisoformat(row[1]).timestamp()
+            except ValueError:
+                try:
+                    events[row[0]] = float(row[1])
+                except ValueError:
+                    events[row[0]] = row[1]
+    return events
+
+
+def fit_arm_event(event_log_path):
+    """
+    Offset from autopilot boot time (s) to host unix time from the arm event of
+    a pymavlink_client test log. A single pair, so no drift.
+    """
+    events = read_event_log(event_log_path)
+    return fit_pairs(
+        [events["Arm system time"] / 1e3], [events["Armed"]], method="arm event"
+    )
+
+
+def fit_system_time(host_time, autopilot_time):
+    """
+    Autopilot boot time (s) to host unix time from messages stamped on both
+    clocks, e.g. SYSTEM_TIME records from the telemetry recorder.
+    """
+    return fit_pairs(autopilot_time, host_time, method="system time", envelope=True)
+
+
+def _resample(time_data, signal_data, dt):
+    grid = np.arange(time_data[0], time_data[-1], dt)
+    resampled = np.interp(grid, time_data, signal_data)
+    std = resampled.std()
+    return grid, (resampled - resampled.mean()) / (std if std > 0 else 1)
+
+
+def _best_lag(source, target):
+    """
+    Lag in samples (sub-sample, from a parabola through the peak) such that
+    source[n] best matches target[n + lag].
+    """
+    corr = scipy.signal.correlate(target, source, mode="full", method="fft")
+    lags = scipy.signal.correlation_lags(len(target), len(source), mode="full")
+    peak = int(np.argmax(corr))
+    shift = 0.0
+    if 0 < peak < len(corr) - 1:
+        left, centre, right = corr[peak - 1 : peak + 2]
+        denom = left - 2 * centre + right
+        if denom != 0:
+            shift = 0.5 * (left - right) / denom
+    return lags[peak] + shift
+
+
+def fit_cross_correlation(
+    source_time, source_signal, target_time, target_signal, dt=0.01, segments=1
+):
+    """
+    Clock fit that best lines up the same physical signal recorded on two
+    clocks (e.g. jig RPM against ESC RPM, or battery currents). Both signals are
+    resampled every `dt` s and cross-correlated with FFTs. With `segments` > 1
+    the source is split into that many pieces that are lined up separately, and
+    a line through their offsets gives the drift.
+    """
+    source_grid, source_resampled = _resample(
+        np.asarray(source_time), np.asarray(source_signal), dt
+    )
+    target_grid, target_resampled = _resample(
+        np.asarray(target_time), np.asarray(target_signal), dt
+    )
+    centres = []
+    offsets = []
+    for piece in np.array_split(np.arange(len(source_grid)), segments):
+        if len(piece) < 2:
+            continue
+        lag = _best_lag(source_resampled[piece], target_resampled)
+        offsets.append(target_grid[0] + lag * dt - source_grid[piece[0]])
+        centres.append(source_grid[piece].mean())
+    centres = np.array(centres)
+    return fit_pairs(centres, centres + np.array(offsets), method="cross correlation")
+
+
+def aligned_frame(time_data, signals, fit=None, prefix=""):
+    """
+    DataFrame of signals indexed by "time", mapped onto the target clock by
+    `fit` if given.
+    """
+    time_data = fit.apply(time_data) if fit is not None else np.asarray(time_data)
+    frame = pd.DataFrame(
+        {f"{prefix}{name}": np.asarray(values) for name, values in signals.items()}
+    )
+    frame.insert(0, "time", time_data)
+    return frame
+
+
+def fuse(base, others, tolerance=None, direction="nearest"):
+    """
+    Join frames from `aligned_frame` onto the rows of `base` by nearest "time"
+    with `pd.merge_asof`, one vectorized join per frame.
+    """
+    fused = base.sort_values("time", kind="stable")
+    for other in others:
+        fused = pd.merge_asof(
+            fused,
+            other.sort_values("time", kind="stable"),
+            on="time",
+            direction=direction,
+            tolerance=tolerance,
+        )
+    return fused.set_index("time")
+
+
+def _alignment_cache_file(file_paths, name, cache_dir):
+    key = [name]
+    for file_path in file_paths:
+        source = Path(file_path).resolve()
+        stat = source.stat()
+        key.append(f"{source}:{stat.st_mtime_ns}:{stat.st_size}")
+    digest = hashlib.sha1("|".join(key).encode()).hexdigest()[:16]
+    return Path(cache_dir) / ALIGNMENT_CACHE_NAME / f"{name}-{digest}.json"
+
+
+def cached_fit(file_paths, name, compute, cache_dir=CACHE_DIR):
+    """
+    Return the clock fit `compute()` for a run, cached on disk and keyed by
+    `name` and the path, mtime and size of every file it was fitted from.
+    """
+    cache_file = _alignment_cache_file(file_paths, name, cache_dir)
+    if cache_file.exists():
+        return ClockFit(**json.loads(cache_file.read_text()))
+    fit = compute()
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = cache_file.with_suffix(".tmp")
+    tmp_file.write_text(json.dumps(asdict(fit)))
+    os.replace(tmp_file, cache_file)
+    return fit
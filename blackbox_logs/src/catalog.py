@@ -0,0 +1,229 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import json
+import os
+import numpy as np
+
+from .log_analysis import Log
+
+LOG_SUFFIXES = (".bin", ".mat")
+INDEX_FILE_NAME = ".log_index.json"
+
+
+def _index_log(file_path):
+    """
+    Describe one log: its messages, their labels and sample counts, and the
+    time range covered by the log time base.
+    """
+    log = Log(file_path)
+    messages = {}
+    for name in log.log:
+        if name.endswith("_label"):
+            continue
+        label_name = f"{name.rsplit('_', 1)[0]}_label"
+        if label_name not in log.log:
+            continue
+        messages[name] = {
+            "label_msg": label_name,
+            "labels": [str(label) for label in log._get_labels_from_msg(label_name)],
+            "samples": int(log.log.shape(name)[0]),
+        }
+    try:
+        time_data = log._get_raw_time()
+        time_range = [float(time_data[0]), float(time_data[-1])]
+    except (KeyError, IndexError):
+        time_range = None
+    stat = Path(file_path).stat()
+    return {
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "messages": messages,
+        "time_range": time_range,
+        "duration": time_range[1] - time_range[0] if time_range else None,
+    }
+
+
+def _try_index_log(file_path):
+    # A log that fails to parse gets an error entry, so one bad file doesn't abort
+    # the refresh and isn't parsed again until it changes
+    stat = Path(file_path).stat()
+    try:
+        return _index_log(file_path)
+    except Exception as error:
+        return {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "error": f"{type(error).__name__}: {error}",
+        }
+
+
+def _query_log(
+    file_path, label_msg_name, data_msg_name, signal_name, start, end, reduce
+):
+    log = Log(file_path)
+    time_data, signal_data = log.get_data(
+        label_msg_name, data_msg_name, signal_name, start=start, end=end
+    )
+    if reduce is not None:
+        return reduce(signal_data) if len(signal_data) else np.nan
+    return np.array(time_data), np.array(signal_data)
+
+
+class LogCatalog:
+    """
+    Persistent index of every log in a directory, with signal queries that run
+    across logs in a process pool.
+
+    The index (messages, labels, sample counts, time range and duration per
+    log) is stored as JSON in the directory and only rebuilt for logs whose
+    mtime or size changed. Logs that fail to parse are recorded with their
+    error, listed by `errors` and left out of queries.
+    """
+
+    def __init__(self, directory, index_path=None, workers=None):
+        self.directory = Path(directory)
+        self.index_path = (
+            Path(index_path) if index_path else self.directory / INDEX_FILE_NAME
+        )
+        self.workers = workers
+        self.entries = {}
+        if self.index_path.exists():
+            self.entries = json.loads(self.index_path.read_text())
+        self.refresh()
+
+    def _log_paths(self):
+        return sorted(
+            path
+            for path in self.directory.rglob("*")
+            if path.suffix.lower() in LOG_SUFFIXES
+        )
+
+    def refresh(self):
+        """
+        Index new or changed logs and drop deleted ones.
+        """
+        paths = {
+            str(path.relative_to(self.directory)): path for path in self._log_paths()
+        }
+        stale = []
+        for name, path in paths.items():
+            entry = self.entries.get(name)
+            stat = path.stat()
+            if entry is None or (entry["mtime_ns"], entry["size"]) != (
+                stat.st_mtime_ns,
+                stat.st_size,
+            ):
+                stale.append(name)
+        removed = set(self.entries) - set(paths)
+        for name in removed:
+            del self.entries[name]
+
+        if stale:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                indexed = executor.map(_try_index_log, [paths[name] for name in stale])
+                for name, entry in zip(stale, indexed):
+                    self.entries[name] = entry
+        if stale or removed or not self.index_path.exists():
+            tmp_path = self.index_path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(self.entries, indent=1))
+            os.replace(tmp_path, self.index_path)
+
+    def errors(self):
+        """
+        Logs that failed to index, as {log: error}.
+        """
+        return {
+            name: entry["error"]
+            for name, entry in self.entries.items()
+            if "error" in entry
+        }
+
+    def logs(self, data_msg_name=None, signal_name=None):
+        """
+        Names of the indexed logs, optionally only those containing a msg/signal.
+        """
+        return [
+            name
+            for name, entry in self.entries.items()
+            if "error" not in entry
+            and (
+                data_msg_name is None
+                or (
+                    data_msg_name in entry["messages"]
+                    and (
+                        signal_name is None
+                        or signal_name in entry["messages"][data_msg_name]["labels"]
+                    )
+                )
+            )
+        ]
+
+    def get_data(
+        self,
+        label_msg_name,
+        data_msg_name,
+        signal_name,
+        start=0,
+        end=1e12,
+        logs=None,
+        reduce=None,
+    ):
+        """
+        Get a signal from many logs in parallel. Pass `reduce` (e.g. np.max) to
+        reduce each log's signal to a value inside the worker processes.
+        Returns {log: (time, signal)} or {log: reduce(signal)}
+        """
+        if logs is None:
+            logs = self.logs(data_msg_name, signal_name)
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            results = executor.map(
+                _query_log,
+                [self.directory / name for name in logs],
+                *(
+                    [value] * len(logs)
+                    for value in (
+                        label_msg_name,
+                        data_msg_name,
+                        signal_name,
+                        start,
+                        end,
+                        reduce,
+                    )
+                ),
+            )
+            return dict(zip(logs, results))
+
+    def get_aligned(
+        self,
+        label_msg_name,
+        data_msg_name,
+        signal_name,
+        dt,
+        start=0,
+        end=1e12,
+        logs=None,
+    ):
+        """
+        Get a signal from many logs resampled onto one grid of step `dt`,
+        relative to the start of each log's window. Logs shorter than the
+        longest one are padded with NaN.
+        Returns (time, {log: signal})
+        """
+        results = self.get_data(
+            label_msg_name, data_msg_name, signal_name, start=start, end=end, logs=logs
+        )
+        durations = [t[-1] - t[0] for t, _ in results.values() if len(t)]
+        grid = np.arange(0, max(durations, default=0) + dt, dt)
+        aligned = {}
+        for name, (time_data, signal_data) in results.items():
+            if len(time_data) == 0:
+                aligned[name] = np.full(len(grid), np.nan)
+                continue
+            aligned[name] = np.interp(
+                grid,
+                time_data - time_data[0],
+                signal_data,
+                left=np.nan,
+                right=np.nan,
+            )
+        return grid, aligned
@@ -0,0 +1,276 @@
+from collections.abc import Mapping
+from dataclasses import dataclass
+import numpy as np
+
+
+HEADER = (0xA3, 0x95)
+HEADER_LENGTH = 3
+FMT_TYPE = 128
+FMT_LENGTH = 89
+FMT_DTYPE = np.dtype(
+    [
+        ("header", "V3"),
+        ("type", "u1"),
+        ("length", "u1"),
+        ("name", "S4"),
+        ("format", "S16"),
+        ("columns", "S64"),
+    ]
+)
+# DataFlash format characters -> (numpy dtype, scale applied on read)
+FORMAT_TYPES = {
+    "a": (("<i2", (32,)), None),
+    "b": ("i1", None),
+    "B": ("u1", None),
+    "h": ("<i2", None),
+    "H": ("<u2", None),
+    "i": ("<i4", None),
+    "I": ("<u4", None),
+    "f": ("<f4", None),
+    "d": ("<f8", None),
+    "n": ("S4", None),
+    "N": ("S16", None),
+    "Z": ("S64", None),
+    "c": ("<i2", 1e-2),
+    "C": ("<u2", 1e-2),
+    "e": ("<i4", 1e-2),
+    "E": ("<u4", 1e-2),
+    "L": ("<i4", 1e-7),
+    "M": ("u1", None),
+    "q": ("<i8", None),
+    "Q": ("<u8", None),
+}
+INSTANCE_COLUMNS = ("Instance", "Inst", "I")
+
+
+@dataclass(frozen=True)
+class MessageFormat:
+    type: int
+    length: int
+    name: str
+    format: str
+    columns: tuple
+
+    @property
+    def dtype(self):
+        return np.dtype(
+            [("header", "V3")]
+            + [
+                (column, FORMAT_TYPES[char][0])
+                for column, char in zip(self.columns, self.format)
+            ]
+        )
+
+    def scale(self, column):
+        return FORMAT_TYPES[self.format[self.columns.index(column)]][1]
+
+
+def _parse_formats(buf, positions):
+    """
+    Decode every FMT candidate and keep the ones that describe a consistent
+    message layout, keyed by message type.
+    """
+    positions = positions[positions + FMT_LENGTH <= len(buf)]
+    raw = buf[positions[:, None] + np.arange(FMT_LENGTH)]
+    fmts = np.ascontiguousarray(raw).view(FMT_DTYPE).reshape(-1)
+
+    formats = {}
+    for fmt in fmts:
+        msg_type = int(fmt["type"])
+        if msg_type in formats:
+            continue
+        try:
+            name = fmt["name"].decode("ascii")
+            format_chars = fmt["format"].decode("ascii")
+            columns = tuple(fmt["columns"].decode("ascii").split(","))
+            msg_format = MessageFormat(
+                msg_type, int(fmt["length"]), name, format_chars, columns
+            )
+            if msg_format.dtype.itemsize != msg_format.length:
+                continue
+        except (UnicodeDecodeError, KeyError, ValueError, TypeError):
+            continue  # A header-like byte pattern inside some other message
+        formats[msg_type] = msg_format
+    return formats
+
+
+def _mark_path(succ, start):
+    """
+    Mark every node reachable from `start` along `succ`, using pointer doubling
+    so the walk is O(log n) vectorized passes rather than a Python loop.
+    """
+    marks = np.zeros(len(succ), dtype=bool)
+    marks[start] = True
+    jump = succ
+    while True:
+        idxs = np.flatnonzero(marks)
+        targets = jump[idxs]
+        if marks[targets].all():
+            return marks
+        marks[targets] = True
+        jump = jump[jump]
+
+
+class DataFlashLog:
+    """
+    ArduPilot DataFlash .bin log parser.
+
+    FMT messages are decoded once, then message boundaries are found for the
+    whole file with vectorized header matching and pointer chasing. Each
+    message type is unpacked in bulk into a NumPy structured array the first
+    time it is requested.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.buf = np.memmap(file_path, dtype=np.uint8, mode="r")
+        self._messages = {}
+        self._find_messages()
+
+    def _find_messages(self):
+        buf = self.buf
+        candidates = np.flatnonzero(
+            (buf[:-2] == HEADER[0]) & (buf[1:-1] == HEADER[1])
+        ).astype(np.int64)
+        types = buf[candidates + 2].astype(np.int64)
+
+        self.formats = _parse_formats(buf, candidates[types == FMT_TYPE])
+        lengths = np.zeros(256, dtype=np.int64)
+        for msg_type, msg_format in self.formats.items():
+            lengths[msg_type] = msg_format.length
+
+        # Every real message is followed directly by the next one, so the real
+        # messages are the chain of successors from the first header
+        num_candidates = len(candidates)
+        next_positions = candidates + lengths[types]
+        succ = np.searchsorted(candidates, next_positions)
+        linked = (lengths[types] > 0) & (succ < num_candidates)
+        linked[linked] &= candidates[succ[linked]] == next_positions[linked]
+        succ = np.append(np.where(linked, succ, num_candidates), num_candidates)
+
+        on_path = np.zeros(num_candidates + 1, dtype=bool)
+        start = 0
+        while start < num_candidates:
+            on_path |= _mark_path(succ, start)
+            last = np.flatnonzero(on_path[:num_candidates])[-1]
+            # Resync after a corrupt or truncated message
+            resume = max(next_positions[last], candidates[last] + 1)
+            start = int(np.searchsorted(candidates, resume))
+        on_path = on_path[:num_candidates]
+        on_path &= next_positions <= len(buf)
+
+        self.positions = candidates[on_path]
+        self.types = types[on_path]
+        self.line_numbers = np.arange(len(self.positions))
+        self.format_by_name = {f.name: f for f in self.formats.values()}
+
+    def message_names(self):
+        present = set(np.unique(self.types).tolist())
+        return [f.name for t, f in self.formats.items() if t in present]
+
+    def columns(self, name):
+        return self.format_by_name[name].columns
+
+    def line_numbers_of(self, name):
+        """
+        Index of each `name` message among all messages in the log.
+        """
+        return self.line_numbers[self.types == self.format_by_name[name].type]
+
+    def messages(self, name):
+        """
+        All `name` messages as a structured array, decoded in one gather.
+        """
+        if name not in self._messages:
+            msg_format = self.format_by_name[name]
+            positions = self.positions[self.types == msg_format.type]
+            raw = self.buf[positions[:, None] + np.arange(msg_format.length)]
+            self._messages[name] = (
+                np.ascontiguousarray(raw).view(msg_format.dtype).reshape(-1)
+            )
+        return self._messages[name]
+
+    def signal(self, name, column):
+        """
+        A numeric column of a message with its format scaling applied.
+        """
+        values = self.messages(name)[column]
+        scale = self.format_by_name[name].scale(column)
+        return values * scale if scale is not None else values
+
+
+class DataFlashMat(Mapping):
+    """
+    Presents a DataFlashLog with the same variable layout as a MATLAB .mat export,
+    `<MSG>_label` cell arrays of column names and `<MSG>_<instance>` matrices
+    whose first column is LineNo, so Log can use either backend.
+    """
+
+    def __init__(self, file_path):
+        self.dataflash = DataFlashLog(file_path)
+        self._variables = {}
+        self._index = {}
+        for name in self.dataflash.message_names():
+            self._index[f"{name}_label"] = (name, None)
+            for instance in self._instances(name):
+                self._index[f"{name}_{instance}"] = (name, instance)
+
+    def _instance_column(self, name):
+        columns = self.dataflash.columns(name)
+        return next((c for c in INSTANCE_COLUMNS if c in columns), None)
+
+    def _instances(self, name):
+        column = self._instance_column(name)
+        if column is None:
+            return [0]
+        return np.unique(self.dataflash.messages(name)[column]).tolist()
+
+    def _labels(self, name):
+        labels = ["LineNo", *self.dataflash.columns(name)]
+        cells = np.empty((len(labels), 1), dtype=object)
+        for i, label in enumerate(labels):
+            cells[i, 0] = np.array([label])
+        return cells
+
+    def _matrix(self, name, instance):
+        messages = self.dataflash.messages(name)
+        line_numbers = self.dataflash.line_numbers_of(name)
+        rows = slice(None)
+        column = self._instance_column(name)
+        if column is not None:
+            rows = messages[column] == instance
+        matrix = np.full(
+            (len(messages[rows]), len(self.dataflash.columns(name)) + 1), np.nan
+        )
+        matrix[:, 0] = line_numbers[rows]
+        for i, col in enumerate(self.dataflash.columns(name)):
+            if messages.dtype[col].kind in "biuf" and messages.dtype[col].ndim == 0:
+                matrix[:, i + 1] = self.dataflash.signal(name, col)[rows]
+        return matrix
+
+    def shape(self, key):
+        """
+        Shape of a variable, only decoding the message if it has instances.
+        """
+        name, instance = self._index[key]
+        num_columns = len(self.dataflash.columns(name)) + 1
+        if instance is None:
+            return (num_columns, 1)
+        if self._instance_column(name) is None:
+            return (len(self.dataflash.line_numbers_of(name)), num_columns)
+        return self[key].shape
+
+    def __getitem__(self, key):
+        if key not in self._variables:
+            name, instance = self._index[key]
+            if instance is None:
+                self._variables[key] = self._labels(name)
+            else:
+                self._variables[key] = self._matrix(name, instance)
+        return self._variables[key]
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
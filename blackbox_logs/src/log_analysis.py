@@ -1,7 +1,11 @@
+from pathlib import Path
 import scipy.io
 import numpy as np
 import matplotlib.pyplot as plt
 
+from .dataflash import DataFlashMat
+from .mat_log import CACHE_DIR, LazyMatFile
+
 
 TIME_LABEL_MSG_NAME = "BAT_label"
 TIME_DATA_MSG_NAME = "BAT_0"
@@ -9,8 +13,21 @@ TIME_SIGNAL_NAME = "LineNo"
 
 
 class Log:
-    def __init__(self, file_path):
-        self.log = scipy.io.loadmat(file_path)  # Load .mat file
+    def __init__(self, file_path, lazy=True, cache_dir=CACHE_DIR):
+        """
+        Open a DataFlash .bin log or a .mat export of one. .bin logs are parsed
+        directly. For .mat files with `lazy`, only the message index is read up
+        front and each message is loaded (and cached to `cache_dir`) the first
+        time it's used. Pass `lazy=False` to load the whole .mat file into memory.
+        """
+        self._label_index = {}
+        self._time = None
+        if Path(file_path).suffix.lower() == ".bin":
+            self.log = DataFlashMat(file_path)
+        elif lazy:
+            self.log = LazyMatFile(file_path, cache_dir=cache_dir)
+        else:
+            self.log = scipy.io.loadmat(file_path)  # Load .mat file
 
     def _get_labels_from_msg(self, label_msg):
         """
@@ -18,23 +35,50 @@ class Log:
         """
         return np.array([val[0][0] for val in self.log[label_msg]])
 
+    def _get_label_index(self, label_msg_name):
+        """
+        Get the label -> column index map for a msg, built once per log.
+        """
+        if label_msg_name not in self._label_index:
+            self._label_index[label_msg_name] = {
+                label: i
+                for i, label in enumerate(self._get_labels_from_msg(label_msg_name))
+            }
+        return self._label_index[label_msg_name]
+
+    def _get_signal_idx(self, label_msg_name, signal_name):
+        """
+        Get the column index of a signal in a msg.
+        """
+        return self._get_label_index(label_msg_name)[signal_name]
+
     def _get_signal_data(self, label_msg_name, data_msg_name, signal_name):
         """
         Get the data for a signal in a msg.
         """
-        labels = self._get_labels_from_msg(label_msg_name)  # Get all labels
-        signal_idx = np.where(labels == signal_name)[0][0]  # Get index of match
+        signal_idx = self._get_signal_idx(label_msg_name, signal_name)
         return self.log[data_msg_name][:, signal_idx]
 
     def _get_raw_time(self):
         """
         Get the unscaled log time values, in seconds.
         """
-        time_us = self._get_signal_data(
-            TIME_LABEL_MSG_NAME, TIME_DATA_MSG_NAME, TIME_SIGNAL_NAME
+        if self._time is None:
+            time_us = self._get_signal_data(
+                TIME_LABEL_MSG_NAME, TIME_DATA_MSG_NAME, TIME_SIGNAL_NAME
+            )
+            self._time = time_us / 1e3  # to s
+        return self._time
+
+    def _get_window_idxs(self, starts, ends):
+        """
+        Get the [start, end) sample indices of each time window.
+        """
+        time_data = self._get_raw_time()
+        return (
+            np.searchsorted(time_data, starts, side="left"),
+            np.searchsorted(time_data, ends, side="left"),
         )
-        print(time_us)
-        return time_us / 1e3  # to s
 
     def print_msgs(self):
         """
@@ -56,19 +100,28 @@ class Log:
         """
         time_data = self._get_raw_time()
         signal_data = self._get_signal_data(label_msg_name, data_msg_name, signal_name)
+        start_i, end_i = self._get_window_idxs(start, end)
+        return time_data[start_i:end_i], signal_data[start_i:end_i]
 
-        # Find start index
-        start_i = 0
-        for i, time in enumerate(time_data):
-            if time >= start:
-                start_i = i
-                break
-
-        # Find end index
-        end_i = len(time_data)
-        for i, time in enumerate(time_data):
-            if time >= end:
-                end_i = i
-                break
+    def get_data_windows(self, label_msg_name, data_msg_name, signal_names, windows):
+        """
+        Get the time-series data for many signals in a msg over many (start, end)
+        windows at once.
+        Returns {signal: [(time, signal) for each window]}
+        """
+        time_data = self._get_raw_time()
+        signal_idxs = [
+            self._get_signal_idx(label_msg_name, signal_name)
+            for signal_name in signal_names
+        ]
+        signals_data = self.log[data_msg_name][:, signal_idxs]
+        starts, ends = np.asarray(windows, dtype=np.float64).reshape(-1, 2).T
+        start_idxs, end_idxs = self._get_window_idxs(starts, ends)
 
-        return time_data[start_i:end_i], signal_data[start_i:end_i]
+        return {
+            signal_name: [
+                (time_data[start_i:end_i], signals_data[start_i:end_i, col])
+                for start_i, end_i in zip(start_idxs, end_idxs)
+            ]
+            for col, signal_name in enumerate(signal_names)
+        }
@@ -0,0 +1,83 @@
+from collections.abc import Mapping
+from pathlib import Path
+import hashlib
+import os
+import tempfile
+import numpy as np
+import scipy.io
+
+
+CACHE_DIR = Path(__file__).parent.parent / ".log_cache"
+
+
+def cache_path(file_path, cache_dir=CACHE_DIR):
+    """
+    Cache directory for a log, keyed by its path, mtime and size.
+    """
+    source = Path(file_path).resolve()
+    stat = source.stat()
+    key = f"{source}:{stat.st_mtime_ns}:{stat.st_size}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return Path(cache_dir) / f"{source.stem}-{digest}"
+
+
+class LazyMatFile(Mapping):
+    """
+    Read-only dict-like view of a .mat log that only loads the variables asked for.
+
+    Opening the file just lists its variables with `scipy.io.whosmat`. The
+    first access to a numeric variable loads it with `scipy.io.loadmat` and
+    writes it to a .npy cache, later accesses (and later sessions) memory-map
+    it from there. Non-numeric variables such as label cell arrays can't be
+    memory-mapped, so they are kept in memory once loaded.
+    """
+
+    def __init__(self, file_path, cache_dir=CACHE_DIR):
+        self.file_path = file_path
+        self.shapes = {name: shape for name, shape, _ in scipy.io.whosmat(file_path)}
+        self.cache_dir = (
+            cache_path(file_path, cache_dir) if cache_dir is not None else None
+        )
+        self._loaded = {}
+
+    def __getitem__(self, name):
+        if name not in self.shapes:
+            raise KeyError(name)
+        if name not in self._loaded:
+            self._loaded[name] = self._load(name)
+        return self._loaded[name]
+
+    def __iter__(self):
+        return iter(self.shapes)
+
+    def __len__(self):
+        return len(self.shapes)
+
+    def _load(self, name):
+        cached = self.cache_dir / f"{name}.npy" if self.cache_dir else None
+        if cached is not None and cached.exists():
+            return np.load(cached, mmap_mode="r")
+
+        value = scipy.io.loadmat(self.file_path, variable_names=[name])[name]
+        if cached is None or value.dtype.kind not in "biuf":
+            return value
+
+        # Write then rename so a half written cache is never memory-mapped
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".npy.tmp")
+        with os.fdopen(fd, "wb") as tmp_file:
+            np.save(tmp_file, value)
+        os.replace(tmp, cached)
+        return np.load(cached, mmap_mode="r")
+
+    def shape(self, name):
+        """
+        Shape of a variable, without loading it.
+        """
+        return self.shapes[name]
+
+    def loaded(self):
+        """
+        Names of the variables materialized so far.
+        """
+        return list(self._loaded)
@@ -0,0 +1,124 @@
+"""
+Benchmark how long cli.py takes to start. Each command is run in a fresh
+interpreter, and the time over a bare `python -c pass` is checked against a
+budget. --help for the CLI and for each subcommand should only need argparse,
+so -X importtime is also checked for anything heavy being imported. Importing
+the test runner's TestPlan and friends is timed as well, as notebooks do it.
+
+"""
+from pathlib import Path
+from typing import List, Sequence
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = Path(__file__).parent
+CLI = ROOT / "cli.py"
+HEAVY_MODULES = (
+    "numpy",
+    "pandas",
+    "scipy",
+    "matplotlib",
+    "serial",
+    "pymavlink",
+    "yaml",
+)
+HELP_COMMANDS = (
+    ["--help"],
+    ["run", "--help"],
+    ["sweep", "--help"],
+    ["convert", "--help"],
+    ["show", "--help"],
+)
+
+
+def wall_ms(command: Sequence[str], repeats: int, cwd: Path = ROOT) -> float:
+    times: List[float] = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=cwd, stdout=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - start) * 1e3)
+    return statistics.median(times)
+
+
+def heavy_imports(command: Sequence[str], cwd: Path = ROOT) -> List[str]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *command],
+        cwd=cwd,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    # Lines look like "import time:   self [us] | cumulative | imported package"
+    imported = {
+        line.rsplit("|", 1)[-1].strip().split(".")[0]
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:")
+    }
+    return sorted(imported.intersection(HEAVY_MODULES))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark CLI startup time")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=50.0,
+        help="Allowed time over a bare interpreter for each --help",
+    )
+    parser.add_argument(
+        "--import-budget-ms",
+        type=float,
+        default=300.0,
+        help="Allowed time over a bare interpreter to import runner",
+    )
+    args = parser.parse_args()
+
+    baseline = wall_ms([sys.executable, "-c", "pass"], args.repeats)
+    print(f"Bare interpreter: {baseline:.1f} ms")
+    failures = []
+    for command in HELP_COMMANDS:
+        name = " ".join(["cli.py", *command])
+        overhead = (
+            wall_ms([sys.executable, str(CLI), *command], args.repeats) - baseline
+        )
+        heavy = heavy_imports([str(CLI), *command])
+        print(
+            f"  {name:<24} +{overhead:6.1f} ms"
+            + (f", imports {', '.join(heavy)}" if heavy else "")
+        )
+        if overhead > args.budget_ms:
+            failures.append(
+                f"{name} took {overhead:.1f} ms, budget {args.budget_ms:g} ms"
+            )
+        if heavy:
+            failures.append(f"{name} imported {', '.join(heavy)}")
+
+    # Forwarded to client.py, which needs its dependencies to build its parser
+    overhead = (
+        wall_ms([sys.executable, str(CLI), "acquire", "--help"], args.repeats)
+        - baseline
+    )
+    print(f"  {'cli.py acquire --help':<24} +{overhead:6.1f} ms (not budgeted)")
+
+    overhead = (
+        wall_ms(
+            [sys.executable, "-c", "import runner"],
+            args.repeats,
+            cwd=ROOT / "test_runner",
+        )
+        - baseline
+    )
+    print(f"  {'import runner':<24} +{overhead:6.1f} ms")
+    if overhead > args.import_budget_ms:
+        failures.append(
+            f"import runner took {overhead:.1f} ms, budget {args.import_budget_ms:g} ms"
+        )
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,224 @@
+"""
+Command line entry point for the thrust jig tools.
+
+    python cli.py run out.csv --sweep 5 100 5 --step-ms 2000 --port /dev/ttyUSB0
+    python cli.py run out.csv --plan plan.csv
+    python cli.py acquire --port COM3 --out experiments_479
+    python cli.py sweep roll-vane --device udpin:0.0.0.0:14551
+    python cli.py convert test_data/open_air
+    python cli.py show test_data/open_air/test_5in_6blade.csv
+
+Only argparse is imported up front. Each subcommand imports what it needs
+(numpy, pandas, scipy, pyserial, pymavlink) once it runs, so --help and the
+lighter subcommands don't wait on the heavy ones.
+
+"""
+from pathlib import Path
+from typing import Optional, Sequence
+import argparse
+import sys
+
+ROOT = Path(__file__).parent
+TEST_RUNNER_DIR = ROOT / "test_runner"
+CLIENT_DIR = ROOT / "python_client"
+MAVLINK_DIR = ROOT / "mavlink"
+MAVLINK_SWEEPS = {
+    "roll-vane": "run_roll_vane_sweep",
+    "dual-throttle": "run_dual_prop_throttle_sweep",
+    "top-throttle": "run_top_prop_throttle_sweep",
+    "bottom-throttle": "run_bottom_prop_throttle_sweep",
+}
+
+
+def _use(directory: Path) -> None:
+    # The tools are flat modules importing their siblings by name
+    if str(directory) not in sys.path:
+        sys.path.append(str(directory))
+
+
+def run(args: argparse.Namespace) -> int:
+    _use(TEST_RUNNER_DIR)
+    from runner import TestPlan, TestStep, read_plan, test_run
+
+    if args.output.exists():
+        print(f"{args.output} already exists, not overwriting it")
+        return 1
+    if args.plan is not None:
+        plan = read_plan(args.plan)
+    else:
+        start, stop, step = args.sweep
+        count = int((stop - start) / step + 1e-9) + 1
+        plan = TestPlan(
+            args.output.stem,
+            [
+                TestStep(
+                    duration_ms=args.step_ms,
+                    top_throttle=start + i * step,
+                    bottom_throttle=start + i * step,
+                )
+                for i in range(count)
+            ],
+        )
+    test_run(
+        args.output,
+        plan,
+        teardown=args.teardown,
+        port=args.port,
+        binary=args.binary,
+        live_plot=args.live_plot,
+        monitor=args.monitor,
+        monitor_abort=args.monitor_abort,
+        latency_budget_ms=args.latency_budget_ms,
+    )
+    return 0
+
+
+def acquire(args: argparse.Namespace) -> int:
+    _use(TEST_RUNNER_DIR)
+    _use(CLIENT_DIR)
+    from client import main
+
+    main(args.args)
+    return 0
+
+
+def sweep(args: argparse.Namespace) -> int:
+    _use(MAVLINK_DIR)
+    import pymavlink_client as client
+
+    if args.log_dir is not None:
+        client.log_dir = args.log_dir
+    kwargs = {"baud": args.baud} if args.baud is not None else {}
+    client.connect(args.device or client.DEVICE, **kwargs)
+    try:
+        getattr(client, MAVLINK_SWEEPS[args.sweep])()
+    finally:
+        client.drone.close()
+    return 0
+
+
+def convert(args: argparse.Namespace) -> int:
+    _use(TEST_RUNNER_DIR)
+    from dataset import clear_cache, load_run, load_runs
+
+    if args.clear:
+        clear_cache()
+    for path in args.paths:
+        if path.is_dir():
+            runs = load_runs(path, workers=args.workers)
+            rows = sum(len(data) for data in runs.values())
+            print(f"{len(runs)} runs, {rows} samples under {path}")
+        else:
+            print(f"{len(load_run(path))} samples in {path}")
+    return 0
+
+
+def show(args: argparse.Namespace) -> int:
+    _use(TEST_RUNNER_DIR)
+    from dataset import load_run
+
+    data = load_run(args.path)
+    time_ms = data.index.to_numpy()
+    print(
+        f"{args.path}: {len(data)} samples over {(time_ms[-1] - time_ms[0]) / 1e3:.1f} s"
+    )
+    print(data.describe().T.to_string(float_format=lambda x: f"{x:.3f}"))
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Run and acquire thrust jig tests and work with their data"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser(
+        "run", help="Run a test plan on the thrust jig with test_runner"
+    )
+    run_parser.add_argument("output", type=Path, help="CSV file to save the run to")
+    plan = run_parser.add_mutually_exclusive_group(required=True)
+    plan.add_argument(
+        "--plan", type=Path, help="CSV of test steps, one column per TestStep field"
+    )
+    plan.add_argument(
+        "--sweep",
+        type=float,
+        nargs=3,
+        metavar=("START", "STOP", "STEP"),
+        help="Step both throttles from START to STOP %%",
+    )
+    run_parser.add_argument(
+        "--step-ms", type=int, default=2000, help="Length of each sweep step"
+    )
+    run_parser.add_argument("--port", "-p", help="Serial port, else from runner.ini")
+    run_parser.add_argument(
+        "--teardown",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Ramp the throttles down after the plan",
+    )
+    # Left unset, these fall back to runner.ini
+    run_parser.add_argument("--binary", action=argparse.BooleanOptionalAction)
+    run_parser.add_argument("--live-plot", action=argparse.BooleanOptionalAction)
+    run_parser.add_argument("--monitor", action=argparse.BooleanOptionalAction)
+    run_parser.add_argument(
+        "--monitor-abort",
+        action=argparse.BooleanOptionalAction,
+        help="Stop the jig on a sagging battery or a motor cutting out",
+    )
+    run_parser.add_argument(
+        "--latency-budget-ms", type=float, help="Closed loop latency budget"
+    )
+    run_parser.set_defaults(handler=run)
+
+    acquire_parser = commands.add_parser(
+        "acquire",
+        help="Record the load cell board with python_client, "
+        "see acquire --help for its options",
+        add_help=False,
+    )
+    acquire_parser.add_argument("args", nargs=argparse.REMAINDER)
+    acquire_parser.set_defaults(handler=acquire)
+
+    sweep_parser = commands.add_parser(
+        "sweep", help="Run a manual sweep on the autopilot over MAVLink"
+    )
+    sweep_parser.add_argument("sweep", choices=MAVLINK_SWEEPS)
+    sweep_parser.add_argument(
+        "--device", help="MAVLink connection string, else pymavlink_client.DEVICE"
+    )
+    sweep_parser.add_argument("--baud", type=int, help="Baud rate of a serial device")
+    sweep_parser.add_argument(
+        "--log-dir", type=Path, help="Directory for the test logs"
+    )
+    sweep_parser.set_defaults(handler=sweep)
+
+    convert_parser = commands.add_parser(
+        "convert", help="Convert run CSVs to the fast loading cache"
+    )
+    convert_parser.add_argument(
+        "paths", type=Path, nargs="+", help="Run CSVs or directories of them"
+    )
+    convert_parser.add_argument("--workers", type=int, help="Conversion processes")
+    convert_parser.add_argument(
+        "--clear", action="store_true", help="Clear the cache first"
+    )
+    convert_parser.set_defaults(handler=convert)
+
+    show_parser = commands.add_parser("show", help="Summarise a recorded run")
+    show_parser.add_argument("path", type=Path, help="Run CSV")
+    show_parser.set_defaults(handler=show)
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if argv[:1] == ["acquire"]:
+        # Passed through untouched, so client.py's own options and --help apply
+        return acquire(argparse.Namespace(args=argv[1:]))
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
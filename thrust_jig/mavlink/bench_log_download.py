@@ -0,0 +1,36 @@
+"""
+Benchmark onboard log download from a local fake autopilot, which like ArduPilot
+streams one requested range at a time at a fixed rate. Requests capped at 64
+chunks are compared with requesting whole gaps, checking the downloaded bytes
+each time.
+"""
+import argparse
+import random
+import tempfile
+from pathlib import Path
+
+import pymavlink.mavutil
+
+from fake_autopilot import FakeAutopilot
+from log_download import download_log
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark log download')
+    parser.add_argument('--port', type=int, default=14563)
+    parser.add_argument('--size-kb', type=int, default=256)
+    parser.add_argument('--drop-rate', type=float, default=0.02)
+    parser.add_argument('--log-rate', type=int, default=500, help='LOG_DATA chunks/s sent by the fake')
+    args = parser.parse_args()
+
+    log = random.Random(0).randbytes(args.size_kb * 1024 + 17)
+    with FakeAutopilot(port=args.port, logs={1: log}, drop_rate=args.drop_rate,
+                       log_rate=args.log_rate), \
+            tempfile.TemporaryDirectory() as tmp_dir:
+        conn = pymavlink.mavutil.mavlink_connection(f'udpin:127.0.0.1:{args.port}', source_system=245)
+        conn.wait_heartbeat()
+        for max_chunks in (64, None):
+            path = Path(tmp_dir) / f'max_{max_chunks}.bin'
+            stats = download_log(conn, 1, path, max_request_chunks=max_chunks)
+            assert path.read_bytes() == log, 'Downloaded log differs'
+            print(f'{"whole gaps" if max_chunks is None else f"{max_chunks} chunks":>10}: {stats.summary()}')
+        conn.close()
@@ -0,0 +1,60 @@
+"""
+Benchmark parameter reads against a local fake autopilot: one round trip per
+read (the old get_param) vs a cold ParamCache.fetch_all followed by cached reads,
+and bulk writes one at a time vs with a window of sets in flight.
+"""
+import argparse
+import time
+
+import pymavlink.mavutil
+
+from fake_autopilot import FakeAutopilot
+from params import ParamCache
+
+SWEEP_PARAMS = ['SERVO1_TRIM', 'SERVO1_MIN', 'SERVO1_MAX', 'SERVO2_TRIM', 'SERVO2_MIN', 'SERVO2_MAX']
+
+
+def round_trip_read(conn, name, timeout=1.0):
+    # Old get_param, with a timeout so a dropped reply costs one retry rather than a hang
+    while True:
+        conn.param_fetch_one(name)
+        msg = conn.recv_match(type='PARAM_VALUE', blocking=True, timeout=timeout,
+                              condition=f'PARAM_VALUE.param_id=="{name}"')
+        if msg is not None:
+            return msg.param_value
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark cached vs per-request parameter reads')
+    parser.add_argument('--port', type=int, default=14561)
+    parser.add_argument('--drop-rate', type=float, default=0.02)
+    parser.add_argument('--reads', type=int, default=10, help='Reads of each sweep parameter')
+    parser.add_argument('--writes', type=int, default=200)
+    parser.add_argument('--window', type=int, default=16)
+    args = parser.parse_args()
+
+    with FakeAutopilot(port=args.port, drop_rate=args.drop_rate):
+        conn = pymavlink.mavutil.mavlink_connection(f'udpin:127.0.0.1:{args.port}', source_system=245)
+        conn.wait_heartbeat()
+        num_reads = args.reads * len(SWEEP_PARAMS)
+
+        start = time.perf_counter()
+        for _ in range(args.reads):
+            for name in SWEEP_PARAMS:
+                round_trip_read(conn, name)
+        elapsed = time.perf_counter() - start
+        print(f'round trip reads: {num_reads} in {elapsed:.3f} s ({elapsed / num_reads * 1e3:.2f} ms/read)')
+
+        cache = ParamCache(conn)
+        cache.fetch_all()
+        for _ in range(args.reads):
+            for name in SWEEP_PARAMS:
+                cache.get(name)
+        print(f'cache: {cache.stats.summary()}')
+
+        names = list(cache.values)[:args.writes]
+        for window in (1, args.window):
+            values = {name: cache.values[name] + 1 for name in names}
+            result = cache.set_many(values, window=window, timeout=0.2)
+            print(f'writes, window {window:>2}: {result.summary()}')
+        conn.close()
@@ -0,0 +1,50 @@
+"""
+Benchmark command timing of the old sleep-per-command loop against the deadline
+scheduler at several rates, with a send that takes a fixed amount of time to
+stand in for manual_control_send and logging.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from scheduler import run_schedule, sweep_setpoint
+
+
+def busy(duration):
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        pass
+
+
+def sleep_loop(frequency, duration, send):
+    # The old sweep_channel inner loop
+    sent = []
+    start = time.monotonic()
+    for _ in range(int(frequency * duration)):
+        sent.append(time.monotonic() - start)
+        send(0)
+        time.sleep(1 / frequency)
+    return np.array(sent)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark MANUAL_CONTROL scheduling')
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--send-time', type=float, default=0.0005, help='s spent in each send')
+    parser.add_argument('--rates', type=float, nargs='+', default=[20, 50, 100, 200])
+    args = parser.parse_args()
+
+    def send(value):
+        busy(args.send_time)
+
+    for frequency in args.rates:
+        sent = sleep_loop(frequency, args.duration, send)
+        rate = (len(sent) - 1) / (sent[-1] - sent[0])
+        drift = sent[-1] - (len(sent) - 1) / frequency
+        print(f'{frequency:5.0f} Hz sleep loop: {rate:7.2f} Hz achieved, {drift * 1e3:7.1f} ms drift')
+
+        timing = run_schedule(frequency, sweep_setpoint(0, 1000, args.duration, 10, ramp=True), send)
+        drift = timing.sent[-1] - timing.deadlines[-1]
+        print(f'{frequency:5.0f} Hz deadlines:  {timing.achieved_rate:7.2f} Hz achieved, {drift * 1e3:7.1f} ms drift, '
+              f'p50 {timing.lateness_ms(50):.3f} ms, p99 {timing.lateness_ms(99):.3f} ms')
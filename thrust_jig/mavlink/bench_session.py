@@ -0,0 +1,41 @@
+"""
+Measure MavlinkSession message rates and dispatch latency against a local fake
+autopilot while a 100 Hz command loop runs on the main thread alongside a
+parameter fetch and a log download.
+"""
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+
+from fake_autopilot import FakeAutopilot
+from log_download import download_log
+from params import ParamCache
+from scheduler import run_schedule, sweep_setpoint
+from session import MavlinkSession
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark concurrent work on one MAVLink session')
+    parser.add_argument('--port', type=int, default=14564)
+    parser.add_argument('--drop-rate', type=float, default=0.02)
+    parser.add_argument('--duration', type=float, default=5.0)
+    args = parser.parse_args()
+
+    with FakeAutopilot(port=args.port, logs={1: bytes(256 * 1024)}, drop_rate=args.drop_rate) as fake, \
+            MavlinkSession(f'udpin:127.0.0.1:{args.port}') as session, \
+            tempfile.TemporaryDirectory() as tmp_dir:
+        session.wait_heartbeat()
+        params = ParamCache(session)
+
+        def background():
+            params.fetch_all()
+            print(f'params: {params.stats.summary()}')
+            print(f'log: {download_log(session, 1, Path(tmp_dir) / "log.bin").summary()}')
+
+        thread = threading.Thread(target=background)
+        thread.start()
+        timing = run_schedule(100, sweep_setpoint(0, 1000, args.duration, 10, ramp=True),
+                              lambda value: session.mav.manual_control_send(session.target_system, 0, 0, value, 0, 0))
+        thread.join()
+        print(f'commands: {timing.summary()}')
+        print(f'session: {session.stats.summary()}')
@@ -0,0 +1,35 @@
+"""
+Record telemetry from a local fake autopilot at elevated rates while a 100 Hz
+command loop runs, then report achieved rates, command timing and file size,
+and check the file reads back.
+"""
+import argparse
+import tempfile
+from pathlib import Path
+
+from fake_autopilot import FakeAutopilot
+from scheduler import run_schedule, sweep_setpoint
+from session import MavlinkSession
+from telemetry import DEFAULT_RATES, TelemetryRecorder, read_telemetry
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the telemetry recorder')
+    parser.add_argument('--port', type=int, default=14565)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--rate', type=float, default=None, help='Request every message at this rate')
+    args = parser.parse_args()
+
+    rates = DEFAULT_RATES if args.rate is None else dict.fromkeys(DEFAULT_RATES, args.rate)
+    with FakeAutopilot(port=args.port), MavlinkSession(f'udpin:127.0.0.1:{args.port}') as session, \
+            tempfile.TemporaryDirectory() as tmp_dir:
+        session.wait_heartbeat()
+        path = Path(tmp_dir) / 'telemetry.bin'
+        with TelemetryRecorder(session, path, rates) as recorder:
+            timing = run_schedule(100, sweep_setpoint(0, 1000, args.duration, 10, ramp=True),
+                                  lambda value: session.mav.manual_control_send(session.target_system, 0, 0, value, 0, 0))
+        print(f'telemetry: {recorder.stats.summary()}')
+        print(f'commands: {timing.summary()}')
+        print(f'session: {session.stats.summary()}')
+        for msg_type, records in read_telemetry(path).items():
+            assert len(records) == recorder.stats.counts[msg_type]
+            print(f'{msg_type}: {len(records)} records, {records.dtype.itemsize} bytes each')
@@ -0,0 +1,207 @@
+import os
+import random
+import threading
+import time
+from pathlib import Path
+
+import pymavlink.mavutil
+
+from log_download import CHUNK_SIZE
+from params import read_param_file
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    import pymavlink.mavutil.mavlink # pyright: reportMissingModuleSource = false
+
+PARAM_FILE = Path(__file__).parents[2] / 'ardupilot_parameters.param'
+
+
+class FakeAutopilot:
+    """
+    Minimal ArduPilot stand-in on a local UDP port for exercising the client
+    without a vehicle. It sends heartbeats and serves the parameter protocol,
+    including PARAM_SET echoes, from a .param file and onboard logs from `logs`
+    ({log id: contents}), dropping each outgoing reply with probability
+    `drop_rate` to imitate a lossy telemetry radio.
+
+    Like ArduPilot, there is one log transfer at a time: LOG_REQUEST_DATA replaces
+    whatever was being sent and the range is streamed at `log_rate` chunks/s.
+    """
+
+    def __init__(self, port=14551, param_file=PARAM_FILE, logs: dict[int, bytes] | None = None,
+                 log_size=64 * 1024, drop_rate=0.0, seed=0, log_rate=500):
+        os.environ['MAVLINK20'] = '1'
+        self.conn = pymavlink.mavutil.mavlink_connection(
+            f'udpout:127.0.0.1:{port}', source_system=1, source_component=1, dialect='ardupilotmega')
+        self.params = read_param_file(param_file)
+        self.logs = logs or {}
+        self.log_size = log_size
+        self.log_rate = log_rate
+        self._transfer: list | None = None # [log id, next offset, end offset]
+        self._next_chunk = 0.0
+        self.armed = False
+        self.custom_mode = 0
+        self.manual_controls = 0
+        self.throttle = 0
+        self.intervals: dict[int, float] = {} # message id -> s
+        self._next_send: dict[int, float] = {}
+        self.boot_time = time.monotonic()
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.sent = 0
+        self.dropped = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.conn.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def send(self, msg, lossy=True):
+        if lossy and self.random.random() < self.drop_rate:
+            self.dropped += 1
+            return
+        self.sent += 1
+        self.conn.mav.send(msg)
+
+    def _send_param(self, index: int):
+        names = list(self.params)
+        name = names[index]
+        self.send(self.conn.mav.param_value_encode(
+            name.encode(), self.params[name], pymavlink.mavutil.mavlink.MAV_PARAM_TYPE_REAL32, len(names), index))
+
+    def time_boot_ms(self) -> int:
+        return int((time.monotonic() - self.boot_time) * 1e3)
+
+    def send_heartbeat(self):
+        base_mode = pymavlink.mavutil.mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED
+        if self.armed:
+            base_mode |= pymavlink.mavutil.mavlink.MAV_MODE_FLAG_SAFETY_ARMED
+        self.send(self.conn.mav.heartbeat_encode(
+            pymavlink.mavutil.mavlink.MAV_TYPE_QUADROTOR, pymavlink.mavutil.mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA, base_mode, self.custom_mode,
+            pymavlink.mavutil.mavlink.MAV_STATE_ACTIVE if self.armed else pymavlink.mavutil.mavlink.MAV_STATE_STANDBY), lossy=False)
+
+    def telemetry_message(self, msg_id: int):
+        msg_class = pymavlink.mavutil.mavlink.mavlink_map[msg_id]
+        values = {name: [0] * length if length else 0
+                  for name, length in zip(msg_class.ordered_fieldnames, msg_class.array_lengths)}
+        values.update({
+            'time_usec': int((time.monotonic() - self.boot_time) * 1e6),
+            'time_boot_ms': self.time_boot_ms(),
+            'servo5_raw': 1000 + self.throttle,
+            'servo6_raw': 1000 + self.throttle,
+            'rpm': [self.throttle * 8] * 4,
+            'current': [self.throttle // 10] * 4,
+            'current_battery': self.throttle * 4,
+            'voltages': [4000] * 4 + [65535] * 6,
+        })
+        if msg_id == pymavlink.mavutil.mavlink.MAVLINK_MSG_ID_SYSTEM_TIME:
+            values['time_unix_usec'] = int(time.time() * 1e6)
+        msg = msg_class(**{name: values[name] for name in msg_class.fieldnames})
+        return msg
+
+    def _command_long(self, msg):
+        if msg.command == pymavlink.mavutil.mavlink.MAV_CMD_SET_MESSAGE_INTERVAL:
+            msg_id = int(msg.param1)
+            if msg_id not in pymavlink.mavutil.mavlink.mavlink_map:
+                self.send(self.conn.mav.command_ack_encode(msg.command, pymavlink.mavutil.mavlink.MAV_RESULT_DENIED))
+                return
+            if msg.param2 > 0:
+                self.intervals[msg_id] = msg.param2 * 1e-6
+                self._next_send[msg_id] = time.monotonic()
+            else:
+                self.intervals.pop(msg_id, None)
+        elif msg.command == pymavlink.mavutil.mavlink.MAV_CMD_DO_SET_MODE:
+            self.custom_mode = int(msg.param2)
+        elif msg.command == pymavlink.mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM:
+            armed = msg.param1 == 1
+            if armed and not self.armed:
+                self.logs[max(self.logs, default=0) + 1] = b''
+            elif self.armed and not armed:
+                self.logs[max(self.logs)] = self.random.randbytes(self.log_size)
+            self.armed = armed
+            self.send_heartbeat()
+        else:
+            self.send(self.conn.mav.command_ack_encode(msg.command, pymavlink.mavutil.mavlink.MAV_RESULT_UNSUPPORTED))
+            return
+        self.send(self.conn.mav.command_ack_encode(msg.command, pymavlink.mavutil.mavlink.MAV_RESULT_ACCEPTED))
+
+    def _run(self):
+        last_heartbeat = 0.0
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if now - last_heartbeat > 1:
+                last_heartbeat = now
+                self.send_heartbeat()
+                self.send(self.conn.mav.system_time_encode(int(time.time() * 1e6), self.time_boot_ms()))
+            for msg_id, interval in list(self.intervals.items()):
+                if now >= self._next_send[msg_id]:
+                    self._next_send[msg_id] = max(self._next_send[msg_id] + interval, now)
+                    self.send(self.telemetry_message(msg_id))
+            if self._transfer is not None:
+                self._stream_log(now)
+            busy = self.intervals or self._transfer is not None
+            msg = self.conn.recv_match(blocking=True, timeout=0.001 if busy else 0.01)
+            if msg is not None:
+                self.handle(msg)
+
+    def _stream_log(self, now: float):
+        log_id, ofs, end = self._transfer
+        log = self.logs.get(log_id, b'')
+        while ofs < end and now >= self._next_chunk:
+            data = log[ofs:min(ofs + CHUNK_SIZE, end)]
+            self.send(self.conn.mav.log_data_encode(log_id, ofs, len(data), data.ljust(CHUNK_SIZE, b'\0')))
+            ofs += CHUNK_SIZE
+            self._next_chunk += 1 / self.log_rate
+        self._transfer = [log_id, ofs, end] if ofs < end else None
+
+    def handle(self, msg):
+        msg_type = msg.get_type()
+        if msg_type == 'PARAM_REQUEST_LIST':
+            for index in range(len(self.params)):
+                self._send_param(index)
+        elif msg_type == 'PARAM_REQUEST_READ':
+            if msg.param_index >= 0:
+                index = msg.param_index
+            elif msg.param_id in self.params:
+                index = list(self.params).index(msg.param_id)
+            else:
+                return
+            if index < len(self.params):
+                self._send_param(index)
+        elif msg_type == 'PARAM_SET':
+            if msg.param_id in self.params:
+                self.params[msg.param_id] = msg.param_value
+                self._send_param(list(self.params).index(msg.param_id))
+        elif msg_type == 'LOG_REQUEST_LIST':
+            last_log = max(self.logs, default=0)
+            if not self.logs:
+                # ArduPilot answers with an empty entry when there are no logs
+                self.send(self.conn.mav.log_entry_encode(0, 0, 0, 0, 0))
+            for log_id in range(msg.start, min(msg.end, last_log) + 1):
+                if log_id in self.logs:
+                    self.send(self.conn.mav.log_entry_encode(
+                        log_id, len(self.logs), last_log, 0, len(self.logs[log_id])))
+        elif msg_type == 'LOG_REQUEST_DATA':
+            # A new request restarts the transfer at its own offset and count
+            log = self.logs.get(msg.id, b'')
+            self._transfer = [msg.id, msg.ofs, min(msg.ofs + msg.count, len(log))]
+            self._next_chunk = time.monotonic()
+        elif msg_type == 'LOG_REQUEST_END':
+            self._transfer = None
+        elif msg_type == 'COMMAND_LONG':
+            self._command_long(msg)
+        elif msg_type == 'MANUAL_CONTROL':
+            self.manual_controls += 1
+            self.throttle = msg.z
@@ -0,0 +1,151 @@
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pymavlink.mavutil
+
+CHUNK_SIZE = 90 # bytes of log in each LOG_DATA message
+
+
+@dataclass
+class LogDownloadStats:
+    log_id: int = 0
+    size: int = 0
+    requests: int = 0
+    rerequests: int = 0
+    chunks: int = 0
+    duplicate_chunks: int = 0
+    missing_chunks: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def received(self):
+        return min(self.chunks * CHUNK_SIZE, self.size)
+
+    @property
+    def kb_per_s(self):
+        return self.received / 1024 / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self):
+        size = f'{self.received / 1024:.1f} of ' if self.missing_chunks else ''
+        return (f'Log {self.log_id}: {size}{self.size / 1024:.1f} KB in {self.elapsed:.2f} s ({self.kb_per_s:.1f} KB/s), '
+                f'{self.requests} requests, {self.rerequests} chunks re-requested, '
+                f'{self.duplicate_chunks} duplicate chunks'
+                + (f', {self.missing_chunks} chunks missing' if self.missing_chunks else ''))
+
+
+class LogDownloadTimeout(TimeoutError):
+    """
+    The download gave up before the whole log arrived. The partial log is left
+    at its path with the missing chunks zeroed, and `stats` has how far it got.
+    """
+
+    def __init__(self, message: str, stats: LogDownloadStats):
+        super().__init__(message)
+        self.stats = stats
+
+
+def get_log_size(conn: pymavlink.mavutil.mavfile, log_id: int, timeout=2.0, retries=3) -> int:
+    for _ in range(retries):
+        conn.mav.log_request_list_send(conn.target_system, conn.target_component, log_id, log_id)
+        msg = conn.recv_match(type='LOG_ENTRY', blocking=True, timeout=timeout,
+                              condition=f'LOG_ENTRY.id=={log_id}')
+        if msg is not None:
+            return msg.size
+    raise TimeoutError(f'No LOG_ENTRY for log {log_id}')
+
+
+def _next_range(received: np.ndarray, merge_chunks: int, max_chunks: int | None) -> tuple[int, int]:
+    # The first gap, extended over later gaps with at most `merge_chunks` received
+    # chunks between them, as resending those is cheaper than another round trip
+    missing = np.flatnonzero(~received)
+    if max_chunks is not None:
+        missing = missing[missing < missing[0] + max_chunks]
+    breaks = np.flatnonzero(np.diff(missing) > merge_chunks + 1)
+    last = missing[breaks[0]] if len(breaks) else missing[-1]
+    return int(missing[0]), int(last) + 1
+
+
+def download_log(conn: pymavlink.mavutil.mavfile, log_id: int, path: Path,
+                 timeout=0.5, merge_chunks=16, max_request_chunks: int | None = None,
+                 max_retries=20, total_timeout=300.0) -> LogDownloadStats:
+    """
+    Download onboard log `log_id` to `path`.
+
+    ArduPilot only sends one range at a time and a new LOG_REQUEST_DATA replaces
+    the one in progress, so there is a single request outstanding. It starts as
+    the whole log and ends when its last chunk arrives or no LOG_DATA has come in
+    for `timeout` s. Received chunks are written straight to their offset in the
+    file and marked in a bitmap, and the next request covers only the first
+    missing gap, merged with the gaps after it that are within `merge_chunks`.
+    `max_request_chunks` caps the length of a request.
+
+    Raises LogDownloadTimeout if a chunk is still missing after `max_retries`
+    re-requests or the log isn't complete after `total_timeout` s, so a dropped
+    link can't hang the download.
+    """
+    stats = LogDownloadStats(log_id=log_id)
+    start = time.monotonic()
+    stats.size = get_log_size(conn, log_id)
+    num_chunks = -(-stats.size // CHUNK_SIZE)
+    received = np.zeros(num_chunks, dtype=bool)
+    requested = np.zeros(num_chunks, dtype=bool)
+    retries = np.zeros(num_chunks, dtype=np.int32)
+    last_progress = [start]
+
+    def send_request(first, end):
+        ofs = first * CHUNK_SIZE
+        count = min(end * CHUNK_SIZE, stats.size) - ofs
+        again = requested[first:end] & ~received[first:end]
+        retries[first:end][again] += 1
+        stats.rerequests += int(again.sum())
+        conn.mav.log_request_data_send(conn.target_system, conn.target_component, log_id, ofs, count)
+        requested[first:end] = True
+        last_progress[0] = time.monotonic()
+        stats.requests += 1
+
+    with open(path, 'wb') as log_file:
+        log_file.truncate(stats.size)
+
+        def on_message(conn, msg):
+            # Runs wherever the connection decodes messages, so chunks are kept even
+            # when the link is drained by a session's receive thread
+            if msg.get_type() != 'LOG_DATA' or msg.id != log_id or msg.count == 0:
+                return
+            chunk = msg.ofs // CHUNK_SIZE
+            last_progress[0] = time.monotonic()
+            if received[chunk]:
+                stats.duplicate_chunks += 1
+                return
+            log_file.seek(msg.ofs)
+            log_file.write(bytes(msg.data[:msg.count]))
+            received[chunk] = True
+            stats.chunks += 1
+
+        conn.message_hooks.append(on_message)
+        try:
+            current = None
+            while not received.all():
+                if time.monotonic() - start > total_timeout:
+                    raise LogDownloadTimeout(
+                        f'Log {log_id} incomplete after {total_timeout:.0f} s', stats)
+                if current is None:
+                    current = _next_range(received, merge_chunks, max_request_chunks)
+                    send_request(*current)
+                    if retries.max(initial=0) > max_retries:
+                        raise LogDownloadTimeout(
+                            f'Log {log_id} chunk {int(np.argmax(retries))} missing after '
+                            f'{max_retries} re-requests', stats)
+
+                conn.recv_match(type='LOG_DATA', blocking=True, timeout=timeout / 10)
+                # The range is streamed in order, so once its last chunk is in, anything
+                # else missing from it was dropped and won't come
+                if received[current[1] - 1] or time.monotonic() - last_progress[0] > timeout:
+                    current = None
+        finally:
+            conn.message_hooks.remove(on_message)
+            conn.mav.log_request_end_send(conn.target_system, conn.target_component)
+            stats.missing_chunks = int((~received).sum())
+            stats.elapsed = time.monotonic() - start
+    return stats
@@ -0,0 +1,259 @@
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import pymavlink.mavutil
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    import pymavlink.mavutil.mavlink # pyright: reportMissingModuleSource = false
+
+NO_INDEX = 65535
+
+
+def read_param_file(path: Path) -> dict[str, float]:
+    """
+    Read a Mission Planner style .param file of `NAME,value` lines.
+    """
+    values = {}
+    for line in Path(path).read_text().splitlines():
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        name, value = line.replace('\t', ',').replace(' ', ',').split(',')[:2]
+        values[name] = float(value)
+    return values
+
+
+def _matches(value: float, target: float) -> bool:
+    # Values travel as float32, so compare at float32 precision
+    return math.isclose(value, target, rel_tol=1e-6, abs_tol=1e-6)
+
+
+@dataclass
+class ParamCacheStats:
+    fetch_time: float = 0.0
+    fetched: int = 0
+    gap_requests: int = 0
+    list_requests: int = 0
+    unsolicited_updates: int = 0
+    hits: int = 0
+    hit_time: float = 0.0
+    misses: int = 0
+    miss_time: float = 0.0
+
+    def summary(self):
+        hit_us = self.hit_time / self.hits * 1e6 if self.hits else 0.0
+        miss_ms = self.miss_time / self.misses * 1e3 if self.misses else 0.0
+        return (f'{self.fetched} params fetched in {self.fetch_time:.2f} s '
+                f'({self.list_requests} list requests, {self.gap_requests} gap requests), '
+                f'{self.hits} cached reads at {hit_us:.1f} us, '
+                f'{self.misses} fetched reads at {miss_ms:.1f} ms, '
+                f'{self.unsolicited_updates} unsolicited updates')
+
+
+@dataclass
+class ParamWriteResult:
+    written: int = 0
+    sends: int = 0
+    retries: int = 0
+    wall_time: float = 0.0
+    failed: list[str] = field(default_factory=list)
+
+    def summary(self):
+        return (f'{self.written} params confirmed in {self.wall_time:.2f} s '
+                f'({self.sends} sets, {self.retries} retries, {len(self.failed)} failed)')
+
+
+class ParamCache:
+    """
+    Local copy of the autopilot's parameter table.
+
+    `fetch_all` pulls the whole table with PARAM_REQUEST_LIST and then re-requests
+    only the indices that were lost. Every PARAM_VALUE the connection receives
+    afterwards (set echoes, changes from another GCS) updates the cache through a
+    message hook, so `get` is a dictionary lookup once the table is loaded.
+    """
+
+    def __init__(self, conn: pymavlink.mavutil.mavfile):
+        self.conn = conn
+        self.values: dict[str, float] = {}
+        self.types: dict[str, int] = {}
+        self.names: dict[int, str] = {}
+        self.count: int | None = None
+        self.stats = ParamCacheStats()
+        self._fetching = False
+        self._writes: dict[str, float] = {}
+        self._confirmed: set[str] = set()
+        conn.message_hooks.append(self._on_message)
+
+    def _on_message(self, conn, msg):
+        if msg.get_type() != 'PARAM_VALUE':
+            return
+        name = msg.param_id
+        if name in self._writes:
+            if _matches(msg.param_value, self._writes[name]):
+                self._confirmed.add(name)
+        elif not self._fetching and name in self.values and self.values[name] != msg.param_value:
+            self.stats.unsolicited_updates += 1
+        self.values[name] = msg.param_value
+        self.types[name] = msg.param_type
+        if msg.param_index != NO_INDEX:
+            self.names[msg.param_index] = name
+            self.count = msg.param_count
+
+    def missing(self) -> list[int]:
+        if self.count is None:
+            return []
+        return [i for i in range(self.count) if i not in self.names]
+
+    @property
+    def complete(self) -> bool:
+        return self.count is not None and len(self.names) >= self.count
+
+    def _request_list(self):
+        self.stats.list_requests += 1
+        self.conn.mav.param_request_list_send(self.conn.target_system, self.conn.target_component)
+
+    def fetch_all(self, timeout=60.0, gap_timeout=0.5, window=8, relist_missing=64):
+        """
+        Load the full parameter table, returning straight away if it is already
+        loaded. Once the list has been quiet for `gap_timeout` s, missing indices are
+        re-read with up to `window` PARAM_REQUEST_READs in flight, resending reads
+        not answered within `gap_timeout` s. If more than `relist_missing` indices
+        are missing the whole list is requested again instead. Raises TimeoutError
+        if the table is still incomplete after `timeout` s.
+        """
+        if self.complete:
+            return
+        start = time.monotonic()
+        self._fetching = True
+        try:
+            self._request_list()
+            listing = True
+            in_flight: dict[int, float] = {} # index -> time its read was sent
+            while not self.complete:
+                if time.monotonic() - start > timeout:
+                    raise TimeoutError(f'Parameter fetch incomplete, {len(self.missing()) or "all"} params missing')
+                if listing:
+                    if self.conn.recv_match(type='PARAM_VALUE', blocking=True, timeout=gap_timeout) is not None:
+                        continue
+                    if self.count is None or len(self.missing()) > relist_missing:
+                        # No reply at all yet, or so much lost that reading index by
+                        # index would be slower than listing again
+                        self._request_list()
+                        continue
+                    listing = False
+                now = time.monotonic()
+                in_flight = {index: sent for index, sent in in_flight.items()
+                             if index not in self.names and now - sent < gap_timeout}
+                for index in self.missing():
+                    if len(in_flight) >= window:
+                        break
+                    if index not in in_flight:
+                        self.stats.gap_requests += 1
+                        self.conn.mav.param_request_read_send(
+                            self.conn.target_system, self.conn.target_component, b'', index)
+                        in_flight[index] = now
+                self.conn.recv_match(type='PARAM_VALUE', blocking=True, timeout=gap_timeout / 10)
+        finally:
+            self._fetching = False
+        self.stats.fetch_time = time.monotonic() - start
+        self.stats.fetched = len(self.names)
+
+    def get(self, name: str, timeout=1.0, retries=3) -> float:
+        """
+        Read a parameter from the cache, falling back to a single request (retried
+        up to `retries` times) for parameters the cache doesn't have.
+        """
+        start = time.perf_counter()
+        if name in self.values:
+            value = self.values[name]
+            self.stats.hits += 1
+            self.stats.hit_time += time.perf_counter() - start
+            return value
+
+        for _ in range(retries):
+            self.conn.param_fetch_one(name)
+            deadline = time.monotonic() + timeout
+            while name not in self.values:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.conn.recv_match(type='PARAM_VALUE', blocking=True, timeout=remaining)
+            if name in self.values:
+                self.stats.misses += 1
+                self.stats.miss_time += time.perf_counter() - start
+                return self.values[name]
+        raise TimeoutError(f'No reply for parameter {name}')
+
+    def set_many(self, values: dict[str, float], default_type=pymavlink.mavutil.mavlink.MAV_PARAM_TYPE_REAL32,
+                 window=8, timeout=0.5, retries=5) -> ParamWriteResult:
+        """
+        Set many parameters, keeping up to `window` PARAM_SETs in flight. Each set is
+        confirmed by the autopilot's PARAM_VALUE echo; sets that aren't confirmed
+        within `timeout` s are resent up to `retries` times and otherwise reported
+        in the result's `failed` list.
+        """
+        result = ParamWriteResult()
+        start = time.monotonic()
+        queue = deque(values)
+        in_flight: dict[str, float] = {}
+        attempts = dict.fromkeys(values, 0)
+        self._writes = dict(values)
+        self._confirmed = set()
+        try:
+            while queue or in_flight:
+                while queue and len(in_flight) < window:
+                    name = queue.popleft()
+                    if name in self._confirmed:
+                        # A late echo confirmed it while it waited to be resent
+                        result.written += 1
+                        continue
+                    self.conn.mav.param_set_send(
+                        self.conn.target_system, self.conn.target_component, name.encode(),
+                        values[name], self.types.get(name, default_type))
+                    in_flight[name] = time.monotonic()
+                    attempts[name] += 1
+                    result.sends += 1
+
+                self.conn.recv_match(type='PARAM_VALUE', blocking=True, timeout=timeout / 10)
+                now = time.monotonic()
+                for name, sent in list(in_flight.items()):
+                    if name in self._confirmed:
+                        del in_flight[name]
+                        result.written += 1
+                    elif now - sent > timeout:
+                        del in_flight[name]
+                        if attempts[name] <= retries:
+                            queue.append(name)
+                            result.retries += 1
+                        else:
+                            result.failed.append(name)
+        finally:
+            self._writes = {}
+        result.wall_time = time.monotonic() - start
+        return result
+
+    def diff_param_file(self, path: Path) -> dict[str, tuple[float | None, float]]:
+        """
+        Parameters whose value in the .param file differs from the cached table, as
+        {name: (current, new)}. Fetch the table first.
+        """
+        return {
+            name: (self.values.get(name), value)
+            for name, value in read_param_file(path).items()
+            if name not in self.values or not _matches(self.values[name], value)
+        }
+
+    def apply_param_file(self, path: Path, **kwargs) -> ParamWriteResult:
+        """
+        Write only the parameters that differ from the .param file, fetching the
+        table first if needed. Keyword arguments go to `set_many`.
+        """
+        if not self.complete:
+            self.fetch_all()
+        diff = self.diff_param_file(path)
+        return self.set_many({name: new for name, (_, new) in diff.items()}, **kwargs)
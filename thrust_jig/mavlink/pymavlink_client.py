@@ -1,53 +1,85 @@
 import pymavlink.mavutil
-import time
 from datetime import datetime
 import csv
 from pathlib import Path
 
+from log_download import LogDownloadTimeout, download_log
+from params import ParamCache
+from scheduler import ScheduleTiming, run_schedule, sweep_setpoint
+from session import MavlinkSession
+from telemetry import TelemetryRecorder
+
 from typing import TYPE_CHECKING, Literal
 if TYPE_CHECKING:
     import pymavlink.mavutil.mavlink # pyright: reportMissingModuleSource = false
 
-# drone = mavutil.mavlink_connection('COM6', baud=57600, source_system=245)
-drone = pymavlink.mavutil.mavlink_connection('udpin:0.0.0.0:14551', source_system=245)
+# DEVICE, DEVICE_KWARGS = 'COM6', {'baud': 57600}
+DEVICE, DEVICE_KWARGS = 'udpin:0.0.0.0:14551', {}
+HEARTBEAT_TIMEOUT = 3.0
+COMMAND_TIMEOUT = 5.0
+
+# Set by connect() and run_manual_test(), nothing is opened at import
+drone: MavlinkSession = None
+params: ParamCache = None
+csv_writer = None
+file_time: datetime = None
 
 log_dir = Path('test_logs')
 local_tz = datetime.now().astimezone().tzinfo
-file_time = datetime.now(tz=local_tz)
-log_file = open(log_dir / f'{file_time:%Y-%m-%dT%H_%M_%S%z}.csv', 'w', newline='')
-csv_writer = csv.writer(log_file)
+
+def connect(device=DEVICE, **kwargs):
+    global drone, params
+    drone = MavlinkSession(device, source_system=245, **(kwargs or DEVICE_KWARGS)).start()
+    params = ParamCache(drone)
+    # Wait for drone to connect
+    drone.wait_heartbeat()
+    print('Connected')
+    return drone
+
+def set_params(values):
+    result = params.set_many(values, default_type=pymavlink.mavutil.mavlink.MAVLINK_TYPE_INT16_T)
+    print(result.summary())
+    if result.failed:
+        raise Exception(f'Autopilot did not confirm {", ".join(result.failed)}')
 
 def enable_motor_passthrough(ccw_enabled=True, cw_enabled=True):
-    drone.param_set_send('SYSID_MYGCS', 245, pymavlink.mavutil.mavlink.MAVLINK_TYPE_INT16_T) # set this script as ground control
-    drone.param_set_send('SERVO1_FUNCTION', 51, pymavlink.mavutil.mavlink.MAVLINK_TYPE_INT16_T) # roll -> RCIN1
-    drone.param_set_send('SERVO2_FUNCTION', 52, pymavlink.mavutil.mavlink.MAVLINK_TYPE_INT16_T) # pitch -> RCIN2
-    drone.param_set_send('SERVO5_FUNCTION', 53 if ccw_enabled else 0, pymavlink.mavutil.mavlink.MAVLINK_TYPE_INT16_T) # throttle -> RCIN3
-    drone.param_set_send('SERVO6_FUNCTION', 53 if cw_enabled else 0, pymavlink.mavutil.mavlink.MAVLINK_TYPE_INT16_T) # throttle -> RCIN3
+    set_params({
+        'SYSID_MYGCS': 245, # set this script as ground control
+        'SERVO1_FUNCTION': 51, # roll -> RCIN1
+        'SERVO2_FUNCTION': 52, # pitch -> RCIN2
+        'SERVO5_FUNCTION': 53 if ccw_enabled else 0, # throttle -> RCIN3
+        'SERVO6_FUNCTION': 53 if cw_enabled else 0, # throttle -> RCIN3
+    })
 
 def disable_motor_passthrough():
-    drone.param_set_send('SYSID_MYGCS', 255, pymavlink.mavutil.mavlink.MAVLINK_TYPE_INT16_T) # set default ground control ID
-    drone.param_set_send('SERVO1_FUNCTION', 33, pymavlink.mavutil.mavlink.MAVLINK_TYPE_INT16_T) # roll -> Motor 1
-    drone.param_set_send('SERVO2_FUNCTION', 34, pymavlink.mavutil.mavlink.MAVLINK_TYPE_INT16_T) # pitch -> Motor 2
-    drone.param_set_send('SERVO5_FUNCTION', 37, pymavlink.mavutil.mavlink.MAVLINK_TYPE_INT16_T) # ccw prop -> Motor 5
-    drone.param_set_send('SERVO6_FUNCTION', 38, pymavlink.mavutil.mavlink.MAVLINK_TYPE_INT16_T) # cw prop -> Motor 6
+    set_params({
+        'SYSID_MYGCS': 255, # set default ground control ID
+        'SERVO1_FUNCTION': 33, # roll -> Motor 1
+        'SERVO2_FUNCTION': 34, # pitch -> Motor 2
+        'SERVO5_FUNCTION': 37, # ccw prop -> Motor 5
+        'SERVO6_FUNCTION': 38, # cw prop -> Motor 6
+    })
+
+def apply_param_file(path=Path(__file__).parents[2] / 'ardupilot_parameters.param'):
+    # Diffing against a partial table would rewrite every parameter it's missing
+    if not params.complete:
+        params.fetch_all()
+    diff = params.diff_param_file(path)
+    for name, (current, new) in diff.items():
+        print(f'{name}: {current} -> {new}')
+    set_params({name: new for name, (_, new) in diff.items()})
 
 def set_mode(mode: str):
     mode_map = drone.mode_mapping()
     if mode_map is None or mode not in mode_map:
         raise Exception(f'Drone does not support {mode} mode')
 
+    # Wait for the ACK of this command only, failing on a NACK or no reply
+    ack = drone.expect('COMMAND_ACK', f'COMMAND_ACK.command=={pymavlink.mavutil.mavlink.MAV_CMD_DO_SET_MODE}')
     drone.set_mode_apm(mode_map[mode])
-    while True:
-        # Wait for ACK command
-        # Would be good to add mechanism to avoid endlessly blocking
-        # if the autopilot sends a NACK or never receives the message
-        ack_msg = drone.recv_match(type='COMMAND_ACK', blocking=True)
-        ack_msg = ack_msg.to_dict()
-
-        # Continue waiting if the acknowledged command is not `set_mode`
-        if ack_msg['command'] != pymavlink.mavutil.mavlink.MAV_CMD_DO_SET_MODE:
-            continue
-        break
+    ack_msg = drone.wait('COMMAND_ACK', timeout=COMMAND_TIMEOUT, future=ack)
+    if ack_msg.result != pymavlink.mavutil.mavlink.MAV_RESULT_ACCEPTED:
+        raise Exception(f'Drone rejected {mode} mode (result {ack_msg.result})')
 
 def force_disarm():
     drone.mav.command_long_send(
@@ -64,6 +96,7 @@ def force_disarm():
         0) # param7
 
 def get_last_log():
+    log_entry = drone.expect('LOG_ENTRY')
     drone.mav.log_request_list_send(
         drone.target_system,
         drone.target_component,
@@ -71,7 +104,7 @@ def get_last_log():
         end=0xffff
     )
     print('Getting last log')
-    log_entry_msg = drone.recv_match(type='LOG_ENTRY', blocking=True).to_dict()
+    log_entry_msg = drone.wait('LOG_ENTRY', timeout=COMMAND_TIMEOUT, future=log_entry).to_dict()
     print('Got last log')
     drone.mav.log_request_end_send(
         drone.target_system,
@@ -80,11 +113,18 @@ def get_last_log():
     return log_entry_msg['last_log_num']
 
 def get_param(param):
-    drone.param_fetch_one(param)
-    drone.recv_match(type='PARAM_VALUE', blocking=True)
-    return drone.param(param)
+    return params.get(param)
 
 
+def write_timing(timing: ScheduleTiming):
+    for value, wall_time in zip(timing.values, timing.wall_times):
+        csv_writer.writerow([value, datetime.fromtimestamp(wall_time, tz=local_tz).strftime('%Y-%m-%dT%H:%M:%S.%f%z')])
+    csv_writer.writerow(['Command rate', timing.frequency, timing.achieved_rate, timing.missed])
+    csv_writer.writerow(['Lateness p50/p99/max ms', timing.lateness_ms(50), timing.lateness_ms(99), timing.lateness_ms(100)])
+    counts, edges = timing.histogram()
+    csv_writer.writerow(['Lateness histogram edges ms', *edges])
+    csv_writer.writerow(['Lateness histogram counts', *counts])
+
 def sweep_channel(channel: Literal['x', 'y', 'z', 'r'],
                   start_val: int, end_val: int,
                   x: int | None = None, y: int | None = None,
@@ -92,28 +132,37 @@ def sweep_channel(channel: Literal['x', 'y', 'z', 'r'],
                   test_length=50,
                   steps=10,
                   stop_fraction=1,
-                  frequency=20):
+                  frequency=20,
+                  ramp=False):
     """
-    Sweep the specified channel in `steps` steps from `start_val` to `end_val`,
-    stopping when the test exceeds `stop_fraction` completion. Inputs are repeated at
-    `frequency` Hz and the total length of the test when `stop_fraction` is 1 is `test_length` s
+    Sweep the specified channel in `steps` steps (or a smooth ramp if `ramp`) from `start_val`
+    to `end_val`, stopping when the test exceeds `stop_fraction` completion. Inputs are sent
+    on fixed deadlines at `frequency` Hz (up to ~200 Hz) and the total length of the test when
+    `stop_fraction` is 1 is `test_length` s. Every command's value and send time are written
+    to the test log, followed by the achieved rate and lateness stats.
 
     You must specify the values of the channels not being swept on a [-1000, 1000] scale
     """
-    for i in range(steps + 1):
-        input_fraction = i / steps
-        if input_fraction > stop_fraction:
-            break
-        print(f'{channel} channel input: {input_fraction}')
-        input_scaled = int(input_fraction * (end_val - start_val) + start_val)
-        csv_writer.writerow([input_scaled, datetime.now(tz=local_tz).strftime('%Y-%m-%dT%H:%M:%S.%f%z')])
-        for _ in range(frequency * test_length // steps):
-            drone.mav.manual_control_send(
-                target=drone.target_system,
-                **{'x': x, 'y': y, 'z': z, 'r': r, channel: input_scaled},
-                buttons=0
-            )
-            time.sleep(1/frequency)
+    last_value = None
+
+    def send(value):
+        nonlocal last_value
+        if drone.heartbeat_age > HEARTBEAT_TIMEOUT:
+            raise Exception(f'No heartbeat for {drone.heartbeat_age:.1f} s, stopping sweep')
+        if value != last_value and not ramp:
+            print(f'{channel} channel input: {value}')
+        last_value = value
+        drone.mav.manual_control_send(
+            target=drone.target_system,
+            **{'x': x, 'y': y, 'z': z, 'r': r, channel: value},
+            buttons=0
+        )
+
+    timing = run_schedule(frequency,
+                          sweep_setpoint(start_val, end_val, test_length, steps, stop_fraction, ramp),
+                          send)
+    print(timing.summary())
+    write_timing(timing)
 
 def vane_pwm_to_input(pwm: float):
     return int((pwm - 1500) * 2)
@@ -149,10 +198,38 @@ def sweep_vane(channel: Literal['x', 'y'], direction: Literal[-1, 1], end_val=No
 
     sweep_channel(channel, **params, **kwargs)
 
-def run_manual_test(test_fcn, ccw_enabled=True, cw_enabled=True):
-    with log_file:
+def fetch_test_log(prev_log_id):
+    # The autopilot starts a new log on arming, so the test's log is the one after `prev_log_id`
+    log_id = get_last_log()
+    if log_id == prev_log_id:
+        print('No new onboard log for this test')
+        return
+    log_path = log_dir / f'{file_time:%Y-%m-%dT%H_%M_%S%z}_log{log_id}.bin'
+    print(f'Downloading log {log_id} to {log_path}')
+    try:
+        stats = download_log(drone, log_id, log_path)
+    except LogDownloadTimeout as e:
+        # Keep the partial log, it can be fetched again from the autopilot later
+        print(f'{e}: {e.stats.summary()}')
+        csv_writer.writerow(['Test log incomplete', log_id, log_path.name, e.stats.missing_chunks])
+        return
+    print(stats.summary())
+    csv_writer.writerow(['Test log', log_id, log_path.name])
+
+def run_manual_test(test_fcn, ccw_enabled=True, cw_enabled=True, fetch_log=True, record_telemetry=True):
+    global csv_writer, file_time
+    file_time = datetime.now(tz=local_tz)
+    log_dir.mkdir(exist_ok=True)
+    with open(log_dir / f'{file_time:%Y-%m-%dT%H_%M_%S%z}.csv', 'w', newline='') as log_file:
+        csv_writer = csv.writer(log_file)
         csv_writer.writerow(['Start', datetime.now(tz=local_tz).strftime('%Y-%m-%dT%H:%M:%S.%f%z')])
+        log_id = None
+        recorder = None
         try:
+            if not params.complete:
+                print('Fetching parameters')
+                params.fetch_all()
+                print(params.stats.summary())
             # Enable manual motor control
             print('Enabling manual motor control')
             enable_motor_passthrough(ccw_enabled=ccw_enabled, cw_enabled=cw_enabled)
@@ -162,6 +239,10 @@ def run_manual_test(test_fcn, ccw_enabled=True, cw_enabled=True):
             print('Acro mode set')
             log_id = get_last_log()
             csv_writer.writerow(['Last log', log_id])
+            if record_telemetry:
+                telemetry_path = log_dir / f'{file_time:%Y-%m-%dT%H_%M_%S%z}_telemetry.bin'
+                recorder = TelemetryRecorder(drone, telemetry_path).start()
+                csv_writer.writerow(['Telemetry', telemetry_path.name])
 
             # Run test
             drone.arducopter_arm()
@@ -169,17 +250,31 @@ def run_manual_test(test_fcn, ccw_enabled=True, cw_enabled=True):
             drone.motors_armed_wait()
             print('Motors armed')
             csv_writer.writerow(['Armed', datetime.now(tz=local_tz).strftime('%Y-%m-%dT%H:%M:%S.%f%z')])
-            sys_time_arm = drone.recv_match(type='SYSTEM_TIME', blocking=True).to_dict()
+            sys_time_arm = drone.wait('SYSTEM_TIME', timeout=COMMAND_TIMEOUT).to_dict()
             csv_writer.writerow(['Arm system time', sys_time_arm['time_boot_ms']])
             test_fcn()
         finally:
-            force_disarm()
-            print('Disarming')
-            disable_motor_passthrough()
-            print('Disabled manual motor control')
-            drone.motors_disarmed_wait()
-            print('Disarmed')
-            csv_writer.writerow(['Disarmed', datetime.now(tz=local_tz).strftime('%Y-%m-%dT%H:%M:%S.%f%z')])
+            try:
+                force_disarm()
+                print('Disarming')
+                try:
+                    disable_motor_passthrough()
+                    print('Disabled manual motor control')
+                except Exception as e:
+                    # Still disarm and save what was recorded, the outputs can be restored by hand
+                    print(f'Failed to disable manual motor control: {e}')
+                    csv_writer.writerow(['Passthrough restore failed', str(e)])
+                drone.motors_disarmed_wait()
+                print('Disarmed')
+                print(params.stats.summary())
+                csv_writer.writerow(['Disarmed', datetime.now(tz=local_tz).strftime('%Y-%m-%dT%H:%M:%S.%f%z')])
+            finally:
+                # Records through the disarm, but always stops so its file is flushed
+                if recorder is not None:
+                    print(recorder.stop().summary())
+            if fetch_log and log_id is not None:
+                fetch_test_log(log_id)
+            print(drone.stats.summary())
 
 def run_dual_prop_throttle_sweep():
     run_manual_test(sweep_throttle)
@@ -193,8 +288,7 @@ def run_bottom_prop_throttle_sweep():
 def run_roll_vane_sweep():
     run_manual_test(lambda: sweep_vane('y', direction=-1))
 
-# Wait for drone to connect
-drone.wait_heartbeat()
-print('Connected')
-
-run_roll_vane_sweep()
+if __name__ == '__main__':
+    connect()
+    run_roll_vane_sweep()
+    drone.close()
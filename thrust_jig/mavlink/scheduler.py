@@ -0,0 +1,97 @@
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+import numpy as np
+
+LATENESS_BINS_MS = (0, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, np.inf)
+
+
+@dataclass
+class ScheduleTiming:
+    frequency: float
+    deadlines: np.ndarray # s after start
+    sent: np.ndarray # s after start, monotonic
+    wall_times: np.ndarray # time.time() at each send
+    values: np.ndarray
+    missed: int
+
+    @property
+    def lateness(self) -> np.ndarray:
+        return self.sent - self.deadlines
+
+    @property
+    def achieved_rate(self) -> float:
+        if len(self.sent) < 2:
+            return 0.0
+        return (len(self.sent) - 1) / (self.sent[-1] - self.sent[0])
+
+    def lateness_ms(self, percentile: float) -> float:
+        return float(np.percentile(self.lateness, percentile) * 1e3) if len(self.sent) else 0.0
+
+    def histogram(self) -> tuple[np.ndarray, np.ndarray]:
+        counts, edges = np.histogram(self.lateness * 1e3, bins=LATENESS_BINS_MS)
+        return counts, edges
+
+    def summary(self):
+        return (f'{len(self.sent)} commands at {self.achieved_rate:.2f} Hz '
+                f'(requested {self.frequency:.2f} Hz, {self.missed} missed), '
+                f'lateness p50 {self.lateness_ms(50):.3f} ms, p99 {self.lateness_ms(99):.3f} ms, '
+                f'max {self.lateness_ms(100):.3f} ms')
+
+
+def run_schedule(frequency: float, setpoint: Callable[[float], int | None],
+                 send: Callable[[int], None], spin=0.001) -> ScheduleTiming:
+    """
+    Send `setpoint(t)` at `frequency` Hz until it returns None.
+
+    Commands go out on absolute deadlines `k / frequency` after the start, so the
+    time spent sending (or in GC, printing, ...) delays at most one command rather
+    than accumulating as drift. The loop sleeps until `spin` s before each deadline
+    and busy-waits the rest. A deadline that is already a whole period late is
+    skipped and counted as missed instead of bursting commands to catch up.
+    """
+    period = 1 / frequency
+    deadlines, sent, wall_times, values = [], [], [], []
+    missed = 0
+    start = time.monotonic()
+    k = 0
+    while True:
+        deadline = k * period
+        k += 1
+        value = setpoint(deadline)
+        if value is None:
+            break
+        remaining = deadline - (time.monotonic() - start)
+        if remaining < -period:
+            missed += 1
+            continue
+        if remaining > spin:
+            time.sleep(remaining - spin)
+        while time.monotonic() - start < deadline:
+            pass
+        sent.append(time.monotonic() - start)
+        wall_times.append(time.time())
+        send(value)
+        deadlines.append(deadline)
+        values.append(value)
+    return ScheduleTiming(frequency, np.array(deadlines), np.array(sent), np.array(wall_times),
+                          np.array(values), missed)
+
+
+def sweep_setpoint(start_val: int, end_val: int, test_length: float, steps: int,
+                   stop_fraction=1.0, ramp=False) -> Callable[[float], int | None]:
+    """
+    Setpoint for a sweep from `start_val` to `end_val`, either as `steps` + 1 steps
+    of `test_length / steps` s each or as a smooth ramp over `test_length` s, ending
+    once the sweep passes `stop_fraction`.
+    """
+    step_length = test_length / steps
+
+    def setpoint(t):
+        fraction = t / test_length if ramp else (t // step_length) / steps
+        if fraction > min(stop_fraction, 1):
+            return None
+        return int(fraction * (end_val - start_val) + start_val)
+
+    return setpoint
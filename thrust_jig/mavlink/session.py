@@ -0,0 +1,231 @@
+import os
+import socket
+import threading
+import time
+import traceback
+from collections import defaultdict, deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable
+
+import numpy as np
+import pymavlink.mavutil
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    import pymavlink.mavutil.mavlink # pyright: reportMissingModuleSource = false
+
+RECEIVE_BUFFER = 4 << 20 # bytes, holds bursts like a full parameter list
+RECENT_MESSAGES = 16 # per type, kept for non-blocking recv_match
+
+
+@dataclass
+class SessionStats:
+    start: float = field(default_factory=time.monotonic)
+    counts: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    dispatch_latency: deque = field(default_factory=lambda: deque(maxlen=10000))
+    callback_errors: int = 0
+
+    def rates(self) -> dict[str, float]:
+        elapsed = time.monotonic() - self.start
+        return {msg_type: count / elapsed for msg_type, count in self.counts.items()} if elapsed > 0 else {}
+
+    def latency_ms(self, percentile: float) -> float:
+        if not self.dispatch_latency:
+            return 0.0
+        return float(np.percentile(self.dispatch_latency, percentile) * 1e3)
+
+    def summary(self):
+        rates = ', '.join(f'{msg_type} {rate:.1f}' for msg_type, rate in
+                          sorted(self.rates().items(), key=lambda item: -item[1]))
+        return (f'{sum(self.counts.values())} messages ({rates} Hz), '
+                f'dispatch latency p50 {self.latency_ms(50):.3f} ms, p99 {self.latency_ms(99):.3f} ms, '
+                f'{self.callback_errors} callback errors')
+
+
+def _type_set(msg_type: str | list[str] | None) -> set[str] | None:
+    return {msg_type} if isinstance(msg_type, str) else set(msg_type) if msg_type else None
+
+
+class MavlinkSession:
+    """
+    MAVLink connection drained continuously by a receive thread.
+
+    Every message is dispatched to the callbacks subscribed to its type (or '*')
+    and to any futures waiting for it, so command/ACK waits, telemetry recording
+    and the sweep can all run at once without one blocking `recv_match` starving
+    the others. Attributes not defined here (`mav`, `target_system`,
+    `mode_mapping`, ...) come from the underlying pymavlink connection, and
+    `recv_match` keeps pymavlink's signature so code written against a plain
+    connection works on a session. A non-blocking `recv_match` takes the oldest
+    matching message from the last `RECENT_MESSAGES` of each type.
+    """
+
+    def __init__(self, device: str, source_system=245, dialect='ardupilotmega', **kwargs):
+        # MAVLink 2 is needed for messages with ids above 255 such as ESC_TELEMETRY_1_TO_4
+        os.environ['MAVLINK20'] = '1'
+        self.conn = pymavlink.mavutil.mavlink_connection(
+            device, source_system=source_system, dialect=dialect, **kwargs)
+        if isinstance(getattr(self.conn, 'port', None), socket.socket):
+            # The default UDP buffer overflows (and drops messages) under bursts
+            # while the receive thread is waiting for the GIL
+            self.conn.port.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+        self.stats = SessionStats()
+        self.last_heartbeat: float | None = None
+        self._subscribers: dict[str, list[Callable]] = defaultdict(list)
+        self._waiters: list[tuple[set[str] | None, str | None, Future]] = []
+        self._recent: dict[str, deque] = defaultdict(lambda: deque(maxlen=RECENT_MESSAGES))
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __getattr__(self, name):
+        if name == 'conn':
+            raise AttributeError(name)
+        return getattr(self.conn, name)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.conn.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                msg = self.conn.recv_match(blocking=True, timeout=0.05)
+            except OSError:
+                if self._stop.is_set():
+                    return
+                raise
+            if msg is not None and msg.get_type() != 'BAD_DATA':
+                self._dispatch(msg)
+
+    def _dispatch(self, msg):
+        start = time.perf_counter()
+        msg_type = msg.get_type()
+        self.stats.counts[msg_type] += 1
+        if msg_type == 'HEARTBEAT':
+            self.last_heartbeat = time.monotonic()
+        with self._lock:
+            self._recent[msg_type].append(msg)
+            callbacks = self._subscribers.get(msg_type, []) + self._subscribers.get('*', [])
+            matched = [(types, condition, future) for types, condition, future in self._waiters
+                       if (types is None or msg_type in types)
+                       and pymavlink.mavutil.evaluate_condition(condition, {msg_type: msg})]
+            for waiter in matched:
+                self._waiters.remove(waiter)
+        for callback in callbacks:
+            try:
+                callback(msg)
+            except Exception:
+                self.stats.callback_errors += 1
+                traceback.print_exc()
+        for _, _, future in matched:
+            if not future.done():
+                future.set_result(msg)
+        self.stats.dispatch_latency.append(time.perf_counter() - start)
+
+    @property
+    def heartbeat_age(self) -> float:
+        if self.last_heartbeat is None:
+            return float('inf')
+        return time.monotonic() - self.last_heartbeat
+
+    def subscribe(self, msg_type: str, callback: Callable) -> Callable[[], None]:
+        """
+        Call `callback(msg)` from the receive thread for every `msg_type` message
+        ('*' for all). Returns a function that unsubscribes.
+        """
+        with self._lock:
+            self._subscribers[msg_type] = self._subscribers[msg_type] + [callback]
+
+        def unsubscribe():
+            with self._lock:
+                self._subscribers[msg_type] = [c for c in self._subscribers[msg_type] if c is not callback]
+        return unsubscribe
+
+    def expect(self, msg_type: str | list[str] | None, condition: str | None = None) -> Future:
+        """
+        Future for the next matching message. Create it before sending the request
+        so a fast reply can't be missed.
+        """
+        types = _type_set(msg_type)
+        future = Future()
+        with self._lock:
+            self._waiters.append((types, condition, future))
+        return future
+
+    def _forget(self, future: Future):
+        with self._lock:
+            self._waiters = [waiter for waiter in self._waiters if waiter[2] is not future]
+
+    def wait(self, msg_type: str | list[str] | None, condition: str | None = None, timeout=5.0,
+             future: Future | None = None):
+        """
+        Wait for the next matching message (or for `future` from `expect`), raising
+        TimeoutError after `timeout` s.
+        """
+        future = future or self.expect(msg_type, condition)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            raise TimeoutError(f'No {msg_type} within {timeout} s') from None
+        finally:
+            self._forget(future)
+
+    def _take_recent(self, msg_type: str | list[str] | None, condition: str | None):
+        types = _type_set(msg_type)
+        with self._lock:
+            queues = [self._recent[t] for t in types if t in self._recent] if types else list(self._recent.values())
+            matched = [(queue, msg) for queue in queues for msg in queue
+                       if pymavlink.mavutil.evaluate_condition(condition, {msg.get_type(): msg})]
+            if not matched:
+                return None
+            queue, msg = min(matched, key=lambda item: item[1]._timestamp)
+            queue.remove(msg)
+            return msg
+
+    def recv_match(self, condition=None, type=None, blocking=False, timeout=None):
+        if not blocking:
+            return self._take_recent(type, condition)
+        future = self.expect(type, condition)
+        try:
+            msg = future.result(timeout=timeout)
+        except TimeoutError:
+            return None
+        finally:
+            self._forget(future)
+        # Taken, so a later non-blocking call doesn't return it again
+        with self._lock:
+            queue = self._recent.get(msg.get_type(), ())
+            if msg in queue:
+                queue.remove(msg)
+        return msg
+
+    def wait_heartbeat(self, blocking=True, timeout=None):
+        return self.recv_match(type='HEARTBEAT', blocking=blocking, timeout=timeout)
+
+    def _wait_armed(self, armed: bool, timeout: float):
+        deadline = time.monotonic() + timeout
+        while bool(self.conn.motors_armed()) != armed:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f'Vehicle not {"armed" if armed else "disarmed"} within {timeout} s')
+            self.wait('HEARTBEAT', timeout=remaining)
+
+    def motors_armed_wait(self, timeout=10.0):
+        self._wait_armed(True, timeout)
+
+    def motors_disarmed_wait(self, timeout=10.0):
+        self._wait_armed(False, timeout)
@@ -0,0 +1,210 @@
+import json
+import queue
+import struct
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pymavlink.mavutil
+
+from session import MavlinkSession
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    import pymavlink.mavutil.mavlink # pyright: reportMissingModuleSource = false
+
+# Requested rates in Hz
+DEFAULT_RATES = {
+    'SERVO_OUTPUT_RAW': 100,
+    'ATTITUDE': 100,
+    'ESC_TELEMETRY_1_TO_4': 50,
+    'BATTERY_STATUS': 10,
+    'SYSTEM_TIME': 4,
+}
+FIELD_TYPES = {
+    'uint8_t': 'u1', 'int8_t': 'i1', 'uint16_t': '<u2', 'int16_t': '<i2',
+    'uint32_t': '<u4', 'int32_t': '<i4', 'uint64_t': '<u8', 'int64_t': '<i8',
+    'float': '<f4', 'double': '<f8',
+}
+BLOCK_ROWS = 256
+BLOCK_HEADER = struct.Struct('<I') # length of the JSON block description that follows
+
+
+def message_dtype(msg_type: str) -> np.dtype:
+    """
+    Record layout for a message: host receive time, autopilot time in s (NaN for
+    messages without a timestamp) and every numeric field at its wire width.
+    """
+    msg_class = getattr(pymavlink.mavutil.mavlink, f'MAVLink_{msg_type.lower()}_message')
+    fields = [('host_time', '<f8'), ('autopilot_time', '<f8')]
+    array_lengths = dict(zip(msg_class.ordered_fieldnames, msg_class.array_lengths))
+    for name, field_type in zip(msg_class.fieldnames, msg_class.fieldtypes):
+        length = array_lengths[name]
+        if field_type in FIELD_TYPES:
+            fields.append((name, FIELD_TYPES[field_type], (length,)) if length else (name, FIELD_TYPES[field_type]))
+    return np.dtype(fields)
+
+
+def autopilot_time(msg) -> float:
+    if hasattr(msg, 'time_usec'):
+        return msg.time_usec * 1e-6
+    if hasattr(msg, 'time_boot_ms'):
+        return msg.time_boot_ms * 1e-3
+    return np.nan
+
+
+@dataclass
+class TelemetryStats:
+    requested: dict[str, float] = field(default_factory=dict)
+    counts: dict[str, int] = field(default_factory=dict)
+    first: dict[str, float] = field(default_factory=dict)
+    last: dict[str, float] = field(default_factory=dict)
+    blocks: int = 0
+    bytes_written: int = 0
+    rejected: list[str] = field(default_factory=list)
+
+    def achieved_rate(self, msg_type: str) -> float:
+        count = self.counts.get(msg_type, 0)
+        if count < 2:
+            return 0.0
+        return (count - 1) / (self.last[msg_type] - self.first[msg_type])
+
+    def summary(self):
+        rates = ', '.join(f'{msg_type} {self.achieved_rate(msg_type):.1f}/{rate:g} Hz'
+                          for msg_type, rate in self.requested.items())
+        return (f'{sum(self.counts.values())} messages ({rates} achieved/requested), '
+                f'{self.bytes_written / 1024:.1f} KiB in {self.blocks} blocks'
+                + (f', interval rejected for {", ".join(self.rejected)}' if self.rejected else ''))
+
+
+class TelemetryRecorder:
+    """
+    Records selected messages at elevated rates to a columnar binary file.
+
+    The rates are requested with MAV_CMD_SET_MESSAGE_INTERVAL. Messages are
+    copied into fixed size per-type blocks by a session subscriber on the receive
+    thread, and full blocks are written by a separate writer thread, so neither
+    the link nor the command loop waits on the disk. Each block in the file is a
+    length-prefixed JSON description followed by its columns; read it back with
+    `read_telemetry`. Intervals go back to the autopilot defaults on `stop`.
+    """
+
+    def __init__(self, session: MavlinkSession, path: Path, rates: dict[str, float] = DEFAULT_RATES):
+        self.session = session
+        self.path = Path(path)
+        self.rates = dict(rates)
+        self.stats = TelemetryStats(requested=dict(rates))
+        self._dtypes = {msg_type: message_dtype(msg_type) for msg_type in rates}
+        self._blocks: dict[str, np.ndarray] = {}
+        self._rows: dict[str, int] = {}
+        self._unsubscribe = []
+        self._queue: queue.Queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_blocks, daemon=True)
+
+    def set_interval(self, msg_type: str, rate: float, timeout=2.0) -> bool:
+        msg_id = getattr(pymavlink.mavutil.mavlink, f'MAVLINK_MSG_ID_{msg_type}')
+        interval_us = 1e6 / rate if rate > 0 else rate # 0 restores the default, -1 disables
+        ack = self.session.expect(
+            'COMMAND_ACK', f'COMMAND_ACK.command=={pymavlink.mavutil.mavlink.MAV_CMD_SET_MESSAGE_INTERVAL}')
+        self.session.mav.command_long_send(
+            self.session.target_system, self.session.target_component,
+            pymavlink.mavutil.mavlink.MAV_CMD_SET_MESSAGE_INTERVAL, 0, msg_id, interval_us, 0, 0, 0, 0, 0)
+        try:
+            return self.session.wait('COMMAND_ACK', timeout=timeout, future=ack).result == pymavlink.mavutil.mavlink.MAV_RESULT_ACCEPTED
+        except TimeoutError:
+            return False
+
+    def start(self):
+        self._file = open(self.path, 'wb')
+        self._writer.start()
+        for msg_type in self.rates:
+            self._new_block(msg_type)
+            self._unsubscribe.append(self.session.subscribe(msg_type, self._on_message))
+        for msg_type, rate in self.rates.items():
+            if not self.set_interval(msg_type, rate):
+                self.stats.rejected.append(msg_type)
+        return self
+
+    def stop(self):
+        for msg_type in self.rates:
+            self.set_interval(msg_type, 0)
+        for unsubscribe in self._unsubscribe:
+            unsubscribe()
+        for msg_type in self.rates:
+            self._flush(msg_type)
+        self._queue.put(None)
+        self._writer.join()
+        self._file.close()
+        return self.stats
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _new_block(self, msg_type: str):
+        self._blocks[msg_type] = np.zeros(BLOCK_ROWS, dtype=self._dtypes[msg_type])
+        self._rows[msg_type] = 0
+
+    def _flush(self, msg_type: str):
+        rows = self._rows[msg_type]
+        if rows:
+            self._queue.put((msg_type, self._blocks[msg_type][:rows]))
+            self._new_block(msg_type)
+
+    def _on_message(self, msg):
+        msg_type = msg.get_type()
+        host_time = msg._timestamp
+        row = self._rows[msg_type]
+        record = self._blocks[msg_type][row]
+        record['host_time'] = host_time
+        record['autopilot_time'] = autopilot_time(msg)
+        for name in self._dtypes[msg_type].names[2:]:
+            record[name] = getattr(msg, name)
+        self._rows[msg_type] = row + 1
+        if row + 1 == BLOCK_ROWS:
+            self._flush(msg_type)
+
+        if msg_type not in self.stats.first:
+            self.stats.first[msg_type] = host_time
+            self.stats.counts[msg_type] = 0
+        self.stats.counts[msg_type] += 1
+        self.stats.last[msg_type] = host_time
+
+    def _write_blocks(self):
+        while (item := self._queue.get()) is not None:
+            msg_type, block = item
+            columns = [[name, block.dtype[name].base.str, list(block.dtype[name].shape)] for name in block.dtype.names]
+            header = json.dumps({'type': msg_type, 'rows': len(block), 'columns': columns}).encode()
+            self._file.write(BLOCK_HEADER.pack(len(header)) + header)
+            for name in block.dtype.names:
+                self._file.write(np.ascontiguousarray(block[name]).tobytes())
+            self._file.flush()
+            self.stats.blocks += 1
+            self.stats.bytes_written = self._file.tell()
+
+
+def read_telemetry(path: Path) -> dict[str, np.ndarray]:
+    """
+    Read a recorder file back as one structured array per message type.
+    """
+    data = Path(path).read_bytes()
+    blocks: dict[str, list[np.ndarray]] = {}
+    pos = 0
+    while pos + BLOCK_HEADER.size <= len(data):
+        (header_length,) = BLOCK_HEADER.unpack_from(data, pos)
+        pos += BLOCK_HEADER.size
+        header = json.loads(data[pos:pos + header_length])
+        pos += header_length
+        dtype = np.dtype([(name, base, tuple(shape)) for name, base, shape in header['columns']])
+        if pos + dtype.itemsize * header['rows'] > len(data):
+            break # Block cut short by a crash
+        block = np.zeros(header['rows'], dtype=dtype)
+        for name in dtype.names:
+            column = block[name]
+            column[...] = np.frombuffer(data, dtype=column.dtype, count=column.size, offset=pos).reshape(column.shape)
+            pos += column.nbytes
+        blocks.setdefault(header['type'], []).append(block)
+    return {msg_type: np.concatenate(parts) for msg_type, parts in blocks.items()}
@@ -0,0 +1,152 @@
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+G = 9.81
+MASS_PATTERN = re.compile(r"_(\d+(?:\.\d+)?)(g|kg)(?:_|$)")
+# Plain static load runs only, leaving out variants like _alum_duct and _recal
+DEFAULT_RUN_PATTERN = r"test_load_cell_(?:\d+(?:\.\d+)?(?:g|kg)|offset)(?:_\d+)?"
+
+
+@dataclass(frozen=True)
+class Calibration:
+    """
+    Polynomial calibration for every channel, evaluated on whole blocks of raw
+    readings at once.
+
+    `coefficients` has one row per channel, lowest order first, so a linear
+    scale/offset channel is `[offset, scale]` padded with zeros.
+
+    """
+
+    coefficients: np.ndarray
+
+    @staticmethod
+    def from_polynomials(polynomials: List[List[float]]) -> "Calibration":
+        order = max([2, *(len(poly) for poly in polynomials)])
+        coefficients = np.zeros((len(polynomials), order))
+        for i, poly in enumerate(polynomials):
+            coefficients[i, : len(poly)] = poly
+        return Calibration(coefficients)
+
+    @property
+    def save_raw(self) -> np.ndarray:
+        """
+        Channels whose calibration isn't the identity, so their raw value is
+        worth saving too.
+
+        """
+        identity = np.zeros(self.coefficients.shape[1])
+        identity[1] = 1
+        return ~np.all(self.coefficients == identity, axis=1)
+
+    def apply(self, raw: np.ndarray) -> np.ndarray:
+        """
+        Calibrate an (N, channels) block of raw readings with Horner's method.
+
+        """
+        result = np.broadcast_to(self.coefficients[:, -1], raw.shape).copy()
+        for k in range(self.coefficients.shape[1] - 2, -1, -1):
+            result *= raw
+            result += self.coefficients[:, k]
+        return result
+
+
+def fit_polynomial(raw: np.ndarray, reference: np.ndarray, order: int) -> List[float]:
+    """
+    Least squares calibration polynomial mapping raw readings to reference
+    values, lowest order first.
+
+    """
+    return np.polynomial.polynomial.polyfit(raw, reference, order).tolist()
+
+
+def points_from_calibration_runs(
+    directory: Path, column: str = "Thrust (N)", pattern: str = DEFAULT_RUN_PATTERN
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calibration points from a directory of static load runs such as
+    test_data/load_cell_calibration_data, where the applied mass is in the
+    file name (`test_load_cell_1200g_0.csv`, `test_load_cell_offset.csv` for
+    no load). Only runs whose file name without extension fully matches the
+    regex `pattern` are used, so runs from different setups aren't pooled.
+    Returns the mean reading of `column` and the applied weight in N for each
+    run.
+
+    The runs were recorded by test_runner, so `column` is already converted
+    to N rather than raw counts.
+
+    """
+    readings = []
+    weights = []
+    run_pattern = re.compile(pattern)
+    for path in sorted(Path(directory).glob("*.csv")):
+        if not run_pattern.fullmatch(path.stem):
+            continue
+        match = MASS_PATTERN.search(path.stem)
+        if match is not None:
+            mass_kg = float(match[1]) / (1000 if match[2] == "g" else 1)
+        elif "offset" in path.stem:
+            mass_kg = 0.0
+        else:
+            continue
+        readings.append(pd.read_csv(path, usecols=[column])[column].mean())
+        weights.append(mass_kg * G)
+    return np.array(readings), np.array(weights)
+
+
+def channel_polynomial(channel: dict, config_dir: Path) -> List[float]:
+    """
+    Calibration polynomial from raw counts for one channel of config.yml. A
+    channel has either `scale` and `offset` or explicit `coefficients` (lowest
+    order first). It can also have a `correction` block, which fits a
+    polynomial of `order` from converted readings to the applied weight over
+    the calibration `runs` matching `pattern`. The correction is applied
+    after the conversion by composing the two polynomials.
+
+    """
+    if "coefficients" in channel:
+        polynomial = [float(c) for c in channel["coefficients"]]
+    else:
+        polynomial = [float(channel["offset"]), float(channel["scale"])]
+    correction: Optional[dict] = channel.get("correction")
+    if correction is None:
+        return polynomial
+    readings, weights = points_from_calibration_runs(
+        config_dir / correction["runs"],
+        column=correction.get("column", "Thrust (N)"),
+        pattern=correction.get("pattern", DEFAULT_RUN_PATTERN),
+    )
+    corrected = np.polynomial.Polynomial(
+        fit_polynomial(readings, weights, correction.get("order", 1))
+    )(np.polynomial.Polynomial(polynomial))
+    return corrected.coef.tolist()
+
+
+def parse_readings(lines: List[bytes], num_channels: int) -> np.ndarray:
+    """
+    Parse whitespace separated raw readings from many lines into an
+    (N, channels) block, truncated to integers like the firmware's counts.
+    Lines with the wrong number of readings are dropped.
+
+    """
+    tokens = b" ".join(lines).split()
+    if len(tokens) != len(lines) * num_channels:
+        lines = [line for line in lines if len(line.split()) == num_channels]
+        tokens = b" ".join(lines).split()
+    try:
+        values = np.array(tokens, dtype=np.float64)
+    except ValueError:
+        rows = []
+        for line in lines:
+            try:
+                rows.append(np.array(line.split(), dtype=np.float64))
+            except ValueError:
+                continue
+        values = np.array(rows, dtype=np.float64)
+    return np.trunc(values.reshape(-1, num_channels))
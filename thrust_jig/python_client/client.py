@@ -1,13 +1,19 @@
 import serial
 import serial.tools.list_ports
-import csv
 from pathlib import Path
 from datetime import datetime
+from typing import Optional, Sequence
 import argparse
+import sys
+import numpy as np
 import yaml
 
+from calibration import Calibration, channel_polynomial, parse_readings
+from writer import AcquisitionWriter
+
 
 SERIAL_BAUD = 115200
+TEST_RUNNER_DIR = Path(__file__).parent.parent / "test_runner"
 
 
 def load_config(config_path: Path):
@@ -19,27 +25,44 @@ def load_config(config_path: Path):
         config_data = yaml.safe_load(config_file)
 
     names = []
-    scales = []
-    offsets = []
+    polynomials = []
     units = []
-    save_raw = []
 
     for channel in config_data["channels"].values():
-        name = channel["name"]
-        scale = channel["scale"]
-        offset = channel["offset"]
-        unit = channel["unit"]
+        names.append(channel["name"])
+        polynomials.append(channel_polynomial(channel, Path(config_path).parent))
+        units.append(channel["unit"])
+
+    return names, Calibration.from_polynomials(polynomials), units
+
+
+def make_dashboard(names: Sequence[str], units: Sequence[str], title: str):
+    """
+    Live plot with one panel per unit, so the two motor speeds or currents
+    share axes. live_plot comes from test_runner, which the entry point puts on
+    the path.
 
-        names.append(name)
-        scales.append(scale)
-        offsets.append(offset)
-        units.append(unit)
-        save_raw.append(True if scale != 1 or offset != 0 else False)
+    """
+    from live_plot import LiveDashboard
 
-    return names, scales, offsets, units, save_raw
+    panels = {}
+    for name, unit in zip(names, units):
+        panels.setdefault(unit, []).append(name)
+    return LiveDashboard(
+        names, panels=list(panels.values()), x_column=None, title=title
+    )
 
 
-def run_experiment(port: str, out_dir: Path, config_path: Path):
+def run_experiment(
+    port: str,
+    out_dir: Path,
+    config_path: Path,
+    formats: Sequence[str] = ("csv",),
+    flush_rows: int = 500,
+    flush_interval: float = 1.0,
+    display_rate: float = 5.0,
+    live_plot: bool = False,
+):
     """
     Main program flow.
 
@@ -48,66 +71,81 @@ def run_experiment(port: str, out_dir: Path, config_path: Path):
     ser = serial.Serial(port, baudrate=SERIAL_BAUD, timeout=5)
 
     # Load channels config.
-    channel_names, offsets, scales, units, save_raw = load_config(config_path)
+    channel_names, calibration, units = load_config(config_path)
+    save_raw = calibration.save_raw
 
     # Get current time for the output CSV name.
     local_tz = datetime.now().astimezone().tzinfo
     file_time = datetime.now(tz=local_tz)
     file_name = f"{file_time:%Y-%m-%d_%H-%M-%S}"
 
-    with open(f"{out_dir}/{file_name}.csv", "w", newline="") as csv_file:
-        csv_writer = csv.writer(csv_file)
-
-        # Write file header.
-        csv_writer.writerow(["Config File", config_path])
-        start_time = datetime.now(tz=local_tz)
-        csv_writer.writerow(
-            ["Start Time", start_time.strftime("%Y-%m-%dT%H:%M:%S.%f%z")]
-        )
-        csv_writer.writerow([])
-
-        channel_names_with_units = [
-            f"{name} ({unit})" for name, unit in zip(channel_names, units)
-        ]
-        csv_writer.writerow(
-            [
-                *channel_names_with_units,
-                *(
-                    f"Raw {name}"
-                    for name, save_value in zip(channel_names, save_raw)
-                    if save_value
-                ),
-            ]
-        )
-
-        # Flush RX buffer.
-        ser.flush()
+    channel_names_with_units = [
+        f"{name} ({unit})" for name, unit in zip(channel_names, units)
+    ]
+    columns = [
+        *channel_names_with_units,
+        *(
+            f"Raw {name}"
+            for name, save_value in zip(channel_names, save_raw)
+            if save_value
+        ),
+    ]
+    start_time = datetime.now(tz=local_tz)
+    writer = AcquisitionWriter(
+        Path(out_dir) / file_name,
+        columns=columns,
+        formats=formats,
+        flush_rows=flush_rows,
+        flush_interval=flush_interval,
+        display_rate=display_rate,
+        csv_header=[
+            ["Config File", config_path],
+            ["Start Time", start_time.strftime("%Y-%m-%dT%H:%M:%S.%f%z")],
+            [],
+        ],
+    )
 
-        while True:
-            # Parse raw values.
-            line = ser.readline()
-            raw_readings = [int(float(reading)) for reading in line.decode().split()]
-            raw_outputs = [
-                reading for reading, save in zip(raw_readings, save_raw) if not save
-            ]
-
-            converted_readings = [
-                scale * reading + offset
-                for scale, reading, offset in zip(scales, raw_readings, offsets)
-            ]
-
-            csv_writer.writerow([*converted_readings, *raw_outputs])
-            print(
-                ", ".join(
-                    "{:}: {:6.2f} {:}".format(name, value, unit)
-                    for name, value, unit in zip(
-                        channel_names, converted_readings, units
-                    )
-                )
-            )
+    dashboard = None
+    if live_plot:
+        dashboard = make_dashboard(channel_names_with_units, units, file_name)
+        # The dashboard replaces the console view
+        writer.display_rate = 0
 
+    # Flush RX buffer.
+    ser.flush()
 
-if __name__ == "__main__":
+    try:
+        partial_line = b""
+        while True:
+            # Parse all complete lines received so far as one block.
+            *lines, partial_line = (partial_line + ser.read(ser.in_waiting or 1)).split(
+                b"\n"
+            )
+            if not lines:
+                continue
+            raw_readings = parse_readings(lines, len(channel_names))
+            if len(raw_readings) == 0:
+                continue
+
+            converted_readings = calibration.apply(raw_readings)
+            writer.write_block(
+                np.hstack([converted_readings, raw_readings[:, save_raw]]),
+                display_names=channel_names_with_units,
+            )
+            if dashboard is not None:
+                dashboard.feed(converted_readings)
+                dashboard.poll()
+    except KeyboardInterrupt:
+        print("Stopping acquisition")
+    finally:
+        stats = writer.close()
+        ser.close()
+        print(f"Acquisition: {stats.summary()}")
+        if dashboard is not None:
+            print(f"Live plot: {dashboard.close().summary()}")
+
+
+def build_parser() -> argparse.ArgumentParser:
     available_ports = [port.name for port in serial.tools.list_ports.comports()]
 
     parser = argparse.ArgumentParser(
@@ -129,6 +167,55 @@ if __name__ == "__main__":
         type=str,
         help="Name of the file where configs are stored",
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--format",
+        nargs="+",
+        choices=("csv", "bin"),
+        default=["csv"],
+        help="Output formats, bin is an append-only float64 record file",
+    )
+    parser.add_argument(
+        "--flush-rows",
+        type=int,
+        default=500,
+        help="Write buffered rows to disk after this many rows",
+    )
+    parser.add_argument(
+        "--flush-interval",
+        type=float,
+        default=1.0,
+        help="Write buffered rows to disk after this many seconds",
+    )
+    parser.add_argument(
+        "--display-rate",
+        type=float,
+        default=5.0,
+        help="Console updates per second, 0 to disable",
+    )
+    parser.add_argument(
+        "--live-plot",
+        action="store_true",
+        help="Plot the channels live instead of printing them",
+    )
+    return parser
+
 
-    run_experiment(args.port, args.out, args.config)
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+
+    run_experiment(
+        args.port,
+        args.out,
+        args.config,
+        formats=args.format,
+        flush_rows=args.flush_rows,
+        flush_interval=args.flush_interval,
+        display_rate=args.display_rate,
+        live_plot=args.live_plot,
+    )
+
+
+if __name__ == "__main__":
+    # As for cli.py acquire, the live dashboard is shared with test_runner
+    sys.path.append(str(TEST_RUNNER_DIR))
+    main()
@@ -0,0 +1,156 @@
+import csv
+import json
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List, Sequence
+
+import numpy as np
+
+
+@dataclass
+class WriterStats:
+    rows: int = 0
+    bytes_written: int = 0
+    flushes: int = 0
+    max_flush_lag_s: float = 0.0
+    total_flush_lag_s: float = 0.0
+    duration_s: float = 0.0
+
+    def summary(self) -> str:
+        rate = self.rows / self.duration_s if self.duration_s > 0 else 0.0
+        mean_lag = self.total_flush_lag_s / self.flushes if self.flushes else 0.0
+        return (
+            f"{self.rows} rows in {self.duration_s:.1f} s ({rate:.0f} rows/s), "
+            f"{self.bytes_written / 1024:.1f} KiB written in {self.flushes} flushes, "
+            f"flush lag mean {mean_lag * 1e3:.1f} ms / max {self.max_flush_lag_s * 1e3:.1f} ms"
+        )
+
+
+class AcquisitionWriter:
+    """
+    Buffered, crash-tolerant writer for acquisition rows.
+
+    Rows are held in memory and written out when either `flush_rows` rows are
+    pending or the oldest pending row is `flush_interval` seconds old, then
+    flushed and fsynced so a crash loses at most one batch. Rows go to a CSV
+    file, an append-only binary file of float64 records (column names in a JSON
+    sidecar), or both. Console output is decimated to `display_rate` Hz.
+
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        columns: Sequence[str],
+        formats: Iterable[str] = ("csv",),
+        flush_rows: int = 500,
+        flush_interval: float = 1.0,
+        display_rate: float = 5.0,
+        csv_header: Sequence[Sequence[str]] = (),
+    ):
+        self.path = Path(path)
+        self.columns = list(columns)
+        self.formats = set(formats)
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.display_rate = display_rate
+        self.stats = WriterStats()
+
+        self._pending: List[np.ndarray] = []
+        self._num_pending = 0
+        self._oldest_pending = 0.0
+        self._last_display = 0.0
+        self._start = time.monotonic()
+
+        self._csv_file = None
+        self._bin_file = None
+        if "csv" in self.formats:
+            self._csv_file = open(self.path.with_suffix(".csv"), "w", newline="")
+            self._csv_writer = csv.writer(self._csv_file)
+            self._csv_writer.writerows(csv_header)
+            self._csv_writer.writerow(self.columns)
+        if "bin" in self.formats:
+            self.path.with_suffix(".json").write_text(
+                json.dumps({"columns": self.columns, "dtype": "<f8"})
+            )
+            self._bin_file = open(self.path.with_suffix(".bin"), "ab")
+
+    def write(self, row: Sequence[float], display_names: Sequence[str] = ()) -> None:
+        self.write_block(np.asarray(row, dtype=np.float64)[None, :], display_names)
+
+    def write_block(self, rows: np.ndarray, display_names: Sequence[str] = ()) -> None:
+        if len(rows) == 0:
+            return
+        now = time.monotonic()
+        if not self._pending:
+            self._oldest_pending = now
+        self._pending.append(rows)
+        self._num_pending += len(rows)
+
+        if (
+            self._num_pending >= self.flush_rows
+            or now - self._oldest_pending >= self.flush_interval
+        ):
+            self.flush()
+
+        if self.display_rate > 0 and now - self._last_display >= 1 / self.display_rate:
+            self._last_display = now
+            print(
+                ", ".join(
+                    f"{name}: {value:6.2f}"
+                    for name, value in zip(display_names or self.columns, rows[-1])
+                )
+            )
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        block = np.vstack(self._pending)
+        for file in (self._csv_file, self._bin_file):
+            if file is None:
+                continue
+            start = file.tell()
+            if file is self._csv_file:
+                self._csv_writer.writerows(block.tolist())
+            else:
+                file.write(block.astype("<f8").tobytes())
+            file.flush()
+            os.fsync(file.fileno())
+            self.stats.bytes_written += file.tell() - start
+
+        lag = time.monotonic() - self._oldest_pending
+        self.stats.rows += len(block)
+        self.stats.flushes += 1
+        self.stats.total_flush_lag_s += lag
+        self.stats.max_flush_lag_s = max(self.stats.max_flush_lag_s, lag)
+        self._pending.clear()
+        self._num_pending = 0
+
+    def close(self) -> WriterStats:
+        self.flush()
+        for file in (self._csv_file, self._bin_file):
+            if file is not None:
+                file.close()
+        self.stats.duration_s = time.monotonic() - self._start
+        return self.stats
+
+    def __enter__(self) -> "AcquisitionWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def read_binary(path: Path) -> np.ndarray:
+    """
+    Read rows written in the binary format back as a structured array.
+
+    """
+    path = Path(path)
+    meta = json.loads(path.with_suffix(".json").read_text())
+    dtype = np.dtype([(name, meta["dtype"]) for name in meta["columns"]])
+    data = np.fromfile(path.with_suffix(".bin"), dtype=np.uint8)
+    # Drop a partially written trailing record
+    return data[: len(data) - len(data) % dtype.itemsize].view(dtype)
@@ -0,0 +1,214 @@
+from typing import TYPE_CHECKING, Callable, List, Optional, Tuple
+from dataclasses import dataclass
+import queue
+import threading
+import time
+import numpy as np
+import serial
+
+from framing import (
+    CONTROL_MSGS,
+    STOPPED_MSG,
+    FrameDecoder,
+    frames_to_rows,
+    parse_csv_line,
+)
+from sample_buffer import SampleBuffer
+
+if TYPE_CHECKING:
+    from closed_loop import SetpointController
+    from live_plot import LiveDashboard
+    from monitor import StreamMonitor
+
+
+@dataclass
+class AcquisitionStats:
+    bytes_read: int = 0
+    chunks_read: int = 0
+    dropped_chunks: int = 0
+    dropped_bytes: int = 0
+    queue_high_water: int = 0
+    lines: int = 0
+    control_lines: int = 0
+    invalid_lines: int = 0
+    bad_frames: int = 0
+    samples: int = 0
+    duration_s: float = 0.0
+
+    @property
+    def samples_per_s(self) -> float:
+        return self.samples / self.duration_s if self.duration_s > 0 else 0.0
+
+    @property
+    def bytes_per_s(self) -> float:
+        return self.bytes_read / self.duration_s if self.duration_s > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.samples} samples in {self.duration_s:.1f} s "
+            f"({self.samples_per_s:.0f} samples/s, {self.bytes_per_s / 1024:.1f} KiB/s), "
+            f"{self.invalid_lines} invalid lines, {self.bad_frames} bad frames, "
+            f"{self.dropped_chunks} dropped chunks ({self.dropped_bytes} B), "
+            f"queue high water {self.queue_high_water}"
+        )
+
+
+class AcquisitionPipeline:
+    """
+    Serial acquisition split into stages so a slow consumer can't stall the port.
+
+    A reader thread drains the port into a bounded queue of raw byte chunks. The
+    calling thread then parses each chunk, stores the resulting rows in a
+    SampleBuffer in one batch and prints a decimated live view, or polls a
+    LiveDashboard plotting from the SampleBuffer instead. If the queue
+    fills up the newest chunk is dropped and counted rather than blocking the
+    reader. Stored rows are also handed to a SetpointController and a
+    StreamMonitor, if given, along with when their chunk came off the port. The
+    controller goes first as it is the one racing the jig.
+
+    """
+
+    def __init__(
+        self,
+        ser: serial.Serial,
+        samples: SampleBuffer,
+        convert: Callable[[np.ndarray], np.ndarray],
+        binary: bool = False,
+        queue_size: int = 1024,
+        display_rate_hz: float = 2.0,
+        idle_timeout: float = 10.0,
+        on_line: Optional[Callable[[str], bool]] = None,
+        on_poll: Optional[Callable[[float], None]] = None,
+        dashboard: Optional["LiveDashboard"] = None,
+        monitor: Optional["StreamMonitor"] = None,
+        controller: Optional["SetpointController"] = None,
+    ) -> None:
+        self.ser = ser
+        self.samples = samples
+        self.convert = convert
+        self.binary = binary
+        self.display_rate_hz = display_rate_hz
+        self.idle_timeout = idle_timeout
+        self.on_line = on_line
+        self.on_poll = on_poll
+        self.dashboard = dashboard
+        self.monitor = monitor
+        self.controller = controller
+        self.stats = AcquisitionStats()
+        self._queue: "queue.Queue[Tuple[float, bytes]]" = queue.Queue(
+            maxsize=queue_size
+        )
+        self._stop = threading.Event()
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._decoder = FrameDecoder()
+        self._partial_line = b""
+        self._stopped = False
+        self._last_display = 0.0
+
+    def _read(self) -> None:
+        while not self._stop.is_set():
+            data = self.ser.read(self.ser.in_waiting or 1)
+            if not data:
+                continue
+            self.stats.bytes_read += len(data)
+            self.stats.chunks_read += 1
+            try:
+                self._queue.put_nowait((time.perf_counter(), data))
+            except queue.Full:
+                self.stats.dropped_chunks += 1
+                self.stats.dropped_bytes += len(data)
+            self.stats.queue_high_water = max(
+                self.stats.queue_high_water, self._queue.qsize()
+            )
+
+    def _parse_binary(self, data: bytes) -> Optional[np.ndarray]:
+        frames = self._decoder.feed(data)
+        self.stats.bad_frames = self._decoder.bad_frames
+        lines, self._decoder.lines = self._decoder.lines, []
+        if self.on_line is not None:
+            for line in lines:
+                self.on_line(line)
+        self._stopped = self._decoder.stopped()
+        return frames_to_rows(frames) if len(frames) > 0 else None
+
+    def _parse_csv(self, data: bytes) -> Optional[np.ndarray]:
+        lines = (self._partial_line + data).split(b"\n")
+        self._partial_line = lines.pop()
+        rows: List[List[float]] = []
+        for line in lines:
+            self.stats.lines += 1
+            rx_data = line.decode(errors="backslashreplace")
+            if rx_data.strip() in CONTROL_MSGS:
+                self.stats.control_lines += 1
+                continue
+            if STOPPED_MSG.decode() in rx_data:
+                self._stopped = True
+                break
+            values = parse_csv_line(rx_data)
+            if values is None:
+                if self.on_line is not None and self.on_line(rx_data):
+                    self.stats.control_lines += 1
+                    continue
+                self.stats.invalid_lines += 1
+                continue
+            rows.append(values)
+        return np.array(rows, dtype=np.float64) if rows else None
+
+    def _parse(self, data: bytes) -> Optional[np.ndarray]:
+        return self._parse_binary(data) if self.binary else self._parse_csv(data)
+
+    def _store(self, rows: np.ndarray, received: float) -> None:
+        rows = self.convert(rows)
+        if self.controller is not None:
+            self.controller.process(rows, received)
+        self.samples.add_rows(rows)
+        self.stats.samples += len(rows)
+        if self.monitor is not None:
+            self.monitor.process(rows, received)
+
+    def _display(self, now: float) -> None:
+        if self.dashboard is not None:
+            self.dashboard.poll(now)
+            return
+        if self.display_rate_hz <= 0 or len(self.samples) == 0:
+            return
+        if now - self._last_display < 1 / self.display_rate_hz:
+            return
+        self._last_display = now
+        latest = self.samples.view()[-1]
+        print(
+            "Rx: "
+            + ", ".join(
+                f"{name}: {value:.2f}"
+                for name, value in zip(self.samples.columns, latest)
+            )
+        )
+
+    def run(self) -> AcquisitionStats:
+        start = last_sample = time.time()
+        self._reader.start()
+        try:
+            while not self._stopped:
+                now = time.time()
+                if self.on_poll is not None:
+                    self.on_poll(now)
+                if now - last_sample > self.idle_timeout:
+                    print("Timed out waiting for data")
+                    break
+                try:
+                    received, data = self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    if self.dashboard is not None:
+                        # Keep the plot responsive while the jig is quiet
+                        self.dashboard.poll(now)
+                    continue
+                rows = self._parse(data)
+                if rows is not None:
+                    self._store(rows, received)
+                    last_sample = now
+                self._display(now)
+        finally:
+            self._stop.set()
+            self._reader.join()
+            self.stats.duration_s = time.time() - start
+        return self.stats
@@ -0,0 +1,81 @@
+"""
+Run a small test campaign on virtual jigs, first on one jig and then spread
+over several, and report wall time and per-jig utilization. A campaign is
+then interrupted part way and resumed with one of the jigs missing, which
+should be retired with its runs picked up by the others, and finally run
+again to show completed runs being skipped.
+
+"""
+from pathlib import Path
+from typing import List
+import argparse
+import _thread
+import tempfile
+import threading
+
+from campaign import CampaignJob, completed_outputs, run_campaign
+from runner import TestPlan, TestStep
+from virtual_jig import VirtualJig
+
+MISSING_PORT = "/dev/ttyMISSING"
+
+
+def make_jobs(
+    out_dir: Path, configs: int, repeats: int, step_ms: int
+) -> List[CampaignJob]:
+    jobs = []
+    for config in range(configs):
+        steps = [
+            TestStep(duration_ms=step_ms, top_throttle=t, bottom_throttle=t + config)
+            for t in range(0, 20, 4)
+        ]
+        jobs.append(
+            CampaignJob(
+                TestPlan(f"config_{config}", steps),
+                out_dir / f"test_config_{config}.csv",
+                repeats,
+            )
+        )
+    return jobs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark a campaign on virtual jigs")
+    parser.add_argument("--jigs", type=int, default=4)
+    parser.add_argument("--configs", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--step-ms", type=int, default=200)
+    parser.add_argument("--interrupt-s", type=float, default=2.5)
+    args = parser.parse_args()
+
+    jigs = [VirtualJig(rate_hz=1000).start() for _ in range(args.jigs)]
+    ports = [jig.port for jig in jigs]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, campaign_ports in (
+            ("1 jig", ports[:1]),
+            (f"{args.jigs} jigs", ports),
+        ):
+            out_dir = Path(tmp_dir) / name.replace(" ", "_")
+            jobs = make_jobs(out_dir, args.configs, args.repeats, args.step_ms)
+            print(f"--- {name} ---")
+            stats = run_campaign(jobs, campaign_ports, out_dir / "campaign.jsonl")
+            print(stats.summary())
+
+        out_dir = Path(tmp_dir) / "resumed"
+        state_path = out_dir / "campaign.jsonl"
+        jobs = make_jobs(out_dir, args.configs, args.repeats, args.step_ms)
+        print(f"--- interrupted after {args.interrupt_s} s ---")
+        threading.Timer(args.interrupt_s, _thread.interrupt_main).start()
+        try:
+            run_campaign(jobs, ports, state_path)
+        except KeyboardInterrupt:
+            print(f"Interrupted with {len(completed_outputs(state_path))} runs done")
+        print("--- resumed, with one jig replaced by a missing port ---")
+        stats = run_campaign(jobs, [*ports[:-1], MISSING_PORT], state_path)
+        print(stats.summary())
+        print("--- run again ---")
+        stats = run_campaign(jobs, ports, state_path)
+        print(stats.summary())
+
+    for jig in jigs:
+        jig.close()
@@ -0,0 +1,133 @@
+"""
+Benchmark closed loop setpoints on the virtual jig. A prop that makes less
+thrust than the plan's throttles were picked for is run open loop and then
+holding target thrusts, reporting each step's error, noise and settling time.
+Mismatched motors are run open loop and with RPM balancing, reporting the
+speed difference and reaction torque. Then the loop's latency from sample to
+throttle applied is measured on the jig's clock at increasing row rates, and
+a budget the loop can't meet checks that the jig gets stopped.
+
+"""
+from contextlib import redirect_stdout
+import argparse
+import io
+import numpy as np
+
+from bench_virtual_jig import jig_process
+from runner import TestPlan, TestStep, test_run
+from virtual_jig import JigModel
+
+
+TARGETS_N = (2.0, 4.0, 6.0)
+STEP_MS = 3000
+
+
+def run(plan: TestPlan, model: JigModel, rate: float, **kwargs):
+    with jig_process(rate_hz=rate, baud=None, model=model) as (port, result):
+        with redirect_stdout(io.StringIO()):
+            data = test_run(None, plan, port=port, binary=True, monitor=False, **kwargs)
+    return data, result["jig"]
+
+
+def thrust_plan(closed_loop: bool) -> TestPlan:
+    return TestPlan(
+        "thrust",
+        [
+            TestStep(
+                duration_ms=STEP_MS,
+                # Throttles for the prop the plan was written for
+                top_throttle=100 * np.sqrt(target / 2 / 6e-8) / 12000,
+                bottom_throttle=100 * np.sqrt(target / 2 / 6e-8) / 12000,
+                target_thrust_N=target if closed_loop else None,
+            )
+            for target in TARGETS_N
+        ],
+    )
+
+
+def bench_thrust(rate: float) -> None:
+    model = dict(thrust_per_rpm2=4.5e-8)
+    for closed_loop in (False, True):
+        data, _ = run(thrust_plan(closed_loop), JigModel(**model), rate)
+        print(f"  {'closed loop' if closed_loop else 'open loop':>11}:")
+        for i, target in enumerate(TARGETS_N):
+            start = i * STEP_MS
+            step = data.loc[start : start + STEP_MS, "thrust_N"]
+            steady = step.loc[start + STEP_MS / 2 :]
+            smooth = step.rolling(25, min_periods=1).mean()
+            outside = np.flatnonzero(np.abs(smooth - target) > 0.02 * target)
+            if len(outside) == 0:
+                settle = "settled at once"
+            elif outside[-1] == len(smooth) - 1:
+                settle = "never within 2%"
+            else:
+                settle = f"settled in {smooth.index[outside[-1]] - start:4.0f} ms"
+            print(
+                f"    {target:.1f} N: {steady.mean():5.2f} N "
+                f"({(steady.mean() - target) / target:+6.1%}), "
+                f"std {steady.std():.3f} N, {settle}"
+            )
+
+
+def bench_balance(rate: float) -> None:
+    for closed_loop in (False, True):
+        plan = TestPlan(
+            "balance",
+            [
+                TestStep(
+                    duration_ms=STEP_MS,
+                    top_throttle=throttle,
+                    bottom_throttle=throttle,
+                    balance_rpm=closed_loop,
+                )
+                for throttle in (30, 50, 70)
+            ],
+        )
+        data, _ = run(plan, JigModel(motor_mismatch=0.08), rate)
+        print(f"  {'balanced' if closed_loop else 'open loop':>11}:")
+        for i, throttle in enumerate((30, 50, 70)):
+            start = i * STEP_MS + STEP_MS / 2
+            steady = data.loc[start : (i + 1) * STEP_MS]
+            difference = steady["top_motor_rpm"] - steady["bottom_motor_rpm"]
+            print(
+                f"    {throttle} %: top - bottom {difference.mean():6.1f} rpm, "
+                f"torque {steady['torque_N'].mean():+.4f}"
+            )
+
+
+def bench_latency(rate: float, budget_ms: float) -> None:
+    plan = TestPlan(
+        "latency",
+        [TestStep(duration_ms=5000, top_throttle=50, target_thrust_N=3.0)],
+    )
+    data, jig = run(plan, JigModel(), rate, latency_budget_ms=budget_ms)
+    stats = data.attrs["closed_loop_stats"]
+    latency = np.array(stats["latencies_ms"] or [np.nan])
+    print(
+        f"  {rate:5.0f} rows/s, {budget_ms:g} ms budget: "
+        f"{stats['updates']} updates for {jig.rows_sent} rows, "
+        f"p50 {np.percentile(latency, 50):.2f} ms / "
+        f"p99 {np.percentile(latency, 99):.2f} ms / max {latency.max():.2f} ms, "
+        f"{stats['over_budget']} over budget"
+        + (f", stopped at {data.index[-1] / 1e3:.2f} s" if stats["aborted"] else "")
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark closed loop setpoints")
+    parser.add_argument("--rate", type=float, default=1000)
+    parser.add_argument("--rates", type=float, nargs="+", default=[250, 1000, 5000])
+    parser.add_argument("--budget", type=float, default=20.0)
+    args = parser.parse_args()
+
+    print(
+        f"Holding thrust with a weaker prop than planned for, {args.rate:.0f} rows/s:"
+    )
+    bench_thrust(args.rate)
+    print("Balancing motors 8% apart:")
+    bench_balance(args.rate)
+    print("Latency from sample to throttle applied:")
+    for rate in args.rates:
+        bench_latency(rate, args.budget)
+    # Nothing meets a budget this tight, so the jig should get stopped
+    bench_latency(args.rate, 0.05)
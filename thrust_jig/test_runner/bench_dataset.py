@@ -0,0 +1,64 @@
+"""
+Benchmark cold vs warm loading of the whole thrust_jig/test_data corpus.
+Cold loads parse every CSV and write the .npy cache, warm loads only read it.
+
+"""
+from pathlib import Path
+import argparse
+import tempfile
+import time
+import warnings
+
+from dataset import find_runs, load_run, load_runs
+
+
+DEFAULT_CORPUS = Path(__file__).parent.parent / "test_data"
+
+
+def timed(name: str, fcn) -> None:
+    start = time.perf_counter()
+    runs = fcn()
+    elapsed = time.perf_counter() - start
+    rows = sum(len(run) for run in runs.values())
+    print(f"{name:>22}: {len(runs)} runs, {rows} rows in {elapsed:6.2f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark test data loading")
+    parser.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    filenames = find_runs(args.corpus)
+    print(f"Loading {len(filenames)} CSVs under {args.corpus}")
+    warnings.simplefilter("ignore")
+
+    def load_serial(cache_dir):
+        runs = {}
+        for filename in filenames:
+            try:
+                runs[filename] = load_run(filename, cache_dir=cache_dir)
+            except ValueError:
+                pass
+        return runs
+
+    with tempfile.TemporaryDirectory() as serial_cache, tempfile.TemporaryDirectory() as parallel_cache:
+        timed("uncached (read_csv)", lambda: load_serial(None))
+        timed("cold, serial", lambda: load_serial(Path(serial_cache)))
+        timed("warm, serial", lambda: load_serial(Path(serial_cache)))
+        timed(
+            "cold, process pool",
+            lambda: load_runs(
+                args.corpus, cache_dir=Path(parallel_cache), workers=args.workers
+            ),
+        )
+        timed(
+            "warm, process pool",
+            lambda: load_runs(
+                args.corpus, cache_dir=Path(parallel_cache), workers=args.workers
+            ),
+        )
+        timed(
+            "warm, mmap",
+            lambda: load_runs(args.corpus, cache_dir=Path(parallel_cache), mmap=True),
+        )
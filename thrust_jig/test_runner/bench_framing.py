@@ -0,0 +1,83 @@
+"""
+Replay benchmark comparing samples/s decoded for the CSV and binary framed
+sample streams. A recorded test CSV is re-encoded the way the firmware would
+send it and decoded in serial-sized chunks.
+
+"""
+from pathlib import Path
+import argparse
+import time
+import numpy as np
+
+from framing import (
+    FRAME_SIZE,
+    FrameDecoder,
+    encode_frames,
+    frames_to_rows,
+    parse_csv_line,
+)
+from virtual_jig import load_replay_rows
+
+
+DEFAULT_REPLAY = Path(__file__).parent.parent / "test_data/coaxial/test_0mm_pb_0.csv"
+
+
+def encode_csv(rows: np.ndarray) -> bytes:
+    return b"".join(
+        (
+            f"{int(row[0])},{int(row[1])},{int(row[2])},"
+            + ",".join(f"{value:f}" for value in row[3:])
+            + "\n"
+        ).encode()
+        for row in rows
+    )
+
+
+def decode_csv(stream: bytes) -> int:
+    decoded = 0
+    for line in stream.splitlines(keepends=True):
+        if parse_csv_line(line.decode(errors="backslashreplace")) is not None:
+            decoded += 1
+    return decoded
+
+
+def decode_binary(stream: bytes, chunk_size: int) -> int:
+    decoder = FrameDecoder()
+    decoded = 0
+    for start in range(0, len(stream), chunk_size):
+        decoded += len(frames_to_rows(decoder.feed(stream[start : start + chunk_size])))
+    return decoded
+
+
+def bench(name: str, fcn, num_bytes: int, repeat: int) -> None:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        samples = fcn()
+        best = min(best, time.perf_counter() - start)
+    print(
+        f"{name:>6}: {samples} samples, {num_bytes / samples:5.1f} B/sample, "
+        f"{samples / best:12,.0f} samples/s"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark sample stream decoding")
+    parser.add_argument("--replay", type=Path, default=DEFAULT_REPLAY)
+    parser.add_argument("--chunk-size", type=int, default=4096)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = load_replay_rows(args.replay)
+    csv_stream = encode_csv(rows)
+    binary_stream = encode_frames(rows)
+    assert len(binary_stream) == len(rows) * FRAME_SIZE
+
+    print(f"Replaying {args.replay} ({len(rows)} samples)")
+    bench("csv", lambda: decode_csv(csv_stream), len(csv_stream), args.repeat)
+    bench(
+        "binary",
+        lambda: decode_binary(binary_stream, args.chunk_size),
+        len(binary_stream),
+        args.repeat,
+    )
@@ -0,0 +1,134 @@
+"""
+Benchmark the live dashboard. A long run is fed to it frame by frame and the
+cost of a frame is timed as the run grows, against redrawing every sample,
+with a check that the min/max envelope keeps a one sample spike. Then test_run
+reads the virtual jig with the console view and with the dashboard, reporting
+rows lost and host CPU per row. Uses the Agg backend, so the frame times are
+matplotlib's rendering without a window system.
+
+"""
+from contextlib import redirect_stdout
+import argparse
+import io
+import time
+import matplotlib
+
+matplotlib.use("Agg")
+import numpy as np
+
+from bench_virtual_jig import cpu_time, jig_process, plan_for
+from channels import INDEX_MAP, LABEL_MAP
+from live_plot import LiveDashboard, MinMaxDecimator
+from runner import test_run
+
+
+def synthetic_rows(rate: float, duration_s: float, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    n = int(rate * duration_s)
+    rows = rng.normal(size=(n, len(INDEX_MAP)))
+    rows[:, 0] = np.arange(n) * 1000 / rate
+    return rows
+
+
+def naive_frame(dashboard: LiveDashboard, rows: np.ndarray) -> float:
+    start = time.perf_counter()
+    for line, name in zip(dashboard._lines, dashboard._plotted):
+        line.set_data(rows[:, 0], rows[:, dashboard.columns.index(name)])
+    for ax in dashboard._axs:
+        ax.relim()
+        ax.autoscale_view()
+    dashboard.fig.canvas.draw()
+    return time.perf_counter() - start
+
+
+def bench_frames(rate: float, duration_s: float, frame_rate: float, checkpoints):
+    rows = synthetic_rows(rate, duration_s)
+    spike = len(rows) // 3
+    rows[spike, INDEX_MAP["thrust_N"]] = 100.0
+    columns = list(INDEX_MAP)
+    dashboard = LiveDashboard(columns, labels=LABEL_MAP)
+    naive = LiveDashboard(columns, labels=LABEL_MAP)
+    per_frame = int(rate / frame_rate)
+    checkpoints = sorted(int(rate * t) for t in checkpoints)
+    last = 0
+    for end in range(per_frame, len(rows) + 1, per_frame):
+        if checkpoints and end >= checkpoints[0]:
+            checkpoints.pop(0)
+            dashboard.feed(rows[last:end])
+            start = time.perf_counter()
+            dashboard.render()
+            decimated = time.perf_counter() - start
+            points = end * len(dashboard._lines)
+            # Redrawing every sample of a long run takes minutes, stop comparing
+            naive_ms = naive_frame(naive, rows[:end]) * 1e3 if points <= 3e6 else None
+            print(
+                f"  {end / rate:6.0f} s of history: {decimated * 1e3:6.1f} ms "
+                f"({dashboard.stats.points} points)"
+                + (
+                    f" vs {naive_ms:7.1f} ms redrawing all {points} points"
+                    if naive_ms is not None
+                    else ""
+                )
+            )
+        else:
+            # Only draw at the checkpoints to keep the benchmark short
+            dashboard._decimate(rows[last:end])
+        last = end
+    x, y = dashboard._decimator.envelope(dashboard._plotted.index("thrust_N"))
+    print(f"  spike kept: {bool(np.any(y == 100.0))}")
+
+
+def bench_test_run(rate: float, duration_s: float, live_plot: bool) -> None:
+    with jig_process(rate_hz=rate, baud=None) as (port, result):
+        cpu = cpu_time()
+        out = io.StringIO()
+        with redirect_stdout(out):
+            data = test_run(
+                None, plan_for(duration_s), port=port, binary=True, live_plot=live_plot
+            )
+        cpu = cpu_time() - cpu
+    jig = result["jig"]
+    plot = [line for line in out.getvalue().splitlines() if line.startswith("Live")]
+    print(
+        f"  {'dashboard' if live_plot else 'console':>9}: {len(data)} rows, "
+        f"{1 - len(data) / jig.rows_sent:.2%} lost, "
+        f"{cpu / len(data) * 1e6:.1f} us CPU/row"
+    )
+    for line in plot:
+        print(f"             {line}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the live dashboard")
+    parser.add_argument("--rate", type=float, default=5000)
+    parser.add_argument("--duration", type=float, default=600)
+    parser.add_argument("--frame-rate", type=float, default=10)
+    parser.add_argument("--jig-duration", type=float, default=10)
+    parser.add_argument("--jig-rates", type=float, nargs="+", default=[1000, 5000])
+    args = parser.parse_args()
+
+    print(
+        f"{args.duration:.0f} s at {args.rate:.0f} samples/s, {args.frame_rate:.0f} frames/s:"
+    )
+    bench_frames(
+        args.rate,
+        args.duration,
+        args.frame_rate,
+        [10, 60, args.duration / 2, args.duration],
+    )
+
+    decimator = MinMaxDecimator(8)
+    rows = synthetic_rows(args.rate, args.duration)
+    start = time.perf_counter()
+    for block in np.array_split(rows, len(rows) // 100):
+        decimator.extend(block[:, 0], block[:, 1:9])
+    elapsed = time.perf_counter() - start
+    print(
+        f"Decimating in 100 row blocks: {elapsed / len(rows) * 1e9:.0f} ns/sample, "
+        f"{len(decimator)} bins of {decimator.bin_size} samples"
+    )
+
+    for rate in args.jig_rates:
+        print(f"test_run on the virtual jig at {rate:.0f} rows/s:")
+        for live_plot in (False, True):
+            bench_test_run(rate, args.jig_duration, live_plot)
@@ -0,0 +1,141 @@
+"""
+Benchmark the streaming monitor. test_run reads the virtual jig with a battery
+running flat, a motor cutting out and the load cell drifting injected, checking
+each is caught by the right rule, how long after the fault began, and that the
+jig stops on an abort. Every run under test_data is then replayed through the
+default monitor to check for false alarms and which runs get flagged, with
+the plan for the open_air runs, and the per-sample cost is timed at different
+block sizes, as well as the latency from a chunk coming off the port to its
+rows having been checked.
+
+"""
+from contextlib import redirect_stdout
+from collections import Counter
+from pathlib import Path
+import argparse
+import io
+import time
+import warnings
+import numpy as np
+
+from bench_virtual_jig import jig_process
+from dataset import load_runs
+from monitor import StreamMonitor
+from runner import TestPlan, TestStep, test_run
+from virtual_jig import JigModel
+
+
+DEFAULT_CORPUS = Path(__file__).parent.parent / "test_data"
+
+# Injected fault, the rule expected to catch it and when the fault starts (s)
+FAULTS = {
+    "none": (JigModel(), None, None),
+    "battery": (JigModel(capacity_Ah=0.01), "battery_sag", None),
+    "dropout": (JigModel(dropout_s=6, dropout_motor=1), "rpm_dropout", 6),
+    "drift": (JigModel(thrust_drift_N_per_s=0.3), "thrust_drift", None),
+}
+
+
+def bench_fault(name: str, model: JigModel, rule, start_s, rate: float) -> None:
+    plan = TestPlan(
+        "monitor",
+        [TestStep(duration_ms=5000, top_throttle=60, bottom_throttle=60)] * 3,
+    )
+    with jig_process(rate_hz=rate, baud=None, model=model) as (port, result):
+        with redirect_stdout(io.StringIO()):
+            data = test_run(
+                None, plan, port=port, binary=True, monitor=True, monitor_abort=True
+            )
+    events = data.attrs["monitor_events"]
+    stats = data.attrs["monitor_stats"]
+    latencies = np.array(stats["latencies_s"]) * 1e3
+    caught = [event for event in events if event["rule"] == rule]
+    line = f"  {name:>8}: "
+    if rule is None:
+        line += "no events" if not events else f"false alarm {events}"
+    elif not caught:
+        line += f"missed, events {events}"
+    else:
+        event = caught[0]
+        line += f"{rule} at {event['time_ms'] / 1e3:.2f} s"
+        if start_s is not None:
+            line += f" ({event['time_ms'] / 1e3 - start_s:.2f} s after the fault)"
+        if event["action"] == "abort":
+            line += f", last sample {data.index[-1] - event['time_ms']:.0f} ms later"
+        else:
+            line += f", ran to {data.index[-1] / 1e3:.1f} s"
+    print(line)
+    print(
+        f"            {stats['samples']} samples, "
+        f"{stats['process_s'] / stats['samples'] * 1e9:.0f} ns/sample, latency "
+        f"p50 {np.percentile(latencies, 50):.2f} ms / p99 {np.percentile(latencies, 99):.2f} ms"
+    )
+
+
+def replay(data, commands, block: int) -> StreamMonitor:
+    rows = data.reset_index().to_numpy(dtype=np.float64)
+    monitor = StreamMonitor(["time_ms", *data.columns], commands=commands)
+    # Nothing stops a replay, so any abort would count in stats.aborted
+    with redirect_stdout(io.StringIO()):
+        for start in range(0, len(rows), block):
+            monitor.process(rows[start : start + block])
+    return monitor
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the streaming monitor")
+    parser.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS)
+    parser.add_argument("--rate", type=float, default=1000)
+    args = parser.parse_args()
+
+    print(f"Injected faults on the virtual jig at {args.rate:.0f} rows/s:")
+    for name, (model, rule, start_s) in FAULTS.items():
+        bench_fault(name, model, rule, start_s, args.rate)
+
+    # The plan the open_air runs were recorded with
+    plan = TestPlan(
+        "test",
+        [
+            TestStep(bottom_throttle=i, top_throttle=i, duration_ms=2000)
+            for i in np.arange(5, 101, 5)
+        ],
+    )
+    commands = plan.compile()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        runs = load_runs(args.corpus)
+    print(f"Replaying {len(runs)} runs under {args.corpus}:")
+    directories: dict = {}
+    flagged = []
+    for run, data in runs.items():
+        directory = run.parts[0] if len(run.parts) > 1 else "."
+        # open_air/backup was recorded with other plans
+        planned = run.parent == Path("open_air")
+        monitor = replay(data, commands if planned else None, 50)
+        counts = directories.setdefault(directory, Counter())
+        counts["runs"] += 1
+        counts["aborted"] += monitor.stats.aborted
+        for rule in {event.rule for event in monitor.events}:
+            counts[rule] += 1
+        if monitor.events:
+            flagged.append((run, monitor.events))
+    for directory, counts in directories.items():
+        runs_in = counts.pop("runs")
+        rules = ", ".join(f"{n} {rule}" for rule, n in sorted(counts.items()) if n)
+        print(f"  {directory:>36}: {runs_in:3d} runs, {rules or 'no events'}")
+    print("Flagged runs:")
+    for run, events in flagged:
+        print(f"  {str(run)}:")
+        for event in events:
+            print(f"    {event.message} at {event.time_ms / 1e3:.1f} s")
+
+    data = max(runs.values(), key=len)
+    print(f"Per-sample cost over {len(data)} samples:")
+    for block in (1, 10, 100, 1000):
+        start = time.perf_counter()
+        stats = replay(data, commands, block).stats
+        elapsed = time.perf_counter() - start
+        print(
+            f"  {block:>5} row blocks: {stats.ns_per_sample:8.0f} ns/sample in the "
+            f"monitor, {elapsed / len(data) * 1e9:8.0f} ns/sample replaying"
+        )
@@ -0,0 +1,178 @@
+"""
+Benchmark test spec upload, line by line vs checksummed chunks, against the
+virtual jig's port of the firmware spec loader on a modelled serial link.
+Reports modelled link time and CPU time per 1k commands, with corrupted lines
+to exercise retransmission, then streams a plan several times the jig's
+capacity through a simulated test.
+
+"""
+from collections import deque
+from typing import List, Tuple
+import argparse
+import random
+import time
+import numpy as np
+
+from runner import TestPlan, TestStep
+from spec import CHUNKED_SPEC_REQUEST, SPEC_HEADER, SpecUploader
+from virtual_jig import SpecLoader
+
+
+class EmulatedJig:
+    """
+    The firmware's spec loader behind a modelled link: every byte takes 10 bits
+    at `baud`, replies arrive `latency` s after the line that caused them, and
+    command lines are corrupted with probability `corrupt_rate`. Without
+    `chunked` it answers like firmware that predates chunked specs.
+
+    """
+
+    def __init__(
+        self,
+        chunked: bool = True,
+        capacity: int = 2048,
+        baud: int = 921600,
+        latency: float = 0.001,
+        corrupt_rate: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        self.chunked = chunked
+        self.baud = baud
+        self.latency = latency
+        self.corrupt_rate = corrupt_rate
+        self.timeout = 0.1
+        self.now = 0.0
+        self.executed: List[Tuple] = []
+        self.loader = SpecLoader(self._reply, capacity=capacity)
+        self.loader.receive("Begin new test spec")
+        self.loader.receive(SPEC_HEADER.decode().strip())
+        self._rng = random.Random(seed)
+        self._rx = b""
+        self._tx: deque = deque()
+
+    @property
+    def spec(self) -> deque:
+        return self.loader.spec
+
+    def clock(self) -> float:
+        return self.now
+
+    def write(self, data: bytes) -> None:
+        self.now += len(data) * 10 / self.baud
+        *lines, self._rx = (self._rx + data).split(b"\n")
+        for line in lines:
+            line = line.decode()
+            if line == CHUNKED_SPEC_REQUEST.decode().strip() and not self.chunked:
+                self._reply(f"Invalid command: {line}")
+            else:
+                self.loader.receive(self._corrupt(line))
+
+    def readline(self) -> bytes:
+        if not self._tx:
+            self.now += self.timeout
+            return b""
+        ready, line = self._tx.popleft()
+        self.now = max(self.now, ready)
+        return line
+
+    def replies(self) -> List[str]:
+        ready = []
+        while self._tx and self._tx[0][0] <= self.now:
+            ready.append(self._tx.popleft()[1].decode())
+        return ready
+
+    def _reply(self, text: str) -> None:
+        self._tx.append((self.now + self.latency, f"{text}\n".encode()))
+
+    def _corrupt(self, line: str) -> str:
+        if not line[:1].isdigit() or self._rng.random() >= self.corrupt_rate:
+            return line
+        i = self._rng.randrange(len(line))
+        return line[:i] + self._rng.choice("0123456789") + line[i + 1 :]
+
+    def pop(self) -> None:
+        self.executed.append(self.spec[0])
+        self.loader.pop()
+
+
+def expected_spec(commands: np.ndarray) -> List[Tuple]:
+    return [
+        (int(t), top, bottom, round(pitch), round(roll))
+        for t, _, top, bottom, pitch, roll in commands.tolist()
+    ]
+
+
+def make_plan(num_commands: int) -> TestPlan:
+    steps = [
+        TestStep(duration_ms=20, top_throttle=(i % 600) / 10, bottom_throttle=i % 60)
+        for i in range(num_commands - 1)
+    ]
+    return TestPlan("bench", steps)
+
+
+def upload(plan: TestPlan, jig: EmulatedJig, **kwargs) -> SpecUploader:
+    commands = plan.compile(teardown=False)
+    uploader = SpecUploader(jig, commands, clock=jig.clock, **kwargs)
+    uploader.negotiate()
+    start = time.process_time()
+    uploader.upload()
+    cpu_s = time.process_time() - start
+    stats = uploader.stats
+    uploaded = stats.preloaded_commands
+    assert list(jig.spec) == expected_spec(commands)[:uploaded], "Spec differs"
+    print(
+        f"  {stats.summary()}, "
+        f"{cpu_s * 1e6 / uploaded:.1f} ms CPU per 1k commands with the emulated jig"
+    )
+    return uploader
+
+
+def stream(plan: TestPlan, jig: EmulatedJig) -> None:
+    uploader = upload(plan, jig)
+    commands = plan.compile(teardown=False)
+    start = jig.now
+    low_water = len(jig.spec)
+    for command in commands[1:]:
+        # The firmware moves on to each command at its start time
+        jig.now = max(jig.now, start + command["time_ms"] / 1000)
+        jig.pop()
+        for line in jig.replies():
+            uploader.handle_line(line)
+        uploader.pump(jig.now)
+        if not jig.loader.spec_complete:
+            low_water = min(low_water, len(jig.spec))
+        if len(jig.spec) <= 1 and not jig.loader.spec_complete:
+            uploader.stats.underrun = True
+            break
+    assert uploader.stats.underrun or jig.executed + list(jig.spec) == expected_spec(
+        commands
+    )
+    print(
+        f"  {uploader.stats.summary()}, spec low water {low_water} commands while streaming"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark test spec upload")
+    parser.add_argument("--commands", type=int, default=2000)
+    parser.add_argument("--capacity", type=int, default=2048)
+    parser.add_argument("--latency", type=float, default=0.002)
+    parser.add_argument("--corrupt-rate", type=float, default=0.01)
+    args = parser.parse_args()
+
+    plan = make_plan(args.commands)
+    start = time.perf_counter()
+    plan.compile()
+    print(
+        f"Compiled {args.commands} commands in {(time.perf_counter() - start) * 1e3:.1f} ms"
+    )
+    jig_kwargs = dict(capacity=args.capacity, latency=args.latency)
+    print("Line by line, no acknowledgement:")
+    upload(plan, EmulatedJig(chunked=False, **jig_kwargs))
+    for window in (1, 2, 4):
+        print(f"Chunked, window {window}:")
+        upload(plan, EmulatedJig(**jig_kwargs), window=window)
+    print(f"Chunked, window 2, {args.corrupt_rate:.1%} of lines corrupted:")
+    upload(plan, EmulatedJig(corrupt_rate=args.corrupt_rate, **jig_kwargs))
+    print(f"Streaming {5 * args.capacity} commands through a {args.capacity} spec:")
+    stream(make_plan(5 * args.capacity), EmulatedJig(**jig_kwargs))
@@ -0,0 +1,116 @@
+"""
+Benchmark steady state extraction over the coaxial runs against the notebook
+approach of slicing every settled window out of the concatenated runs with
+.loc and grouping the result, checking both give the same step means. Then
+times steady_state_runs over the directory cold (runs analysed in a process
+pool) and warm (cached results only).
+
+"""
+from pathlib import Path
+import argparse
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+from dataset import load_runs
+from runner import TestPlan, TestStep
+from steady_state import steady_state, steady_state_runs
+
+
+DEFAULT_CORPUS = Path(__file__).parent.parent / "test_data" / "coaxial"
+
+
+def notebook_steps(
+    runs: dict, step_range: np.ndarray, step_duration_ms: int, settle_ms: int
+) -> pd.DataFrame:
+    df_all = pd.concat(runs.values(), keys=list(runs), names=["test_name"])
+    step_start_times = np.arange(len(step_range)) * step_duration_ms
+    return (
+        pd.concat(
+            [
+                df_all.loc[
+                    (
+                        slice(None),
+                        slice(t_start + settle_ms, t_start + step_duration_ms),
+                    ),
+                    :,
+                ]
+                for t_start in step_start_times
+            ],
+            keys=step_range,
+            names=["throttle"],
+        )
+        .groupby(["test_name", "throttle"])
+        .agg(["mean", "std"])
+    )
+
+
+def timed(name: str, fcn, repeat: int = 1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fcn()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{name:>34}: {elapsed * 1e3:8.1f} ms")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark steady state extraction")
+    parser.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS)
+    parser.add_argument("--step-ms", type=int, default=10_000)
+    parser.add_argument("--settle-ms", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # The plan the coaxial runs were recorded with
+    step_range = np.arange(30, 101, 10)
+    plan = TestPlan(
+        "test",
+        [
+            TestStep(bottom_throttle=i, top_throttle=i, duration_ms=args.step_ms)
+            for i in step_range
+        ],
+    )
+    commands = plan.compile()
+    runs = {str(run): data for run, data in load_runs(args.corpus).items()}
+    rows = sum(len(data) for data in runs.values())
+    print(f"{len(runs)} runs, {rows} samples under {args.corpus}")
+
+    expected = timed(
+        "notebook .loc slices + groupby",
+        lambda: notebook_steps(runs, step_range, args.step_ms, args.settle_ms),
+        args.repeat,
+    )
+    steps = timed(
+        "steady_state per run",
+        lambda: {
+            run: steady_state(data, commands, args.settle_ms)
+            for run, data in runs.items()
+        },
+        args.repeat,
+    )
+    worst = 0.0
+    for run, run_steps in steps.items():
+        for channel in runs[run].columns:
+            for stat in ("mean", "std"):
+                got = run_steps[f"{channel}_{stat}"].to_numpy()
+                want = expected[channel][stat].loc[run].to_numpy()
+                scale = np.maximum(np.abs(want), 1e-3)
+                worst = max(worst, float(np.nanmax(np.abs(got - want) / scale)))
+    print(f"{'max relative difference':>34}: {worst:.2e}")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        timed(
+            "steady_state_runs, cold",
+            lambda: steady_state_runs(
+                args.corpus, commands, args.settle_ms, cache_dir=Path(cache_dir)
+            ),
+        )
+        timed(
+            "steady_state_runs, warm",
+            lambda: steady_state_runs(
+                args.corpus, commands, args.settle_ms, cache_dir=Path(cache_dir)
+            ),
+            args.repeat,
+        )
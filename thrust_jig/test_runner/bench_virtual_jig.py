@@ -0,0 +1,177 @@
+"""
+Load benchmark for the host readers against the virtual jig. test_run (CSV and
+binary streams) and python_client's run_experiment are fed at increasing row
+rates with an unlimited link, then as fast as they take rows, reporting the
+rows/s they sustain (no more than --max-loss lost), the fraction of rows lost
+and host CPU per row. A run with malformed rows checks that every one of them
+is rejected. The jig runs in its own process so the CPU figures are the host's
+alone.
+
+"""
+from contextlib import contextmanager, redirect_stdout
+from pathlib import Path
+from typing import Iterator, Optional
+import argparse
+import _thread
+import io
+import multiprocessing
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+from runner import TestPlan, TestStep, test_run
+from virtual_jig import VirtualJig, load_replay_rows
+
+CLIENT_DIR = Path(__file__).parent.parent / "python_client"
+sys.path.append(str(CLIENT_DIR))
+
+
+def serve(conn, kwargs: dict) -> None:
+    with VirtualJig(**kwargs) as jig:
+        conn.send(jig.port)
+        conn.recv()
+    conn.send(jig.stats)
+
+
+@contextmanager
+def jig_process(**kwargs) -> Iterator[tuple]:
+    conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=serve, args=(child_conn, kwargs))
+    process.start()
+    result = {}
+    try:
+        yield conn.recv(), result
+    finally:
+        conn.send(None)
+        result["jig"] = conn.recv()
+        process.join()
+
+
+def cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def plan_for(duration_s: float) -> TestPlan:
+    steps = [
+        TestStep(duration_ms=100, top_throttle=t % 40, bottom_throttle=t % 40)
+        for t in range(int(duration_s * 10))
+    ]
+    return TestPlan("bench", steps)
+
+
+def report(
+    name: str,
+    rate: Optional[float],
+    lost: float,
+    received: int,
+    elapsed: float,
+    cpu: float,
+    extra: str = "",
+) -> float:
+    requested = f"{rate:>7.0f}/s" if rate else "saturate"
+    print(
+        f"{name:>10} {requested}: {received / elapsed:8.0f} rows/s received, "
+        f"{lost:6.2%} lost, {cpu / max(received, 1) * 1e6:6.1f} us CPU/row{extra}"
+    )
+    return lost
+
+
+def bench_test_run(
+    binary: bool, rate: Optional[float], duration_s: float, **jig_kwargs
+) -> tuple:
+    with jig_process(rate_hz=rate, baud=None, **jig_kwargs) as (port, result):
+        start, cpu = time.perf_counter(), cpu_time()
+        with redirect_stdout(io.StringIO()):
+            data = test_run(None, plan_for(duration_s), port=port, binary=binary)
+        elapsed, cpu = time.perf_counter() - start, cpu_time() - cpu
+    acquisition = data.attrs["acquisition_stats"]
+    return result["jig"], acquisition, len(data), acquisition["duration_s"], cpu
+
+
+def bench_client(rate: Optional[float], duration_s: float) -> tuple:
+    from client import run_experiment
+    from writer import read_binary
+
+    with jig_process(rate_hz=rate, baud=None, protocol="client") as (
+        port,
+        result,
+    ), tempfile.TemporaryDirectory() as out_dir:
+        timer = threading.Timer(duration_s, _thread.interrupt_main)
+        start, cpu = time.perf_counter(), cpu_time()
+        timer.start()
+        with redirect_stdout(io.StringIO()):
+            run_experiment(
+                port,
+                Path(out_dir),
+                CLIENT_DIR / "config.yml",
+                formats=("bin",),
+                display_rate=0,
+            )
+        elapsed, cpu = time.perf_counter() - start, cpu_time() - cpu
+        received = sum(len(read_binary(path)) for path in Path(out_dir).glob("*.bin"))
+    return result["jig"], received, elapsed, cpu
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark host readers against the virtual jig"
+    )
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument(
+        "--rates", type=float, nargs="+", default=[1000, 5000, 20000, 50000]
+    )
+    parser.add_argument("--malformed-rate", type=float, default=0.01)
+    parser.add_argument(
+        "--replay", type=Path, help="Recorded test CSV to replay instead of the model"
+    )
+    parser.add_argument("--max-loss", type=float, default=0.001)
+    args = parser.parse_args()
+    replay = load_replay_rows(args.replay) if args.replay else None
+
+    for binary in (False, True):
+        name = "binary" if binary else "csv"
+        sustained = 0.0
+        for rate in [*args.rates, None]:
+            jig, acquisition, received, elapsed, cpu = bench_test_run(
+                binary, rate, args.duration, replay=replay
+            )
+            lost = report(
+                name,
+                rate,
+                1 - received / jig.rows_sent,
+                received,
+                elapsed,
+                cpu,
+                f", {jig.dropped_bytes} B dropped by the link",
+            )
+            if rate is not None and lost <= args.max_loss:
+                sustained = max(sustained, received / elapsed)
+        print(f"{name:>10} max sustained: {sustained:.0f} rows/s")
+        jig, acquisition, received, elapsed, cpu = bench_test_run(
+            binary,
+            1000,
+            args.duration,
+            replay=replay,
+            malformed_rate=args.malformed_rate,
+        )
+        rejected = acquisition["bad_frames"] if binary else acquisition["invalid_lines"]
+        print(
+            f"{name:>10} malformed: {jig.malformed_lines} injected, {rejected} rejected, "
+            f"{jig.rows_sent - jig.malformed_lines - received} good rows lost"
+        )
+
+    sustained = 0.0
+    for rate in [*args.rates, None]:
+        jig, received, elapsed, cpu = bench_client(rate, args.duration)
+        # The board streams from boot, so count the bytes the link dropped rather
+        # than rows sent before the port was opened or after it was closed
+        lost = jig.dropped_bytes / jig.bytes_sent
+        if (
+            report("client", rate, lost, received, elapsed, cpu) <= args.max_loss
+            and rate
+        ):
+            sustained = max(sustained, received / elapsed)
+    print(f"{'client':>10} max sustained: {sustained:.0f} rows/s")
@@ -0,0 +1,295 @@
+from typing import Dict, List, Sequence, Set
+from contextlib import redirect_stdout
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+import json
+import multiprocessing
+import os
+import queue
+import re
+import signal
+import time
+
+from runner import TestPlan, test_run
+
+
+@dataclass(frozen=True)
+class CampaignJob:
+    plan: TestPlan
+    output: Path
+    repeats: int = 1
+
+    def outputs(self) -> List[Path]:
+        """
+        One file per repeat, numbered like the test_data runs: a job writing
+        coaxial/test_0mm_pb.csv three times makes test_0mm_pb_0.csv to _2.csv.
+
+        """
+        output = Path(self.output)
+        return [
+            output.with_name(f"{output.stem}_{i}{output.suffix}")
+            for i in range(self.repeats)
+        ]
+
+
+@dataclass
+class RunResult:
+    output: str
+    port: str
+    status: str  # "done" or "failed"
+    start: float
+    duration_s: float
+    samples: int = 0
+    error: str = ""
+
+
+@dataclass
+class JigStats:
+    runs: int = 0
+    failures: int = 0
+    busy_s: float = 0.0
+    samples: int = 0
+    retired: bool = False
+
+    def summary(self, wall_s: float) -> str:
+        utilization = self.busy_s / wall_s if wall_s > 0 else 0.0
+        runs_per_hour = self.runs * 3600 / wall_s if wall_s > 0 else 0.0
+        samples_per_s = self.samples / self.busy_s if self.busy_s > 0 else 0.0
+        return (
+            f"{self.runs} runs ({runs_per_hour:.1f}/h), {self.failures} failed, "
+            f"{utilization:.0%} busy, {samples_per_s:.0f} samples/s while running"
+            + (", retired" if self.retired else "")
+        )
+
+
+@dataclass
+class CampaignStats:
+    runs: int = 0
+    skipped: int = 0
+    completed: int = 0
+    failed: int = 0
+    remaining: int = 0
+    wall_s: float = 0.0
+    jigs: Dict[str, JigStats] = field(default_factory=dict)
+
+    def summary(self) -> str:
+        lines = [
+            f"{self.runs} runs: {self.skipped} already done, {self.completed} completed, "
+            f"{self.failed} failed attempts, {self.remaining} left in {self.wall_s:.1f} s"
+        ]
+        for port, jig in self.jigs.items():
+            lines.append(f"  {port}: {jig.summary(self.wall_s)}")
+        return "\n".join(lines)
+
+
+def read_state(state_path: Path) -> Dict[str, RunResult]:
+    """
+    Latest result for every run in a campaign state file, tolerating a final
+    line cut short by a crash.
+
+    """
+    results: Dict[str, RunResult] = {}
+    if not Path(state_path).exists():
+        return results
+    with open(state_path) as state_file:
+        for line in state_file:
+            try:
+                result = RunResult(**json.loads(line))
+            except (json.JSONDecodeError, TypeError):
+                continue
+            results[result.output] = result
+    return results
+
+
+def completed_outputs(state_path: Path) -> Set[str]:
+    return {
+        output
+        for output, result in read_state(state_path).items()
+        if result.status == "done" and Path(output).exists()
+    }
+
+
+def _log_name(port: str) -> str:
+    return re.sub(r"[^\w.-]", "_", port.strip("/")) + ".log"
+
+
+def _worker(
+    port: str,
+    runs: multiprocessing.Queue,
+    results: multiprocessing.Queue,
+    log_path: Path,
+    max_consecutive_failures: int,
+    run_kwargs: dict,
+) -> None:
+    consecutive_failures = 0
+    interrupted = []
+
+    def interrupt(signum, frame):
+        # test_run stops the jig on the first interrupt, don't break that off
+        if not interrupted:
+            interrupted.append(signum)
+            raise KeyboardInterrupt
+
+    signal.signal(signal.SIGINT, interrupt)
+    with open(log_path, "a") as log, redirect_stdout(log):
+        while not interrupted and (item := runs.get()) is not None:
+            plan, output = item
+            output = Path(output)
+            partial = output.with_name(f"{output.stem}.partial{output.suffix}")
+            partial.unlink(missing_ok=True)
+            output.parent.mkdir(parents=True, exist_ok=True)
+            print(f"=== {output} on {port} ===", flush=True)
+            start = time.time()
+            try:
+                data = test_run(partial, plan, port=port, **run_kwargs)
+                if interrupted:
+                    # Cut short, leave the .partial file to be redone on resume
+                    break
+                # test_run only warns when saving fails, so this raises then
+                os.replace(partial, output)
+                result = RunResult(
+                    str(output), port, "done", start, time.time() - start, len(data)
+                )
+                consecutive_failures = 0
+            except KeyboardInterrupt:
+                break
+            except Exception as e:
+                result = RunResult(
+                    str(output),
+                    port,
+                    "failed",
+                    start,
+                    time.time() - start,
+                    error=repr(e),
+                )
+                consecutive_failures += 1
+            log.flush()
+            results.put(result)
+            if consecutive_failures >= max_consecutive_failures:
+                # Probably a disconnected or broken jig, leave the rest to the others
+                break
+    results.put(port)
+
+
+def _join_workers(workers: List[multiprocessing.Process]) -> None:
+    for worker in workers:
+        worker.join(timeout=5.0)
+        if worker.is_alive():
+            worker.terminate()
+
+
+def run_campaign(
+    jobs: Sequence[CampaignJob],
+    ports: Sequence[str],
+    state_path: Path,
+    retries: int = 1,
+    max_consecutive_failures: int = 3,
+    **run_kwargs,
+) -> CampaignStats:
+    """
+    Run every repeat of every job across the jigs on `ports` at once.
+
+    Each port gets a worker process that takes the next pending run from a
+    shared queue as soon as its jig is free, so faster jigs or shorter plans
+    don't hold the others up. Results are appended to the JSON lines file at
+    `state_path` as they finish, and runs already recorded as done (with their
+    output still there) are skipped, so an interrupted campaign picks up where
+    it stopped. Runs are saved under a temporary name and renamed when
+    complete. A failed run is queued again up to `retries` times, and a worker
+    whose jig fails `max_consecutive_failures` runs in a row stops taking runs.
+    Worker output goes to one log per port next to the state file. On Ctrl+C
+    every jig is stopped before the interrupt is passed on.
+    `run_kwargs` are passed on to test_run.
+
+    """
+    state_path = Path(state_path)
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    done = completed_outputs(state_path)
+    pending = [
+        (job.plan, str(output))
+        for job in jobs
+        for output in job.outputs()
+        if str(output) not in done
+    ]
+    stats = CampaignStats(
+        runs=sum(job.repeats for job in jobs),
+        jigs={port: JigStats() for port in ports},
+    )
+    stats.skipped = stats.runs - len(pending)
+    if not pending:
+        return stats
+
+    runs: multiprocessing.Queue = multiprocessing.Queue()
+    results: multiprocessing.Queue = multiprocessing.Queue()
+    for run in pending:
+        runs.put(run)
+    plans = {output: plan for plan, output in pending}
+    attempts = {output: 0 for _, output in pending}
+    workers = [
+        multiprocessing.Process(
+            target=_worker,
+            args=(
+                port,
+                runs,
+                results,
+                state_path.parent / _log_name(port),
+                max_consecutive_failures,
+                run_kwargs,
+            ),
+            daemon=True,
+        )
+        for port in ports
+    ]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+
+    outstanding = len(pending)
+    active = len(workers)
+    try:
+        with open(state_path, "a") as state_file:
+            while outstanding > 0 and active > 0:
+                try:
+                    result = results.get(timeout=1.0)
+                except queue.Empty:
+                    active = sum(worker.is_alive() for worker in workers)
+                    continue
+                if isinstance(result, str):
+                    stats.jigs[result].retired = True
+                    active -= 1
+                    continue
+                state_file.write(json.dumps(asdict(result)) + "\n")
+                state_file.flush()
+                jig = stats.jigs[result.port]
+                jig.busy_s += result.duration_s
+                attempts[result.output] += 1
+                if result.status == "done":
+                    jig.runs += 1
+                    jig.samples += result.samples
+                    stats.completed += 1
+                    outstanding -= 1
+                else:
+                    jig.failures += 1
+                    stats.failed += 1
+                    if attempts[result.output] <= retries:
+                        runs.put((plans[result.output], result.output))
+                    else:
+                        outstanding -= 1
+                print(
+                    f"{result.output}: {result.status} on {result.port} "
+                    f"in {result.duration_s:.1f} s {result.error}".rstrip()
+                )
+    except KeyboardInterrupt:
+        # Let each worker's test_run stop its jig before giving up on it
+        for worker in workers:
+            if worker.is_alive():
+                os.kill(worker.pid, signal.SIGINT)
+        _join_workers(workers)
+        raise
+
+    for _ in workers:
+        runs.put(None)
+    _join_workers(workers)
+    stats.wall_s = time.time() - start
+    stats.remaining = stats.runs - stats.skipped - stats.completed
+    return stats
@@ -0,0 +1,43 @@
+import numpy as np
+
+
+INDEX_MAP = {
+    "time_ms": 0,
+    "top_motor_rpm": 1,
+    "bottom_motor_rpm": 2,
+    "batt_voltage_V": 3,
+    "batt_current_A": 4,
+    "top_current_A": 5,
+    "bottom_current_A": 6,
+    "thrust_N": 7,
+    "torque_N": 8,
+}
+CONVERSION_MAP = {
+    "time_ms": lambda x: x / 1000,  # Convert to ms
+    "top_motor_rpm": lambda x: x,
+    "bottom_motor_rpm": lambda x: x,
+    "batt_voltage_V": lambda x: x,
+    "batt_current_A": lambda x: x,
+    "top_current_A": lambda x: x,
+    "bottom_current_A": lambda x: x,
+    "thrust_N": lambda x: x,
+    "torque_N": lambda x: x,
+}
+LABEL_MAP = {
+    "time_ms": "Time (ms)",
+    "top_motor_rpm": "Top Motor Speed (rpm)",
+    "bottom_motor_rpm": "Bottom Motor Speed (rpm)",
+    "batt_voltage_V": "Battery Voltage (V)",
+    "batt_current_A": "Battery Current (A)",
+    "top_current_A": "Top Motor Current (A)",
+    "bottom_current_A": "Bottom Motor Current (A)",
+    "thrust_N": "Thrust (N)",
+    "torque_N": "Torque (N)",
+}
+INV_LABEL_MAP = {v: k for k, v in LABEL_MAP.items()}
+
+
+def convert_rows(rows: np.ndarray) -> np.ndarray:
+    for datapoint_key, datapoint_idx in INDEX_MAP.items():
+        rows[:, datapoint_idx] = CONVERSION_MAP[datapoint_key](rows[:, datapoint_idx])
+    return rows
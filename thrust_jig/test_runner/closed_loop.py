@@ -0,0 +1,274 @@
+from typing import Callable, List, Optional, Sequence
+from dataclasses import dataclass, field
+import re
+import time
+import numpy as np
+
+from monitor import EmaFilter
+from spec import TEARDOWN_STEP_MS
+
+
+# Must match receiveThrottleLine in thrust_jig_fw/src/main.cpp
+THROTTLE_COMMAND = "Throttle {sample_us:d} {top:.2f} {bottom:.2f}\n"
+THROTTLE_OFF = b"Throttle off\n"
+THROTTLE_ACK = re.compile(r"^Throttle (\d+) (\d+)$")
+THROTTLE_TIMEOUT_MS = 100
+SETPOINT_DTYPE = np.dtype(
+    [("thrust_N", "<f8"), ("balance_rpm", "?"), ("teardown", "?")]
+)
+
+
+def compile_setpoints(steps: Sequence, commands: np.ndarray) -> np.ndarray:
+    """
+    Setpoints of each command of `commands` (compiled from `steps`): the
+    target thrust, NaN for none, whether to balance the motors' RPM, and
+    whether the command is part of the teardown. Unlike throttles, setpoints
+    only last for their own step, so the teardown runs open loop.
+
+    """
+    setpoints = np.zeros(len(commands), dtype=SETPOINT_DTYPE)
+    setpoints["thrust_N"] = np.nan
+    for i, step in enumerate(steps, start=1):
+        if step.target_thrust_N is not None:
+            setpoints["thrust_N"][i] = step.target_thrust_N
+        setpoints["balance_rpm"][i] = step.balance_rpm
+    setpoints["teardown"][len(steps) + 1 :] = True
+    return setpoints
+
+
+@dataclass
+class ClosedLoopStats:
+    updates: int = 0
+    acks: int = 0
+    stale_blocks: int = 0
+    over_budget: int = 0
+    aborted: bool = False
+    latencies_ms: List[float] = field(default_factory=list, repr=False)
+    host_latencies_ms: List[float] = field(default_factory=list, repr=False)
+
+    def summary(self) -> str:
+        if not self.latencies_ms:
+            return f"{self.updates} throttle updates, none acknowledged"
+        latency = np.array(self.latencies_ms)
+        host = np.array(self.host_latencies_ms) if self.host_latencies_ms else [0.0]
+        return (
+            f"{self.updates} throttle updates, {self.acks} acknowledged, "
+            f"sample to applied p50 {np.percentile(latency, 50):.2f} ms / "
+            f"p99 {np.percentile(latency, 99):.2f} ms / max {latency.max():.2f} ms "
+            f"(host p99 {np.percentile(host, 99):.2f} ms), "
+            f"{self.over_budget} over budget, {self.stale_blocks} stale blocks skipped"
+            + (", aborted" if self.aborted else "")
+        )
+
+
+class SetpointController:
+    """
+    Closed loop throttle for the plan steps with a target thrust or balanced
+    motors, run by the host on every block of samples as test_run reads them.
+
+    A PI loop on `thrust_column` moves both throttles together from the step's
+    own throttles, and with `balance_rpm` a second PI loop splits them to
+    bring the top and bottom RPM together, cancelling the reaction torque.
+    Measurements go through an EMA of `filter_ms` first. Every update is sent
+    to the jig as a "Throttle" command tagged with the timestamp of the sample
+    it was worked out from, and the jig's reply of when it applied it gives the
+    loop's end to end latency on the jig's own clock. Steps without setpoints
+    are handed back to the spec with "Throttle off", except the teardown after
+    a closed loop step: the loop keeps the throttles and ramps them down from
+    where it left them at the teardown's 1 % per 20 ms, rather than jumping to
+    the plan's throttles.
+
+    Blocks that already waited longer than `latency_budget_ms` on the host are
+    skipped rather than acted on late, and the test is stopped if
+    `max_over_budget` blocks in a row are skipped or take longer than the
+    budget end to end, as the loop can't be trusted to hold the jig then. With many samples in a
+    block only the last one is acted on, after the filters and integrators
+    have taken in the rest.
+
+    """
+
+    def __init__(
+        self,
+        columns: Sequence[str],
+        commands: np.ndarray,
+        setpoints: np.ndarray,
+        write: Optional[Callable[[bytes], object]] = None,
+        thrust_kp: float = 3.0,
+        thrust_ki: float = 20.0,
+        balance_kp: float = 0.005,
+        balance_ki: float = 0.03,
+        filter_ms: float = 10.0,
+        latency_budget_ms: float = 20.0,
+        max_over_budget: int = 20,
+        max_throttle: float = 100.0,
+        time_column: str = "time_ms",
+        thrust_column: str = "thrust_N",
+        rpm_columns: Sequence[str] = ("top_motor_rpm", "bottom_motor_rpm"),
+    ) -> None:
+        self.columns = list(columns)
+        self.commands = commands
+        self.setpoints = setpoints
+        self.write = write
+        self.thrust_kp = thrust_kp
+        self.thrust_ki = thrust_ki
+        self.balance_kp = balance_kp
+        self.balance_ki = balance_ki
+        self.filter_ms = filter_ms
+        self.latency_budget_ms = latency_budget_ms
+        self.max_over_budget = max_over_budget
+        self.max_throttle = max_throttle
+        self.stats = ClosedLoopStats()
+        # Time, top and bottom throttle of every update sent
+        self.history: List[tuple] = []
+        self._idx = [
+            self.columns.index(name)
+            for name in (time_column, thrust_column, *rpm_columns)
+        ]
+        self._start = commands["time_ms"].astype(np.float64)
+        teardown = np.flatnonzero(setpoints["teardown"])
+        self._teardown_ms = self._start[teardown[0]] if len(teardown) else np.inf
+        # Throttles the loop left off at when the teardown began
+        self._teardown_from: Optional[tuple] = None
+        self._filter: Optional[EmaFilter] = None
+        self._thrust_integral = 0.0
+        self._balance_integral = 0.0
+        self._active = False
+        self._last_ms: Optional[float] = None
+        self._over_budget_run = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(
+            np.any(~np.isnan(self.setpoints["thrust_N"]))
+            or np.any(self.setpoints["balance_rpm"])
+        )
+
+    def _send(self, data: bytes) -> None:
+        if self.write is not None:
+            self.write(data)
+
+    def _measure(self, rows: np.ndarray) -> np.ndarray:
+        values = rows[:, self._idx]
+        if self._filter is None:
+            period = np.median(np.diff(values[:, 0])) if len(values) > 1 else 1.0
+            samples = max(self.filter_ms / max(period, 1e-3), 1.0)
+            self._filter = EmaFilter(
+                np.full(values.shape[1] - 1, 1 - np.exp(-1 / samples))
+            )
+        return self._filter(values[:, 1:])
+
+    def process(self, rows: np.ndarray, received: Optional[float] = None) -> None:
+        """
+        Update the throttles from a block of converted rows. `received` is the
+        time.perf_counter() the rows came off the port.
+
+        """
+        if self.stats.aborted or len(rows) == 0:
+            return
+        measured = self._measure(rows)
+        time_ms = float(rows[-1, self._idx[0]])
+        command = max(int(np.searchsorted(self._start, time_ms, side="right")) - 1, 0)
+        target = self.setpoints["thrust_N"][command]
+        balance = bool(self.setpoints["balance_rpm"][command])
+        if self.setpoints["teardown"][command] and self._active:
+            self._ramp_down(time_ms, received)
+            return
+        if np.isnan(target) and not balance:
+            if self._active:
+                self._send(THROTTLE_OFF)
+                self._active = False
+            return
+        if received is not None and (time.perf_counter() - received) * 1e3 > (
+            self.latency_budget_ms
+        ):
+            self.stats.stale_blocks += 1
+            self._count_over_budget(True)
+            return
+
+        if not self._active:
+            # Integrators start over whenever the loop takes over from the spec
+            self._thrust_integral = self._balance_integral = 0.0
+            self._last_ms = None
+        dt = 0.0 if self._last_ms is None else (time_ms - self._last_ms) / 1000
+        self._last_ms = time_ms
+        thrust, top_rpm, bottom_rpm = measured[-1]
+        top = float(self.commands["top_throttle"][command])
+        bottom = float(self.commands["bottom_throttle"][command])
+        if not np.isnan(target):
+            error = target - thrust
+            collective = self.thrust_kp * error + self.thrust_ki * (
+                self._thrust_integral + error * dt
+            )
+            # Hold the integrator while the throttle is pinned at either end
+            if 0 < max(top, bottom) + collective < self.max_throttle:
+                self._thrust_integral += error * dt
+            top += collective
+            bottom += collective
+        if balance:
+            # The slower motor gets more throttle and the faster one less
+            error = bottom_rpm - top_rpm
+            split = self.balance_kp * error + self.balance_ki * (
+                self._balance_integral + error * dt
+            )
+            if abs(split) < self.max_throttle:
+                self._balance_integral += error * dt
+            top += split / 2
+            bottom -= split / 2
+        top = float(np.clip(top, 0, self.max_throttle))
+        bottom = float(np.clip(bottom, 0, self.max_throttle))
+
+        self._send(
+            THROTTLE_COMMAND.format(
+                sample_us=int(round(time_ms * 1000)), top=top, bottom=bottom
+            ).encode()
+        )
+        self._active = True
+        self.stats.updates += 1
+        self.history.append((time_ms, top, bottom))
+        if received is not None:
+            self.stats.host_latencies_ms.append((time.perf_counter() - received) * 1e3)
+
+    def _ramp_down(self, time_ms: float, received: Optional[float]) -> None:
+        if self._teardown_from is None:
+            _, top, bottom = self.history[-1]
+            self._teardown_from = (top, bottom)
+        # Same steps as the spec's teardown, the first one 1 % down
+        k = np.floor((time_ms - self._teardown_ms) / TEARDOWN_STEP_MS) + 1
+        top, bottom = (max(0.0, throttle - k) for throttle in self._teardown_from)
+        self._send(
+            THROTTLE_COMMAND.format(
+                sample_us=int(round(time_ms * 1000)), top=top, bottom=bottom
+            ).encode()
+        )
+        self.stats.updates += 1
+        self.history.append((time_ms, top, bottom))
+        if received is not None:
+            self.stats.host_latencies_ms.append((time.perf_counter() - received) * 1e3)
+
+    def handle_line(self, line: str) -> bool:
+        """
+        Take a throttle acknowledgement from the jig. Returns whether the line
+        was one.
+
+        """
+        match = THROTTLE_ACK.match(line.strip())
+        if not match:
+            return False
+        sample_us, applied_us = int(match.group(1)), int(match.group(2))
+        latency_ms = (applied_us - sample_us) / 1000
+        self.stats.acks += 1
+        self.stats.latencies_ms.append(latency_ms)
+        if latency_ms > self.latency_budget_ms:
+            self.stats.over_budget += 1
+        self._count_over_budget(latency_ms > self.latency_budget_ms)
+        return True
+
+    def _count_over_budget(self, over: bool) -> None:
+        self._over_budget_run = self._over_budget_run + 1 if over else 0
+        if self._over_budget_run >= self.max_over_budget and not self.stats.aborted:
+            print(
+                f"Closed loop latency over {self.latency_budget_ms:.1f} ms for "
+                f"{self._over_budget_run} updates, stopping jig"
+            )
+            self.stats.aborted = True
+            self._send(b"Stop\n")
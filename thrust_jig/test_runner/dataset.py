@@ -0,0 +1,165 @@
+from typing import Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from os import PathLike
+import hashlib
+import os
+import shutil
+import tempfile
+import warnings
+import numpy as np
+import pandas as pd
+
+from channels import INV_LABEL_MAP, LABEL_MAP
+
+
+CACHE_DIR = Path(__file__).parent / ".dataset_cache"
+INDEX_LABEL = LABEL_MAP["time_ms"]
+INVALID_MARKER = "invalid.txt"
+
+
+def cache_path(filename: str | PathLike[str], cache_dir: Path = CACHE_DIR) -> Path:
+    """
+    Cache directory for a run, keyed by its source path, mtime and size so an
+    edited or replaced CSV is converted again.
+
+    """
+    source = Path(filename).resolve()
+    stat = source.stat()
+    key = f"{source}:{stat.st_mtime_ns}:{stat.st_size}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return cache_dir / f"{source.stem}-{digest}"
+
+
+def read_run_csv(filename: str | PathLike[str]) -> pd.DataFrame:
+    """
+    Parse a test run CSV as saved by `test_run`.
+
+    """
+    header = pd.read_csv(filename, nrows=0).columns
+    if INDEX_LABEL not in header or not set(header) <= set(LABEL_MAP.values()):
+        raise ValueError(f"{filename} is not a test run CSV")
+    return (
+        pd.read_csv(filename, index_col=INDEX_LABEL, engine="c", dtype=np.float64)
+        .rename(columns=INV_LABEL_MAP)
+        .rename_axis("time_ms")
+    )
+
+
+def _write_cache(data: pd.DataFrame, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write into a temporary directory and rename so concurrent loaders never
+    # see a partial cache
+    tmp = Path(tempfile.mkdtemp(dir=path.parent, prefix=f".{path.name}-"))
+    try:
+        np.save(tmp / "time_ms.npy", data.index.to_numpy())
+        for column in data.columns:
+            np.save(tmp / f"{column}.npy", data[column].to_numpy())
+        os.replace(tmp, path)
+    except OSError:
+        # Another process finished the same cache first
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not path.exists():
+            raise
+
+
+def _read_cache(path: Path, mmap: bool) -> pd.DataFrame:
+    mmap_mode = "r" if mmap else None
+    columns = [key for key in LABEL_MAP if key != "time_ms"]
+    return pd.DataFrame(
+        {
+            column: np.load(path / f"{column}.npy", mmap_mode=mmap_mode)
+            for column in columns
+            if (path / f"{column}.npy").exists()
+        },
+        index=pd.Index(
+            np.load(path / "time_ms.npy", mmap_mode=mmap_mode), name="time_ms"
+        ),
+        copy=False,
+    )
+
+
+def _convert(filename: Path, cache_dir: Path) -> Path:
+    path = cache_path(filename, cache_dir)
+    if path.exists():
+        return path
+    try:
+        data = read_run_csv(filename)
+    except ValueError as e:
+        # Remember files that aren't runs so warm loads don't parse them again
+        path.mkdir(parents=True, exist_ok=True)
+        (path / INVALID_MARKER).write_text(str(e))
+        return path
+    _write_cache(data, path)
+    return path
+
+
+def _invalid_reason(path: Path) -> Optional[str]:
+    marker = path / INVALID_MARKER
+    return marker.read_text() if marker.exists() else None
+
+
+def load_run(
+    filename: str | PathLike[str],
+    cache_dir: Optional[Path] = CACHE_DIR,
+    mmap: bool = False,
+) -> pd.DataFrame:
+    """
+    Load a test run CSV, converting it to a per-column .npy cache on first use.
+    Pass `cache_dir=None` to always parse the CSV. With `mmap` the columns are
+    memory-mapped read-only from the cache.
+
+    """
+    if cache_dir is None:
+        return read_run_csv(filename)
+    path = _convert(Path(filename), cache_dir)
+    reason = _invalid_reason(path)
+    if reason is not None:
+        raise ValueError(reason)
+    return _read_cache(path, mmap)
+
+
+def find_runs(directory: str | PathLike[str], recursive: bool = True) -> List[Path]:
+    directory = Path(directory)
+    return sorted(directory.rglob("*.csv") if recursive else directory.glob("*.csv"))
+
+
+def load_runs(
+    directory: str | PathLike[str],
+    recursive: bool = True,
+    cache_dir: Path = CACHE_DIR,
+    workers: Optional[int] = None,
+    mmap: bool = False,
+) -> Dict[Path, pd.DataFrame]:
+    """
+    Load every test run CSV under a directory, keyed by path relative to it.
+    Missing caches are converted in parallel across a process pool, then all
+    runs are read from the cache. Files that aren't test run CSVs are skipped
+    with a warning.
+
+    """
+    directory = Path(directory)
+    filenames = find_runs(directory, recursive=recursive)
+    stale = [f for f in filenames if not cache_path(f, cache_dir).exists()]
+
+    if stale:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(stale) // (4 * (os.cpu_count() or 1)))
+            paths = executor.map(
+                _convert, stale, [cache_dir] * len(stale), chunksize=chunksize
+            )
+            for filename, path in zip(stale, paths):
+                reason = _invalid_reason(path)
+                if reason is not None:
+                    warnings.warn(f"Skipping {filename}: {reason}")
+
+    runs = {}
+    for filename in filenames:
+        path = cache_path(filename, cache_dir)
+        if _invalid_reason(path) is None:
+            runs[filename.relative_to(directory)] = _read_cache(path, mmap)
+    return runs
+
+
+def clear_cache(cache_dir: Path = CACHE_DIR) -> None:
+    shutil.rmtree(cache_dir, ignore_errors=True)
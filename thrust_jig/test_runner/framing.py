@@ -0,0 +1,171 @@
+from typing import List, Optional
+import numpy as np
+
+
+# Must match DataFrame_S in thrust_jig_fw/include/serialProtocol.hpp
+SYNC_WORD = b"\xa5\x5a"
+SYNC_VALUE = 0x5AA5
+BINARY_STREAM_REQUEST = b"Binary stream\n"
+BINARY_STREAM_ACK = "Binary stream enabled"
+FRAME_FIELDS = (
+    "time_us",
+    "top_rpm",
+    "bot_rpm",
+    "v_bat",
+    "i_bat",
+    "i_top",
+    "i_bot",
+    "thrust_N",
+    "torque_Nm",
+)
+FRAME_DTYPE = np.dtype(
+    [
+        ("sync", "<u2"),
+        ("time_us", "<u4"),
+        ("top_rpm", "<u2"),
+        ("bot_rpm", "<u2"),
+        ("v_bat", "<f4"),
+        ("i_bat", "<f4"),
+        ("i_top", "<f4"),
+        ("i_bot", "<f4"),
+        ("thrust_N", "<f4"),
+        ("torque_Nm", "<f4"),
+        ("checksum", "u1"),
+    ]
+)
+FRAME_SIZE = FRAME_DTYPE.itemsize
+STOPPED_MSG = b"Stopped"
+MAX_TEXT_BYTES = 256
+CONTROL_MSGS = (
+    "",
+    "Thrust Jig Firmware Program",
+    "Setting up",
+    "Ready to load test spec",
+    "Starting test",
+    "time_us,top_rpm,bot_rpm,v_bat,i_bat,i_top,i_bot,thrust_N,torque_Nm",
+)
+
+
+def parse_csv_line(line: str) -> Optional[List[float]]:
+    """
+    Parse one CSV sample line into floats ordered as FRAME_FIELDS.
+
+    """
+    values = line.split(",")
+    if len(values) != len(FRAME_FIELDS):
+        return None
+    try:
+        return [float(value) for value in values]
+    except ValueError:
+        return None
+
+
+def _checksum(raw: np.ndarray) -> np.ndarray:
+    """
+    XOR of every payload byte between the sync word and the checksum, per frame.
+
+    """
+    return np.bitwise_xor.reduce(raw[:, len(SYNC_WORD) : -1], axis=1)
+
+
+def encode_frames(rows: np.ndarray) -> bytes:
+    """
+    Pack an (N, 9) array of samples, ordered as FRAME_FIELDS, into binary frames.
+
+    """
+    rows = np.atleast_2d(rows)
+    frames = np.zeros(len(rows), dtype=FRAME_DTYPE)
+    frames["sync"] = SYNC_VALUE
+    for i, name in enumerate(FRAME_FIELDS):
+        frames[name] = rows[:, i]
+    raw = frames.view(np.uint8).reshape(len(rows), FRAME_SIZE)
+    frames["checksum"] = _checksum(raw)
+    return frames.tobytes()
+
+
+def frames_to_rows(frames: np.ndarray) -> np.ndarray:
+    """
+    Convert decoded frames into an (N, 9) float array ordered as FRAME_FIELDS.
+
+    """
+    rows = np.empty((len(frames), len(FRAME_FIELDS)), dtype=np.float64)
+    for i, name in enumerate(FRAME_FIELDS):
+        rows[:, i] = frames[name]
+    return rows
+
+
+class FrameDecoder:
+    """
+    Incremental decoder for the binary sample stream.
+
+    Bytes are fed in arbitrary chunks; every complete, checksum-valid frame is
+    returned as a structured array. Bytes that aren't part of a valid frame
+    (control messages, line noise) are kept in a small text tail so the caller
+    can look for messages like "Stopped", and complete text lines collect in
+    `lines` for the caller to take.
+
+    """
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        self.text = bytearray()
+        self.lines: List[str] = []
+        self._line = bytearray()
+        self.frames = 0
+        self.bad_frames = 0
+
+    def _skip(self, count: int) -> None:
+        skipped = self._buffer[:count]
+        self.text += skipped
+        del self.text[:-MAX_TEXT_BYTES]
+        self._line += skipped
+        if b"\n" in skipped:
+            *complete, rest = self._line.split(b"\n")
+            self.lines.extend(
+                line.decode(errors="backslashreplace") for line in complete
+            )
+            self._line = rest
+        del self._line[:-MAX_TEXT_BYTES]
+        del self._buffer[:count]
+
+    def stopped(self) -> bool:
+        # Trailing bytes shorter than a frame never get skipped into the text tail
+        return STOPPED_MSG in self.text or STOPPED_MSG in self._buffer
+
+    def feed(self, data: bytes) -> np.ndarray:
+        self._buffer += data
+        decoded: List[np.ndarray] = []
+
+        while len(self._buffer) >= FRAME_SIZE:
+            start = self._buffer.find(SYNC_WORD)
+            if start < 0:
+                # Keep the last byte in case it is the first half of a sync word
+                self._skip(len(self._buffer) - 1)
+                break
+            if start > 0:
+                self._skip(start)
+                continue
+
+            count = len(self._buffer) // FRAME_SIZE
+            chunk = bytes(self._buffer[: count * FRAME_SIZE])
+            raw = np.frombuffer(chunk, dtype=np.uint8).reshape(count, FRAME_SIZE)
+            frames = np.frombuffer(chunk, dtype=FRAME_DTYPE)
+            valid = (frames["sync"] == SYNC_VALUE) & (
+                _checksum(raw) == frames["checksum"]
+            )
+            num_valid = count if valid.all() else int(np.argmin(valid))
+
+            if num_valid == 0:
+                # Corrupt frame or a false sync match, resync past it
+                self.bad_frames += 1
+                self._skip(len(SYNC_WORD))
+                continue
+
+            decoded.append(frames[:num_valid])
+            del self._buffer[: num_valid * FRAME_SIZE]
+
+        if not decoded:
+            return np.empty(0, dtype=FRAME_DTYPE)
+        frames = np.concatenate(decoded)
+        self.frames += len(frames)
+        return frames
@@ -0,0 +1,224 @@
+from typing import List, Mapping, Optional, Sequence
+from dataclasses import dataclass
+import time
+import matplotlib.pyplot as plt
+import numpy as np
+
+from sample_buffer import SampleBuffer
+
+
+DEFAULT_PANELS = (
+    ("thrust_N",),
+    ("torque_N",),
+    ("top_motor_rpm", "bottom_motor_rpm"),
+    ("top_current_A", "bottom_current_A", "batt_current_A"),
+)
+
+
+class MinMaxDecimator:
+    """
+    Running min/max envelope of a growing multichannel series in a bounded
+    number of points.
+
+    Samples are reduced to the min and max of each channel over bins of
+    `bin_size` samples as they arrive. When there are more than 2 * `bins` bins,
+    neighbouring pairs are merged and the bin size doubles, so the cost of
+    adding samples only depends on how many were added and the envelope stays
+    between `bins` and 2 * `bins` bins however long the series gets. Unlike
+    picking every nth sample, spikes are never lost.
+
+    """
+
+    def __init__(self, channels: int, bins: int = 500) -> None:
+        self.channels = channels
+        self.bins = bins
+        self.bin_size = 1
+        self.samples = 0
+        self._x = np.empty((0, 2))
+        self._lo = np.empty((0, channels))
+        self._hi = np.empty((0, channels))
+        self._pending_x = np.empty(0)
+        self._pending_y = np.empty((0, channels))
+
+    def __len__(self) -> int:
+        return len(self._x)
+
+    def extend(self, x: np.ndarray, y: np.ndarray) -> None:
+        self.samples += len(x)
+        x = np.concatenate((self._pending_x, x))
+        y = np.concatenate((self._pending_y, y.reshape(-1, self.channels)))
+        full = len(x) // self.bin_size * self.bin_size
+        if full > 0:
+            xs = x[:full].reshape(-1, self.bin_size)
+            ys = y[:full].reshape(-1, self.bin_size, self.channels)
+            self._x = np.concatenate((self._x, xs[:, [0, -1]]))
+            # fmin/fmax skip NaNs without warning about all-NaN bins
+            self._lo = np.concatenate((self._lo, np.fmin.reduce(ys, axis=1)))
+            self._hi = np.concatenate((self._hi, np.fmax.reduce(ys, axis=1)))
+        self._pending_x, self._pending_y = x[full:], y[full:]
+        while len(self._x) > 2 * self.bins:
+            self._merge()
+
+    def _merge(self) -> None:
+        n = len(self._x) // 2 * 2
+        x = np.stack((self._x[0:n:2, 0], self._x[1:n:2, 1]), axis=1)
+        lo = np.fmin(self._lo[0:n:2], self._lo[1:n:2])
+        hi = np.fmax(self._hi[0:n:2], self._hi[1:n:2])
+        # An odd bin out stays as it is until the next merge
+        self._x = np.concatenate((x, self._x[n:]))
+        self._lo = np.concatenate((lo, self._lo[n:]))
+        self._hi = np.concatenate((hi, self._hi[n:]))
+        self.bin_size *= 2
+
+    def envelope(self, channel: int) -> tuple:
+        """
+        Points tracing the envelope of one channel: each bin's min at its first
+        sample and max at its last, with the samples not binned yet as one more
+        partial bin.
+
+        """
+        x, lo, hi = self._x, self._lo[:, channel], self._hi[:, channel]
+        if len(self._pending_x) > 0:
+            pending = self._pending_y[:, channel]
+            x = np.concatenate((x, self._pending_x[[0, -1]][None, :]))
+            lo = np.append(lo, np.fmin.reduce(pending))
+            hi = np.append(hi, np.fmax.reduce(pending))
+        return x.ravel(), np.stack((lo, hi), axis=1).ravel()
+
+
+@dataclass
+class LivePlotStats:
+    samples: int = 0
+    frames: int = 0
+    points: int = 0
+    render_s: float = 0.0
+    max_render_s: float = 0.0
+
+    def summary(self) -> str:
+        mean = self.render_s / self.frames if self.frames else 0.0
+        return (
+            f"{self.frames} frames of {self.samples} samples, "
+            f"{self.points} points per frame, render mean {mean * 1e3:.1f} ms / "
+            f"max {self.max_render_s * 1e3:.1f} ms"
+        )
+
+
+class LiveDashboard:
+    """
+    Live plot of an acquisition, one panel per group of columns in `panels`,
+    redrawn at most `frame_rate_hz` times a second from a MinMaxDecimator so a
+    frame costs the same after ten seconds or ten minutes. Frames are spaced
+    further apart when drawing would otherwise take more than `max_duty` of
+    the caller's time, as it can on a slow machine.
+
+    Rows come either from a SampleBuffer `source`, read incrementally on each
+    frame, or are handed over with `feed`. `poll` is meant to be called from
+    the thread reading the buffer between batches (matplotlib has to draw on
+    the main thread), so it never holds up a separate serial reader thread.
+    Without `x_column` samples are plotted against their count.
+
+    """
+
+    def __init__(
+        self,
+        columns: Sequence[str],
+        panels: Sequence[Sequence[str]] = DEFAULT_PANELS,
+        x_column: Optional[str] = "time_ms",
+        source: Optional[SampleBuffer] = None,
+        frame_rate_hz: float = 10.0,
+        max_duty: float = 0.25,
+        bins: int = 500,
+        labels: Optional[Mapping[str, str]] = None,
+        title: str = "",
+    ) -> None:
+        labels = labels or {}
+        self.columns = list(columns)
+        self.panels = [
+            [name for name in panel if name in self.columns] for panel in panels
+        ]
+        self.panels = [panel for panel in self.panels if panel]
+        self.x_column = x_column
+        self.source = source
+        self.frame_rate_hz = frame_rate_hz
+        self.max_duty = max_duty
+        self.stats = LivePlotStats()
+        self._plotted = [name for panel in self.panels for name in panel]
+        self._y_idx = [self.columns.index(name) for name in self._plotted]
+        self._x_idx = self.columns.index(x_column) if x_column is not None else None
+        self._decimator = MinMaxDecimator(len(self._plotted), bins=bins)
+        self._consumed = 0
+        self._fed: List[np.ndarray] = []
+        self._next_frame = 0.0
+
+        with plt.ion():
+            self.fig, axs = plt.subplots(
+                len(self.panels), 1, sharex=True, squeeze=False, figsize=(10, 8)
+            )
+        self.fig.suptitle(title)
+        self._lines: List = []
+        for ax, panel in zip(axs[:, 0], self.panels):
+            for name in panel:
+                (line,) = ax.plot([], [], linewidth=0.8, label=labels.get(name, name))
+                self._lines.append(line)
+            ax.legend(loc="upper left")
+            ax.grid(True)
+        axs[-1, 0].set_xlabel(labels.get(x_column, x_column) if x_column else "Sample")
+        self._axs = axs[:, 0]
+
+    def feed(self, rows: np.ndarray) -> None:
+        """
+        Queue rows for the next frame.
+
+        """
+        self._fed.append(rows)
+
+    def _decimate(self, rows: np.ndarray) -> None:
+        if len(rows) == 0:
+            return
+        if self._x_idx is not None:
+            x = rows[:, self._x_idx]
+        else:
+            x = np.arange(self._decimator.samples, self._decimator.samples + len(rows))
+        self._decimator.extend(x.astype(np.float64), rows[:, self._y_idx])
+        self.stats.samples = self._decimator.samples
+
+    def poll(self, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        if now < self._next_frame:
+            return
+        render_s = self.render()
+        self._next_frame = now + max(1 / self.frame_rate_hz, render_s / self.max_duty)
+
+    def render(self) -> float:
+        start = time.perf_counter()
+        if self.source is not None:
+            rows = self.source.view()[self._consumed :]
+            self._consumed += len(rows)
+            self._decimate(rows)
+        if self._fed:
+            self._decimate(np.vstack(self._fed))
+            self._fed.clear()
+        points = 0
+        for i, line in enumerate(self._lines):
+            x, y = self._decimator.envelope(i)
+            line.set_data(x, y)
+            points += len(x)
+        for ax in self._axs:
+            ax.relim()
+            ax.autoscale_view()
+        self.fig.canvas.draw_idle()
+        self.fig.canvas.flush_events()
+        elapsed = time.perf_counter() - start
+        self.stats.frames += 1
+        self.stats.points = points
+        self.stats.render_s += elapsed
+        self.stats.max_render_s = max(self.stats.max_render_s, elapsed)
+        return elapsed
+
+    def close(self) -> LivePlotStats:
+        """
+        Draw the last frame and return the stats, leaving the figure up.
+
+        """
+        self.render()
+        return self.stats
@@ -0,0 +1,589 @@
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+from dataclasses import dataclass, field
+from abc import ABC, abstractmethod
+import time
+import numpy as np
+import scipy.signal
+
+
+# Filter kind and time constant (ema) or window (mean) in ms, per channel
+DEFAULT_FILTERS: Dict[str, Tuple[str, float]] = {
+    "top_motor_rpm": ("ema", 50),
+    "bottom_motor_rpm": ("ema", 50),
+    "batt_voltage_V": ("mean", 250),
+    "batt_current_A": ("ema", 50),
+    "thrust_N": ("ema", 100),
+    "torque_N": ("ema", 100),
+}
+
+
+class EmaFilter:
+    """
+    First order IIR low pass, y += alpha * (x - y), over the columns of blocks
+    of samples with one `alpha` per column, continuing across blocks. Starts
+    settled on the first sample rather than ramping up from 0.
+
+    Blocks of up to `loop_rows` rows, which is mostly what the port delivers,
+    are stepped through row by row across all columns at once, as calling
+    lfilter costs more than that. Larger blocks go through lfilter once per
+    distinct `alpha`.
+
+    """
+
+    def __init__(self, alpha: np.ndarray, loop_rows: int = 32) -> None:
+        self.alpha = np.asarray(alpha, dtype=np.float64)
+        self.loop_rows = loop_rows
+        self._last: Optional[np.ndarray] = None
+
+    def __call__(self, x: np.ndarray) -> np.ndarray:
+        y = np.empty_like(x)
+        last = x[0] if self._last is None else self._last
+        if len(x) <= self.loop_rows:
+            for i in range(len(x)):
+                last = last + self.alpha * (x[i] - last)
+                y[i] = last
+        else:
+            for alpha in np.unique(self.alpha):
+                cols = self.alpha == alpha
+                y[:, cols], _ = scipy.signal.lfilter(
+                    [alpha],
+                    [1, alpha - 1],
+                    x[:, cols],
+                    axis=0,
+                    zi=(1 - alpha) * last[None, cols],
+                )
+        self._last = y[-1].copy()
+        return y
+
+
+class MovingAverage:
+    """
+    Mean of the last `n` samples (fewer at the start) of each column, from a
+    running sum over the block plus the previous block's tail.
+
+    """
+
+    def __init__(self, n: int) -> None:
+        self.n = max(n, 1)
+        self._tail: Optional[np.ndarray] = None
+
+    def __call__(self, x: np.ndarray) -> np.ndarray:
+        tail = x[:0] if self._tail is None else self._tail
+        data = np.concatenate((tail, x))
+        sums = np.concatenate((np.zeros_like(data[:1]), np.cumsum(data, axis=0)))
+        end = np.arange(len(tail) + 1, len(data) + 1)
+        start = np.maximum(end - self.n, 0)
+        self._tail = data[len(data) - self.n + 1 :] if self.n > 1 else data[:0]
+        return (sums[end] - sums[start]) / (end - start)[:, None]
+
+
+def filter_samples(ms: float, sample_period_ms: float) -> float:
+    return max(ms / sample_period_ms, 1.0)
+
+
+@dataclass
+class MonitorEvent:
+    time_ms: float
+    rule: str
+    action: str
+    message: str
+
+
+@dataclass
+class MonitorContext:
+    """
+    What a rule sees of one block of samples.
+
+    """
+
+    time_ms: np.ndarray
+    filtered: Dict[str, np.ndarray]
+    # Index of the command each sample falls under and how long it has been
+    # running, when the monitor knows the plan
+    command: Optional[np.ndarray] = None
+    command_ms: Optional[np.ndarray] = None
+    commands: Optional[np.ndarray] = None
+    # Exponentially weighted mean of every column then of its square
+    columns: Sequence[str] = ()
+    rolling: Optional[np.ndarray] = None
+
+    def rolling_std(self, channel: str) -> np.ndarray:
+        i = self.columns.index(channel)
+        mean = self.rolling[:, i]
+        square = self.rolling[:, len(self.columns) + i]
+        return np.sqrt(np.maximum(square - mean**2, 0))
+
+
+def _held(condition: np.ndarray, time_ms: np.ndarray, since: Optional[float]):
+    """
+    Start time of the run of true `condition` each sample is part of (NaN where
+    it is false), and the start of a run still going at the end of the block,
+    to pass back in as `since` with the next block.
+
+    """
+    rising = condition & ~np.concatenate(([since is not None], condition[:-1]))
+    last_rise = np.maximum.accumulate(np.where(rising, np.arange(len(condition)), -1))
+    start = np.where(last_rise >= 0, time_ms[np.maximum(last_rise, 0)], np.nan)
+    if since is not None:
+        start = np.where(last_rise < 0, since, start)
+    start = np.where(condition, start, np.nan)
+    carry = float(start[-1]) if len(condition) and condition[-1] else None
+    return start, carry
+
+
+class Rule(ABC):
+    """
+    A condition on the filtered samples that has to hold for `hold_ms` before
+    the rule fires, so single sample glitches don't trip it. A rule fires once
+    per run, then either just flags the run or aborts it.
+
+    """
+
+    name = "rule"
+
+    def __init__(self, hold_ms: float, action: str) -> None:
+        if action not in ("flag", "abort"):
+            raise ValueError(f"Unknown action {action}, expected flag or abort")
+        self.hold_ms = hold_ms
+        self.action = action
+        self.fired = False
+        self._since: Optional[float] = None
+
+    @abstractmethod
+    def condition(self, ctx: MonitorContext) -> np.ndarray:
+        ...
+
+    @abstractmethod
+    def describe(self, ctx: MonitorContext, i: int) -> str:
+        ...
+
+    def check(self, ctx: MonitorContext) -> Optional[MonitorEvent]:
+        if self.fired:
+            return None
+        condition = self.condition(ctx)
+        if self._since is None and not condition.any():
+            return None
+        start, self._since = _held(condition, ctx.time_ms, self._since)
+        with np.errstate(invalid="ignore"):
+            fire = np.flatnonzero(ctx.time_ms - start >= self.hold_ms)
+        if len(fire) == 0:
+            return None
+        self.fired = True
+        i = int(fire[0])
+        return MonitorEvent(
+            float(ctx.time_ms[i]), self.name, self.action, self.describe(ctx, i)
+        )
+
+
+class BatterySag(Rule):
+    """
+    The supply more than `max_sag` below its resting voltage, or below
+    `min_voltage` if given. The resting voltage is read `rest_ms` into the
+    run, with the motors still off and the voltage filter settled. The jig
+    runs off packs and bench supplies of different voltages, which sag by up
+    to about 20% at full throttle in normal tests.
+
+    """
+
+    name = "battery_sag"
+
+    def __init__(
+        self,
+        max_sag: float = 0.25,
+        min_voltage: Optional[float] = None,
+        rest_ms: float = 250,
+        hold_ms: float = 500,
+        action: str = "flag",
+        channel: str = "batt_voltage_V",
+    ) -> None:
+        super().__init__(hold_ms, action)
+        self.max_sag = max_sag
+        self.min_voltage = min_voltage
+        self.rest_ms = rest_ms
+        self.channel = channel
+        self.rest_voltage: Optional[float] = None
+        self._start_ms: Optional[float] = None
+
+    @property
+    def threshold(self) -> float:
+        if self.min_voltage is not None:
+            return self.min_voltage
+        return (1 - self.max_sag) * self.rest_voltage
+
+    def condition(self, ctx: MonitorContext) -> np.ndarray:
+        voltage = ctx.filtered[self.channel]
+        if self.min_voltage is not None:
+            return voltage < self.min_voltage
+        rested = 0
+        if self.rest_voltage is None:
+            if self._start_ms is None:
+                self._start_ms = float(ctx.time_ms[0])
+            rested = int(np.searchsorted(ctx.time_ms, self._start_ms + self.rest_ms))
+            if rested == len(voltage):
+                return np.zeros(len(voltage), dtype=bool)
+            self.rest_voltage = float(voltage[rested])
+        sagged = voltage < self.threshold
+        sagged[:rested] = False
+        return sagged
+
+    def describe(self, ctx: MonitorContext, i: int) -> str:
+        rest = (
+            f" from {self.rest_voltage:.2f} V at rest"
+            if self.rest_voltage is not None
+            else ""
+        )
+        return (
+            f"Battery at {ctx.filtered[self.channel][i]:.2f} V{rest}, "
+            f"below {self.threshold:.2f} V for {self.hold_ms:.0f} ms"
+        )
+
+
+class RpmDropout(Rule):
+    """
+    A motor below `min_rpm` while commanded to at least `min_throttle` %, once
+    it has had `settle_ms` to spin up after each command.
+
+    """
+
+    name = "rpm_dropout"
+
+    def __init__(
+        self,
+        min_rpm: float = 1000,
+        min_throttle: float = 10,
+        settle_ms: float = 1000,
+        hold_ms: float = 200,
+        action: str = "abort",
+    ) -> None:
+        super().__init__(hold_ms, action)
+        self.min_rpm = min_rpm
+        self.min_throttle = min_throttle
+        self.settle_ms = settle_ms
+        self._motors = (
+            ("top_motor_rpm", "top_throttle"),
+            ("bottom_motor_rpm", "bottom_throttle"),
+        )
+
+    def condition(self, ctx: MonitorContext) -> np.ndarray:
+        dropped = np.zeros(len(ctx.time_ms), dtype=bool)
+        if ctx.commands is None:
+            return dropped
+        settled = ctx.command_ms >= self.settle_ms
+        for rpm, throttle in self._motors:
+            commanded = ctx.commands[throttle][ctx.command] >= self.min_throttle
+            dropped |= settled & commanded & (ctx.filtered[rpm] < self.min_rpm)
+        return dropped
+
+    def describe(self, ctx: MonitorContext, i: int) -> str:
+        speeds = ", ".join(
+            f"{rpm} {ctx.filtered[rpm][i]:.0f} rpm at "
+            f"{ctx.commands[throttle][ctx.command[i]]:.0f} %"
+            for rpm, throttle in self._motors
+        )
+        return f"RPM dropout: {speeds}"
+
+
+class ThrustDrift(Rule):
+    """
+    Thrust moving more than `tolerance_N` (or `rel_tolerance` of it) away from
+    where it settled `settle_ms` into the command, with the throttle unchanged.
+    Usually the load cell creeping or something coming loose.
+
+    """
+
+    name = "thrust_drift"
+
+    def __init__(
+        self,
+        tolerance_N: float = 0.5,
+        rel_tolerance: float = 0.1,
+        settle_ms: float = 1000,
+        hold_ms: float = 500,
+        action: str = "flag",
+        channel: str = "thrust_N",
+    ) -> None:
+        super().__init__(hold_ms, action)
+        self.tolerance_N = tolerance_N
+        self.rel_tolerance = rel_tolerance
+        self.settle_ms = settle_ms
+        self.channel = channel
+        self._reference: Optional[np.ndarray] = None
+
+    def condition(self, ctx: MonitorContext) -> np.ndarray:
+        if ctx.commands is None:
+            return np.zeros(len(ctx.time_ms), dtype=bool)
+        if self._reference is None:
+            self._reference = np.full(len(ctx.commands), np.nan)
+        thrust = ctx.filtered[self.channel]
+        settled = ctx.command_ms >= self.settle_ms
+        # The first settled sample of each command is its reference
+        new = settled & np.isnan(self._reference[ctx.command])
+        if new.any():
+            windows, first = np.unique(ctx.command[new], return_index=True)
+            self._reference[windows] = thrust[np.flatnonzero(new)[first]]
+        reference = self._reference[ctx.command]
+        tolerance = np.maximum(self.tolerance_N, self.rel_tolerance * np.abs(reference))
+        with np.errstate(invalid="ignore"):
+            return settled & (np.abs(thrust - reference) > tolerance)
+
+    def describe(self, ctx: MonitorContext, i: int) -> str:
+        reference = self._reference[ctx.command[i]]
+        return (
+            f"Thrust drifted from {reference:.2f} N to "
+            f"{ctx.filtered[self.channel][i]:.2f} N within one command"
+        )
+
+
+class StuckChannel(Rule):
+    """
+    A channel whose rolling standard deviation is below `min_std` while its
+    motor is spinning faster than `min_rpm`, as when a sensor is unpowered or
+    saturated and reads a constant. The rolling stats take a few of the
+    monitor's `stats_ms` to forget earlier readings, so this catches channels
+    stuck from the start straight away and ones that stick later on more
+    slowly.
+
+    """
+
+    name = "stuck_channel"
+
+    def __init__(
+        self,
+        channels: Sequence[Tuple[str, str]] = (
+            ("top_current_A", "top_motor_rpm"),
+            ("bottom_current_A", "bottom_motor_rpm"),
+        ),
+        min_std: float = 0.005,
+        min_rpm: float = 1000,
+        hold_ms: float = 1000,
+        action: str = "flag",
+    ) -> None:
+        super().__init__(hold_ms, action)
+        self.channels = list(channels)
+        self.min_std = min_std
+        self.min_rpm = min_rpm
+
+    def _stuck(self, ctx: MonitorContext, channel: str, rpm: str) -> np.ndarray:
+        return (ctx.filtered[rpm] > self.min_rpm) & (
+            ctx.rolling_std(channel) < self.min_std
+        )
+
+    def condition(self, ctx: MonitorContext) -> np.ndarray:
+        stuck = np.zeros(len(ctx.time_ms), dtype=bool)
+        for channel, rpm in self.channels:
+            stuck |= self._stuck(ctx, channel, rpm)
+        return stuck
+
+    def describe(self, ctx: MonitorContext, i: int) -> str:
+        stuck = ", ".join(
+            f"{channel} at {ctx.filtered[channel][i]:.3f} with {rpm} "
+            f"{ctx.filtered[rpm][i]:.0f} rpm"
+            for channel, rpm in self.channels
+            if self._stuck(ctx, channel, rpm)[i]
+        )
+        return f"Stuck channel: {stuck}"
+
+
+def default_rules(abort: bool = False) -> List[Rule]:
+    """
+    The standard rules, which only flag the run unless `abort`, in which case
+    a sagging battery or a motor cutting out stop the jig.
+
+    """
+    action = "abort" if abort else "flag"
+    return [
+        BatterySag(action=action),
+        RpmDropout(action=action),
+        ThrustDrift(),
+        StuckChannel(),
+    ]
+
+
+@dataclass
+class MonitorStats:
+    samples: int = 0
+    blocks: int = 0
+    process_s: float = 0.0
+    max_block_s: float = 0.0
+    latencies_s: List[float] = field(default_factory=list, repr=False)
+    flags: int = 0
+    aborted: bool = False
+
+    @property
+    def ns_per_sample(self) -> float:
+        return self.process_s / self.samples * 1e9 if self.samples else 0.0
+
+    def latency_percentile(self, q: float) -> float:
+        return float(np.percentile(self.latencies_s, q)) if self.latencies_s else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.samples} samples in {self.blocks} blocks, "
+            f"{self.ns_per_sample:.0f} ns/sample, "
+            f"latency from the port p50 {self.latency_percentile(50) * 1e3:.2f} ms / "
+            f"p99 {self.latency_percentile(99) * 1e3:.2f} ms, "
+            f"{self.flags} flags{', aborted' if self.aborted else ''}"
+        )
+
+
+class StreamMonitor:
+    """
+    Streaming filters, rolling statistics and anomaly rules applied to each
+    block of samples as test_run reads them.
+
+    Each channel in `filters` gets an EMA or moving average, costing O(1) per
+    sample and carrying its state across blocks. Exponentially weighted mean
+    and standard deviation over `stats_ms` are kept for every channel, for the
+    rules per sample and at the end of the last block in `rolling_mean` and
+    `rolling_std`. The rules, default_rules() unless given, then look at the
+    filtered channels, with the command timeline from `commands`
+    (TestPlan.compile()) when given, and any that fire are printed and
+    recorded in `events`. The first rule to fire with the "abort" action calls
+    `on_abort` (test_run sends the jig "Stop").
+
+    Filter coefficients are set from `sample_period_ms`, or from the first two
+    timestamps if not given.
+
+    """
+
+    def __init__(
+        self,
+        columns: Sequence[str],
+        filters: Mapping[str, Tuple[str, float]] = DEFAULT_FILTERS,
+        rules: Optional[Sequence[Rule]] = None,
+        commands: Optional[np.ndarray] = None,
+        stats_ms: float = 1000,
+        sample_period_ms: Optional[float] = None,
+        on_abort: Optional[Callable[[MonitorEvent], None]] = None,
+        time_column: str = "time_ms",
+    ) -> None:
+        self.columns = list(columns)
+        self.filter_specs = {k: v for k, v in filters.items() if k in self.columns}
+        for kind, _ in self.filter_specs.values():
+            if kind not in ("ema", "mean"):
+                raise ValueError(f"Unknown filter {kind}, expected ema or mean")
+        self.rules = list(default_rules() if rules is None else rules)
+        self.commands = commands
+        self.stats_ms = stats_ms
+        self.sample_period_ms = sample_period_ms
+        self.on_abort = on_abort
+        self.events: List[MonitorEvent] = []
+        self.stats = MonitorStats()
+        self._time_idx = self.columns.index(time_column)
+        self._ema: Optional[EmaFilter] = None
+        self._averages: List[Tuple[np.ndarray, MovingAverage]] = []
+        self._pending: Optional[np.ndarray] = None
+        if commands is not None:
+            self._command_start = commands["time_ms"].astype(np.float64)
+
+    def _setup(self, time_ms: np.ndarray) -> None:
+        if self.sample_period_ms is None:
+            self.sample_period_ms = float(np.median(np.diff(time_ms)))
+        period = max(self.sample_period_ms, 1e-3)
+        ema = {
+            self.columns.index(channel): filter_samples(ms, period)
+            for channel, (kind, ms) in self.filter_specs.items()
+            if kind == "ema"
+        }
+        self._ema_idx = np.array(list(ema), dtype=int)
+        # The rolling stats are EMAs of every column and its square, filtered
+        # along with the channels in one go
+        stats = np.full(2 * len(self.columns), filter_samples(self.stats_ms, period))
+        samples = np.concatenate((list(ema.values()), stats))
+        self._ema = EmaFilter(1 - np.exp(-1 / samples))
+
+        windows: Dict[int, List[int]] = {}
+        for channel, (kind, ms) in self.filter_specs.items():
+            if kind == "mean":
+                n = int(round(filter_samples(ms, period)))
+                windows.setdefault(n, []).append(self.columns.index(channel))
+        self._averages = [
+            (np.array(idx), MovingAverage(n)) for n, idx in windows.items()
+        ]
+
+    def _filter(self, rows: np.ndarray) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+        smoothed = self._ema(
+            np.concatenate((rows[:, self._ema_idx], rows, rows**2), axis=1)
+        )
+        filtered = dict(zip(self.columns, rows.T))
+        for j, i in enumerate(self._ema_idx):
+            filtered[self.columns[i]] = smoothed[:, j]
+        for idx, average in self._averages:
+            for j, values in zip(idx, average(rows[:, idx]).T):
+                filtered[self.columns[j]] = values
+        return filtered, smoothed[:, len(self._ema_idx) :]
+
+    @property
+    def rolling_mean(self) -> Optional[np.ndarray]:
+        if self._ema is None or self._ema._last is None:
+            return None
+        k = len(self._ema_idx)
+        return self._ema._last[k : k + len(self.columns)]
+
+    @property
+    def rolling_std(self) -> Optional[np.ndarray]:
+        mean = self.rolling_mean
+        if mean is None:
+            return None
+        square = self._ema._last[len(self._ema_idx) + len(self.columns) :]
+        return np.sqrt(np.maximum(square - mean**2, 0))
+
+    def process(
+        self, rows: np.ndarray, received: Optional[float] = None
+    ) -> List[MonitorEvent]:
+        """
+        Run a block of converted rows through the filters and rules.
+        `received` is the time.perf_counter() the rows came off the port, for
+        the latency stats.
+
+        """
+        start = time.perf_counter()
+        if self._ema is None:
+            if self._pending is not None:
+                rows = np.concatenate((self._pending, rows))
+            if self.sample_period_ms is None and len(rows) < 2:
+                # Hold on to a lone first sample until the period is known
+                self._pending = rows
+                return []
+            self._pending = None
+            self._setup(rows[:, self._time_idx])
+        if len(rows) == 0:
+            return []
+        time_ms = rows[:, self._time_idx]
+        filtered, rolling = self._filter(rows)
+
+        ctx = MonitorContext(
+            time_ms,
+            filtered,
+            commands=self.commands,
+            columns=self.columns,
+            rolling=rolling,
+        )
+        if self.commands is not None:
+            command = np.searchsorted(self._command_start, time_ms, side="right") - 1
+            ctx.command = np.maximum(command, 0)
+            ctx.command_ms = time_ms - self._command_start[ctx.command]
+        events = []
+        for rule in self.rules:
+            event = rule.check(ctx)
+            if event is not None:
+                events.append(event)
+
+        for event in events:
+            self.events.append(event)
+            print(f"Monitor {event.action}: {event.message} at {event.time_ms:.0f} ms")
+            if event.action == "flag":
+                self.stats.flags += 1
+            elif not self.stats.aborted:
+                self.stats.aborted = True
+                if self.on_abort is not None:
+                    self.on_abort(event)
+
+        end = time.perf_counter()
+        self.stats.samples += len(rows)
+        self.stats.blocks += 1
+        self.stats.process_s += end - start
+        self.stats.max_block_s = max(self.stats.max_block_s, end - start)
+        if received is not None:
+            self.stats.latencies_s.append(end - received)
+        return events
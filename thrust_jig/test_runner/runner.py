@@ -1,55 +1,26 @@
-from typing import Optional, List, Dict
-from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Optional, List
+from dataclasses import dataclass, asdict, fields
 from pathlib import Path
 from os import PathLike
 import serial
 import serial.tools.list_ports
-import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
 import configparser
+import csv
 import warnings
 import time
 
+from channels import CONVERSION_MAP, INDEX_MAP, INV_LABEL_MAP, LABEL_MAP, convert_rows
+from framing import BINARY_STREAM_ACK, BINARY_STREAM_REQUEST
+from spec import SPEC_BEGIN, SPEC_HEADER, SpecUploader, compile_steps
 
-config = configparser.ConfigParser()
-config.read("runner.ini")
+if TYPE_CHECKING:
+    import pandas as pd
+    from closed_loop import SetpointController
+    from monitor import StreamMonitor
 
+CONFIG_PATH = "runner.ini"
 SERIAL_BAUD = 921600
-INDEX_MAP = {
-    "time_ms": 0,
-    "top_motor_rpm": 1,
-    "bottom_motor_rpm": 2,
-    "batt_voltage_V": 3,
-    "batt_current_A": 4,
-    "top_current_A": 5,
-    "bottom_current_A": 6,
-    "thrust_N": 7,
-    "torque_N": 8,
-}
-CONVERSION_MAP = {
-    "time_ms": lambda x: x / 1000,  # Convert to ms
-    "top_motor_rpm": lambda x: x,
-    "bottom_motor_rpm": lambda x: x,
-    "batt_voltage_V": lambda x: x,
-    "batt_current_A": lambda x: x,
-    "top_current_A": lambda x: x,
-    "bottom_current_A": lambda x: x,
-    "thrust_N": lambda x: x,
-    "torque_N": lambda x: x,
-}
-LABEL_MAP = {
-    "time_ms": "Time (ms)",
-    "top_motor_rpm": "Top Motor Speed (rpm)",
-    "bottom_motor_rpm": "Bottom Motor Speed (rpm)",
-    "batt_voltage_V": "Battery Voltage (V)",
-    "batt_current_A": "Battery Current (A)",
-    "top_current_A": "Top Motor Current (A)",
-    "bottom_current_A": "Bottom Motor Current (A)",
-    "thrust_N": "Thrust (N)",
-    "torque_N": "Torque (N)",
-}
-INV_LABEL_MAP = {v: k for k, v in LABEL_MAP.items()}
 
 
 @dataclass(frozen=True)
@@ -59,6 +30,9 @@ class TestStep:
     bottom_throttle: Optional[float] = None
     pitch_angle: Optional[float] = None
     roll_angle: Optional[float] = None
+    # Closed loop setpoints, for this step only with the throttles as a start
+    target_thrust_N: Optional[float] = None
+    balance_rpm: bool = False
 
 
 @dataclass(frozen=True)
@@ -95,79 +69,104 @@ class TestPlan:
     name: str
     steps: List[TestStep]
 
+    def compile(self, teardown=True) -> np.ndarray:
+        return compile_steps(self.steps, teardown=teardown)
+
     def commands(self, teardown=True) -> List[TestCommand]:
-        commands = [
-            TestCommand(
-                time_ms=0,
-                duration_ms=0,
-                top_throttle=0,
-                bottom_throttle=0,
-                pitch_angle=0,
-                roll_angle=0,
-            )
-        ]
-
-        for step in self.steps:
-            commands.append(TestCommand.next(step=step, last=commands[-1]))
-
-        if teardown:
-            while commands[-1].top_throttle != 0 or commands[-1].bottom_throttle != 0:
-                last_top = commands[-1].top_throttle
-                last_bottom = commands[-1].bottom_throttle
-                next_top = max(0, last_top - 1)
-                next_bottom = max(0, last_bottom - 1)
-                commands.append(
-                    TestCommand.next(
-                        step=TestStep(
-                            duration_ms=20,
-                            top_throttle=next_top,
-                            bottom_throttle=next_bottom,
-                        ),
-                        last=commands[-1],
-                    )
+        return [TestCommand(*command) for command in self.compile(teardown).tolist()]
+
+
+def read_plan(filename: str | PathLike[str], name: Optional[str] = None) -> TestPlan:
+    """
+    Read a TestPlan from a CSV file with one TestStep per row, its columns
+    named after TestStep's fields. Empty cells are left unset.
+
+    """
+    filename = Path(filename)
+    types = {
+        field.name: bool if field.name == "balance_rpm" else float
+        for field in fields(TestStep)
+    }
+    types["duration_ms"] = int
+    steps = []
+    with open(filename, newline="") as f:
+        for row in csv.DictReader(f):
+            unknown = set(row) - set(types)
+            if unknown:
+                raise ValueError(f"Unknown plan columns {', '.join(sorted(unknown))}")
+            steps.append(
+                TestStep(
+                    **{
+                        key: (
+                            value.strip().lower() in ("1", "true", "yes")
+                            if types[key] is bool
+                            else types[key](float(value))
+                        )
+                        for key, value in row.items()
+                        if value is not None and value.strip() != ""
+                    }
                 )
+            )
+    return TestPlan(name or filename.stem, steps)
 
-        return commands
-
-
-@dataclass(frozen=True)
-class TestDataBuilder:
-    data: Dict[str, List[float]] = field(default_factory=dict)
-
-    def add_datapoint(self, key: str, value: float) -> None:
-        if key in self.data:
-            self.data[key].append(value)
-        else:
-            self.data[key] = [value]
 
-    def frozen(self) -> pd.DataFrame:
-        return pd.DataFrame(self.data).set_index("time_ms")
+def load_config(path: str | PathLike[str] = CONFIG_PATH) -> configparser.ConfigParser:
+    config = configparser.ConfigParser()
+    config.read(path)
+    return config
 
 
 def available_ports() -> List[Optional[str]]:
     return [port.device for port in serial.tools.list_ports.comports()]
 
 
+def negotiate_binary_stream(ser: serial.Serial, timeout: float = 1.0) -> bool:
+    print(f"Tx: {BINARY_STREAM_REQUEST.decode().strip()}")
+    ser.write(BINARY_STREAM_REQUEST)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        rx_data = ser.readline().decode(errors="backslashreplace")
+        if BINARY_STREAM_ACK in rx_data:
+            return True
+        if "Invalid command" in rx_data:
+            # Older firmware rejects the request like any unknown spec line
+            break
+    return False
+
+
 def test_run(
     filename: Optional[str | PathLike[str]],
     plan: Optional[TestPlan] = None,
     teardown=True,
     port: Optional[str] = None,
     timeout: Optional[float] = None,
-) -> pd.DataFrame:
+    binary: Optional[bool] = None,
+    stream: Optional[bool] = None,
+    live_plot: Optional[bool] = None,
+    monitor: Optional["bool | StreamMonitor"] = None,
+    monitor_abort: Optional[bool] = None,
+    controller: Optional["SetpointController"] = None,
+    latency_budget_ms: Optional[float] = None,
+) -> "pd.DataFrame":
     if filename is not None:
         filename = Path(filename)
         if filename.exists():
+            from dataset import load_run
+
             print("Loading saved data")
-            return (
-                pd.read_csv(filename, index_col="Time (ms)")
-                .rename(columns=INV_LABEL_MAP)
-                .rename_axis("time_ms")
-            )
+            return load_run(filename)
     if plan is None:
         raise ValueError(
             "File does not exist and no test plan was provided to run a new test"
         )
+    # Imported here rather than at the top so TestPlan and friends can be
+    # imported without pulling in pandas and scipy
+    from acquisition import AcquisitionPipeline
+    from closed_loop import SetpointController, compile_setpoints
+    from monitor import StreamMonitor, default_rules
+    from sample_buffer import SampleBuffer
+
+    config = load_config()
     if port is None:
         port = config.get("Runner", "port", fallback=None)
         if port is None:
@@ -176,72 +175,117 @@ def test_run(
             )
     if timeout is None:
         timeout = config.getfloat("Runner", "timeout", fallback=0.1)
+    if binary is None:
+        binary = config.getboolean("Runner", "binary", fallback=True)
+    if stream is None:
+        stream = config.getboolean("Runner", "stream", fallback=True)
+    if live_plot is None:
+        live_plot = config.getboolean("Runner", "live_plot", fallback=False)
+    if monitor is None:
+        monitor = config.getboolean("Runner", "monitor", fallback=True)
+    if monitor_abort is None:
+        # The monitor only flags runs unless asked to stop the jig
+        monitor_abort = config.getboolean("Runner", "monitor_abort", fallback=False)
+    if latency_budget_ms is None:
+        latency_budget_ms = config.getfloat(
+            "Runner", "latency_budget_ms", fallback=20.0
+        )
 
-    test_data_builder = TestDataBuilder()
+    samples = SampleBuffer(columns=INDEX_MAP.keys())
 
     with serial.Serial(port=port, baudrate=SERIAL_BAUD, timeout=timeout) as ser:
-        print("Tx: Begin new test spec")
-        ser.write(b"Begin new test spec\n")
+        print(f"Tx: {SPEC_BEGIN.decode().strip()}")
+        ser.write(SPEC_BEGIN)
         print(f'FAIL Rx: {ser.readline().decode(errors="backslashreplace")}')
-        print("Tx: time_ms,top_throttle,bottom_throttle,pitch_us,roll_us")
-        ser.write(b"time_ms,top_throttle,bottom_throttle,pitch_us,roll_us\n")
+        print(f"Tx: {SPEC_HEADER.decode().strip()}")
+        ser.write(SPEC_HEADER)
         print(f'FAIL Rx: {ser.readline().decode(errors="backslashreplace")}')
 
-        for command in plan.commands(teardown=teardown):
-            command_line = f"{command.time_ms},{command.top_throttle},{command.bottom_throttle},{command.pitch_angle},{command.roll_angle}\n"
-            ser.write((command_line).encode("utf-8"))
-
-        print(f'FAIL Rx: {ser.readline().decode(errors="backslashreplace")}')
+        commands = plan.compile(teardown=teardown)
+        uploader = SpecUploader(ser, commands)
+        if not uploader.negotiate():
+            print("Chunked spec unsupported, sending lines")
+        uploader.upload(stream=stream)
+        print(f"Spec upload: {uploader.stats.summary()}")
+
+        if not uploader.stats.chunked:
+            print(f'FAIL Rx: {ser.readline().decode(errors="backslashreplace")}')
+        if binary:
+            binary = negotiate_binary_stream(ser)
+            print(f"Binary stream {'enabled' if binary else 'unsupported, using CSV'}")
         ser.write(b"Run test\n")
         print("Arming...")
         print(f'FAIL Rx: {ser.readline().decode(errors="backslashreplace")}')
-        ctrl_msgs = (
-            "",
-            "Thrust Jig Firmware Program\r\n",
-            "Setting up\r\n",
-            "Ready to load test spec\r\n",
-            "Starting test\r\n",
-            "time_us,top_rpm,bot_rpm,v_bat,i_bat,i_top,i_bot,thrust_N,torque_Nm\r\n",
-        )
-
-        last_time = time.time()
+        dashboard = None
+        if live_plot:
+            from live_plot import LiveDashboard
 
+            dashboard = LiveDashboard(
+                samples.columns, source=samples, labels=LABEL_MAP, title=plan.name
+            )
+        if monitor is True:
+            monitor = StreamMonitor(
+                samples.columns,
+                rules=default_rules(abort=monitor_abort),
+                commands=commands,
+            )
+        if monitor and monitor.on_abort is None:
+            # Anything the rules abort on, the jig should stop for right away
+            monitor.on_abort = lambda event: ser.write(b"Stop\n")
+        if controller is None:
+            controller = SetpointController(
+                samples.columns,
+                commands,
+                compile_setpoints(plan.steps, commands),
+                latency_budget_ms=latency_budget_ms,
+            )
+        if controller.write is None:
+            controller.write = ser.write
+        if not controller.enabled:
+            controller = None
+        pipeline = AcquisitionPipeline(
+            ser=ser,
+            samples=samples,
+            convert=convert_rows,
+            binary=binary,
+            on_line=lambda line: uploader.handle_line(line)
+            or (controller is not None and controller.handle_line(line)),
+            on_poll=None if uploader.done else uploader.pump,
+            dashboard=dashboard,
+            monitor=monitor or None,
+            controller=controller,
+        )
         try:
             print("Running test...")
-            while True:
-                if time.time() - last_time > 10:
-                    break
-
-                rx_data = ser.readline().decode(errors="backslashreplace")
-                print(f"Rx: {rx_data}")
-                if rx_data in ctrl_msgs:
-                    print("Skipped rx")
-                    continue
-                if "Stopped" in rx_data:
-                    break
-
-                values = rx_data.split(",")
-
-                valid = True
-                for datapoint_key, datapoint_idx in INDEX_MAP.items():
-                    try:
-                        value = float(values[datapoint_idx])
-                    except:
-                        valid = False
-                if valid:
-                    last_time = time.time()
-                if not valid:
-                    continue
-
-                for datapoint_key, datapoint_idx in INDEX_MAP.items():
-                    value = float(values[datapoint_idx])
-                    value = CONVERSION_MAP[datapoint_key](value)
-                    test_data_builder.add_datapoint(key=datapoint_key, value=value)
-        except:
-            pass
+            pipeline.run()
+        except KeyboardInterrupt:
+            print("Test interrupted, stopping jig")
+            ser.write(b"Stop\n")
 
         print("Test complete.")
-        test_data = test_data_builder.frozen()
+        print(
+            f"Buffered {len(samples)} samples in {samples.nbytes / 1024:.1f} KiB "
+            f"(capacity {samples.capacity})"
+        )
+        print(f"Acquisition: {pipeline.stats.summary()}")
+        if dashboard is not None:
+            print(f"Live plot: {dashboard.close().summary()}")
+        if monitor:
+            print(f"Monitor: {monitor.stats.summary()}")
+        if controller is not None:
+            print(f"Closed loop: {controller.stats.summary()}")
+        if uploader.stats.streamed_commands or uploader.stats.underrun:
+            print(f"Spec upload: {uploader.stats.summary()}")
+        test_data = samples.frozen(index="time_ms")
+        test_data.attrs["acquisition_stats"] = asdict(pipeline.stats)
+        test_data.attrs["spec_upload_stats"] = asdict(uploader.stats)
+        if monitor:
+            test_data.attrs["monitor_stats"] = asdict(monitor.stats)
+            test_data.attrs["monitor_events"] = [
+                asdict(event) for event in monitor.events
+            ]
+        if controller is not None:
+            test_data.attrs["closed_loop_stats"] = asdict(controller.stats)
         if filename is not None:
             try:
                 test_data.rename(columns=LABEL_MAP).rename_axis("Time (ms)").to_csv(
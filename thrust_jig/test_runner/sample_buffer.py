@@ -0,0 +1,79 @@
+from typing import Iterable, List, Sequence
+import numpy as np
+import pandas as pd
+
+
+class SampleBuffer:
+    """
+    Growable, preallocated columnar store for jig samples.
+
+    Samples live in one Fortran-ordered float64 array so each column is
+    contiguous. The array doubles when full, which keeps appends amortized O(1),
+    and `frozen()` hands out views of the filled region rather than copies.
+
+    """
+
+    def __init__(self, columns: Iterable[str], capacity: int = 4096) -> None:
+        self.columns: List[str] = list(columns)
+        self._data = np.empty((max(capacity, 1), len(self.columns)), order="F")
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def capacity(self) -> int:
+        return self._data.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self._data.nbytes
+
+    def _reserve(self, size: int) -> None:
+        if size <= self.capacity:
+            return
+        capacity = self.capacity
+        while capacity < size:
+            capacity *= 2
+        data = np.empty((capacity, len(self.columns)), order="F")
+        data[: self._size] = self._data[: self._size]
+        self._data = data
+
+    def add_row(self, row: Sequence[float]) -> None:
+        self._reserve(self._size + 1)
+        self._data[self._size] = row
+        self._size += 1
+
+    def add_rows(self, rows: np.ndarray) -> None:
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, len(self.columns))
+        self._reserve(self._size + len(rows))
+        self._data[self._size : self._size + len(rows)] = rows
+        self._size += len(rows)
+
+    def view(self) -> np.ndarray:
+        """
+        View of the filled rows. Stays valid if the buffer later grows, but
+        won't see rows added after a growth.
+
+        """
+        return self._data[: self._size]
+
+    def column(self, key: str) -> np.ndarray:
+        return self._data[: self._size, self.columns.index(key)]
+
+    def frozen(self, index: str) -> pd.DataFrame:
+        """
+        DataFrame over the filled rows, indexed by the `index` column, sharing
+        memory with the buffer.
+
+        """
+        data = self.view()
+        index_idx = self.columns.index(index)
+        value_idxs = [i for i in range(len(self.columns)) if i != index_idx]
+        frame = pd.DataFrame(
+            {self.columns[i]: data[:, i] for i in value_idxs},
+            index=pd.Index(data[:, index_idx], name=index, copy=False),
+            copy=False,
+        )
+        frame.attrs["buffer_nbytes"] = self.nbytes
+        return frame
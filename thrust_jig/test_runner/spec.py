@@ -0,0 +1,326 @@
+from typing import Callable, List, Optional, Sequence
+from dataclasses import dataclass
+import binascii
+import re
+import time
+import numpy as np
+import serial
+
+
+# Must match the spec protocol in thrust_jig_fw/src/serialProtocol.cpp
+SPEC_BEGIN = b"Begin new test spec\n"
+SPEC_HEADER = b"time_ms,top_throttle,bottom_throttle,pitch_us,roll_us\n"
+SPEC_END = b"Spec end\n"
+CHUNKED_SPEC_REQUEST = b"Chunked spec\n"
+CHUNKED_SPEC_ACK = re.compile(r"Chunked spec enabled (\d+)")
+CHUNK_REPLY = re.compile(r"Chunk (\d+) (ok|bad) (\d+)")
+SPEC_FREE = re.compile(r"Spec free (\d+)")
+SPEC_UNDERRUN = "Spec underrun"
+SPEC_CAPACITY = 2048  # Firmware default, the uploader uses what the jig reports
+SPEC_CHUNK_MAX = 256
+TEARDOWN_STEP_MS = 20
+PLAN_FIELDS = ("top_throttle", "bottom_throttle", "pitch_angle", "roll_angle")
+COMMAND_DTYPE = np.dtype(
+    [
+        ("time_ms", "<u4"),
+        ("duration_ms", "<u4"),
+        ("top_throttle", "<f8"),
+        ("bottom_throttle", "<f8"),
+        ("pitch_angle", "<f8"),
+        ("roll_angle", "<f8"),
+    ]
+)
+
+
+def _fill_forward(values: np.ndarray) -> np.ndarray:
+    """
+    Replace every NaN with the last value before it, starting from 0.
+
+    """
+    values = np.concatenate(([0.0], values))
+    index = np.where(np.isnan(values), 0, np.arange(len(values)))
+    return values[np.maximum.accumulate(index)]
+
+
+def compile_steps(steps: Sequence, teardown: bool = True) -> np.ndarray:
+    """
+    Compile TestSteps into one COMMAND_DTYPE record per command, the same
+    timeline as TestPlan.commands(): an all zero command at 0 ms, one command per
+    step holding any unset values, then (with `teardown`) 20 ms steps bringing
+    both throttles down by 1 % at a time. After a closed loop step the teardown
+    lasts long enough to ramp down from full throttle, as the loop ramps the
+    throttles down itself from wherever it left them.
+
+    """
+    durations = np.array([step.duration_ms for step in steps], dtype=np.int64)
+    commands = np.zeros(len(steps) + 1, dtype=COMMAND_DTYPE)
+    commands["duration_ms"][1:] = durations
+    commands["time_ms"][1:] = np.cumsum(durations) - durations
+    for name in PLAN_FIELDS:
+        values = np.array([getattr(step, name) for step in steps], dtype=np.float64)
+        commands[name] = _fill_forward(values)
+
+    last = commands[-1]
+    top, bottom = float(last["top_throttle"]), float(last["bottom_throttle"])
+    closed_loop = bool(steps) and (
+        steps[-1].target_thrust_N is not None or steps[-1].balance_rpm
+    )
+    if not teardown or (top == 0 and bottom == 0 and not closed_loop):
+        return commands
+    count = max(1, int(np.ceil(max(top, bottom))))
+    if closed_loop:
+        count = max(count, 100)
+    k = np.arange(1, count + 1)
+    ramp = np.zeros(count, dtype=COMMAND_DTYPE)
+    ramp["time_ms"] = last["time_ms"] + last["duration_ms"] + TEARDOWN_STEP_MS * (k - 1)
+    ramp["duration_ms"] = TEARDOWN_STEP_MS
+    ramp["top_throttle"] = np.maximum(0, top - k)
+    ramp["bottom_throttle"] = np.maximum(0, bottom - k)
+    ramp["pitch_angle"] = last["pitch_angle"]
+    ramp["roll_angle"] = last["roll_angle"]
+    return np.concatenate((commands, ramp))
+
+
+def encode_lines(commands: np.ndarray) -> List[bytes]:
+    """
+    Format compiled commands as the firmware's spec lines.
+
+    """
+    return [
+        f"{time_ms},{top!r},{bottom!r},{round(pitch)},{round(roll)}\n".encode()
+        for time_ms, top, bottom, pitch, roll in zip(
+            commands["time_ms"].tolist(),
+            commands["top_throttle"].tolist(),
+            commands["bottom_throttle"].tolist(),
+            commands["pitch_angle"].tolist(),
+            commands["roll_angle"].tolist(),
+        )
+    ]
+
+
+def chunk_checksum(lines: Sequence[bytes]) -> int:
+    """
+    CRC-16/CCITT over the lines of a chunk, newlines included.
+
+    """
+    crc = 0xFFFF
+    for line in lines:
+        crc = binascii.crc_hqx(line, crc)
+    return crc
+
+
+@dataclass
+class SpecUploadStats:
+    commands: int = 0
+    chunked: bool = False
+    chunks: int = 0
+    retransmits: int = 0
+    timeouts: int = 0
+    bytes_sent: int = 0
+    upload_s: float = 0.0
+    preloaded_commands: int = 0
+    streamed_commands: int = 0
+    underrun: bool = False
+    failed: bool = False
+
+    @property
+    def ms_per_1k_commands(self) -> float:
+        if self.preloaded_commands == 0:
+            return 0.0
+        return self.upload_s * 1e6 / self.preloaded_commands
+
+    def summary(self) -> str:
+        mode = f"{self.chunks} chunks" if self.chunked else "line by line"
+        return (
+            f"{self.preloaded_commands}/{self.commands} commands "
+            f"({mode}, {self.bytes_sent / 1024:.1f} KiB) in {self.upload_s:.3f} s ({self.ms_per_1k_commands:.1f} ms per 1k commands), "
+            f"{self.streamed_commands} streamed during the test, "
+            f"{self.retransmits} retransmits, {self.timeouts} timeouts"
+            + (", UNDERRUN" if self.underrun else "")
+            + (", FAILED" if self.failed else "")
+        )
+
+
+class SpecUploader:
+    """
+    Sends a compiled test spec to the jig in checksummed, acknowledged chunks.
+
+    Every chunk is a "Chunk <seq> <count> <crc>" header followed by its command
+    lines, and the firmware answers each one with "Chunk <seq> ok|bad <free>".
+    Up to `window` chunks are in flight at once, never more commands than the
+    jig last reported free, and a rejected or unanswered chunk is sent again
+    along with everything after it. A plan longer than the jig's spec capacity
+    fills it before the test and, with `stream`, the rest follows during the
+    test: `handle_line` and `pump` are given to the acquisition pipeline, and
+    the firmware reports "Spec free <n>" as it works through the spec. Firmware
+    without chunked specs gets the plain line by line upload.
+
+    """
+
+    def __init__(
+        self,
+        ser: serial.Serial,
+        commands: np.ndarray,
+        chunk_commands: int = 64,
+        window: int = 2,
+        timeout: float = 0.5,
+        max_retries: int = 10,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.ser = ser
+        self.chunk_commands = min(chunk_commands, SPEC_CHUNK_MAX)
+        self.window = window
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.clock = clock
+        self.capacity = 0
+        self.stats = SpecUploadStats(commands=len(commands))
+        self._lines = encode_lines(commands)
+        self._base = 0  # First unacknowledged chunk
+        self._next = 0  # Next chunk to send
+        self._free = 0
+        self._retries = 0
+        self._sent_at = 0.0
+        self._end_sent = False
+        self._testing = False
+
+    @property
+    def num_chunks(self) -> int:
+        return -(-len(self._lines) // self.chunk_commands)
+
+    @property
+    def done(self) -> bool:
+        return self._base == self.num_chunks
+
+    def _chunk(self, seq: int) -> List[bytes]:
+        return self._lines[seq * self.chunk_commands : (seq + 1) * self.chunk_commands]
+
+    def _in_flight(self) -> int:
+        return sum(len(self._chunk(seq)) for seq in range(self._base, self._next))
+
+    def _write(self, data: bytes) -> None:
+        self.ser.write(data)
+        self.stats.bytes_sent += len(data)
+
+    def negotiate(self, timeout: float = 1.0) -> bool:
+        print(f"Tx: {CHUNKED_SPEC_REQUEST.decode().strip()}")
+        self._write(CHUNKED_SPEC_REQUEST)
+        deadline = self.clock() + timeout
+        while self.clock() < deadline:
+            rx_data = self.ser.readline().decode(errors="backslashreplace")
+            match = CHUNKED_SPEC_ACK.search(rx_data)
+            if match:
+                self.capacity = self._free = int(match.group(1))
+                self.chunk_commands = min(self.chunk_commands, self.capacity)
+                self.stats.chunked = True
+                return True
+            if "Invalid command" in rx_data:
+                # Older firmware rejects the request like any unknown spec line
+                break
+        return False
+
+    def pump(self, now: Optional[float] = None) -> None:
+        """
+        Send whatever the window and the jig's free space allow, and resend
+        after a timeout.
+
+        """
+        if self.stats.failed:
+            return
+        now = self.clock() if now is None else now
+        if self._base < self._next and now - self._sent_at > self.timeout:
+            self.stats.timeouts += 1
+            self._resend()
+        in_flight = self._in_flight()
+        while self._next < self.num_chunks and self._next - self._base < self.window:
+            lines = self._chunk(self._next)
+            if in_flight + len(lines) > self._free:
+                break
+            header = f"Chunk {self._next} {len(lines)} {chunk_checksum(lines)}\n"
+            self._write(header.encode() + b"".join(lines))
+            self.stats.chunks += 1
+            self._next += 1
+            in_flight += len(lines)
+            self._sent_at = now
+        if self.done and not self._end_sent:
+            self._write(SPEC_END)
+            self._end_sent = True
+
+    def _resend(self) -> None:
+        self._retries += 1
+        if self._retries > self.max_retries:
+            self.stats.failed = True
+            return
+        self.stats.retransmits += self._next - self._base
+        self._next = self._base
+
+    def handle_line(self, line: str) -> bool:
+        """
+        Take a chunk reply or free space report from the jig. Returns whether the
+        line belonged to the spec protocol.
+
+        """
+        match = CHUNK_REPLY.search(line)
+        if match:
+            seq, free = int(match.group(1)), int(match.group(3))
+            if match.group(2) == "ok":
+                if seq >= self._base:
+                    acked = sum(
+                        len(self._chunk(chunk)) for chunk in range(self._base, seq + 1)
+                    )
+                    if self._testing:
+                        self.stats.streamed_commands += acked
+                    else:
+                        self.stats.preloaded_commands += acked
+                    self._base = seq + 1
+                    self._next = max(self._next, self._base)
+                    self._free = free
+                    self._retries = 0
+                    self._sent_at = self.clock()
+            elif seq == self._base:
+                # Replies for the chunks after it were sent before the resend
+                self._free = free
+                self._resend()
+            return True
+        match = SPEC_FREE.search(line)
+        if match:
+            self._free = int(match.group(1))
+            return True
+        if SPEC_UNDERRUN in line:
+            self.stats.underrun = True
+            return True
+        return False
+
+    def upload(self, stream: bool = True) -> SpecUploadStats:
+        """
+        Upload the spec before the test, as far as the jig has room for. Without
+        `stream` the whole plan has to fit.
+
+        """
+        start = self.clock()
+        if not self.stats.chunked:
+            for line in self._lines:
+                self._write(line)
+            self.stats.preloaded_commands = len(self._lines)
+            self.stats.upload_s = self.clock() - start
+            return self.stats
+        if not stream and len(self._lines) > self.capacity:
+            raise ValueError(
+                f"Plan has {len(self._lines)} commands but the jig holds {self.capacity}, "
+                "upload with stream=True"
+            )
+        while not self.done:
+            self.pump()
+            if self.stats.failed:
+                raise RuntimeError(
+                    f"Jig did not accept spec chunk {self._base} after {self.max_retries} retries"
+                )
+            if self._base == self._next and len(self._chunk(self._next)) > self._free:
+                break  # Full, the rest is streamed during the test
+            rx_data = self.ser.readline().decode(errors="backslashreplace")
+            if rx_data and not self.handle_line(rx_data):
+                print(f"Rx: {rx_data.strip()}")
+        self.pump()
+        self.stats.upload_s = self.clock() - start
+        self._testing = True
+        return self.stats
@@ -0,0 +1,258 @@
+from typing import Dict, Mapping, Optional, Sequence, Union
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import astuple
+from pathlib import Path
+from os import PathLike
+import hashlib
+import os
+import warnings
+import numpy as np
+import pandas as pd
+
+from dataset import CACHE_DIR, cache_path, find_runs, load_run
+from spec import COMMAND_DTYPE
+
+
+STEADY_STATE_CACHE_DIR = Path(__file__).parent / ".steady_state_cache"
+STEADY_STATE_VERSION = 1
+GRAVITY = 9.81
+
+Timeline = Union[np.ndarray, Sequence]
+
+
+def command_timeline(commands: Timeline) -> np.ndarray:
+    """
+    Commands as a COMMAND_DTYPE array, from either TestPlan.compile() or the
+    TestCommands of TestPlan.commands().
+
+    """
+    if isinstance(commands, np.ndarray) and commands.dtype == COMMAND_DTYPE:
+        return commands
+    return np.array([astuple(command) for command in commands], dtype=COMMAND_DTYPE)
+
+
+def assign_windows(
+    time_ms: np.ndarray,
+    commands: Timeline,
+    settle_ms: float = 2000,
+    tail_ms: float = 0,
+) -> np.ndarray:
+    """
+    Index of the command each sample was recorded under, or -1 for samples in
+    the first `settle_ms` or last `tail_ms` of their command, or outside the
+    plan altogether.
+
+    """
+    commands = command_timeline(commands)
+    start = commands["time_ms"].astype(np.float64)
+    end = start + commands["duration_ms"]
+    time_ms = np.asarray(time_ms, dtype=np.float64)
+    # Zero length commands share a start time with the next one, side="right"
+    # picks the later of them
+    window = np.searchsorted(start, time_ms, side="right") - 1
+    valid = window >= 0
+    clipped = np.maximum(window, 0)
+    valid &= time_ms >= start[clipped] + settle_ms
+    valid &= time_ms < end[clipped] - tail_ms
+    return np.where(valid, window, -1)
+
+
+def _window_stats(values: np.ndarray, window: np.ndarray) -> tuple:
+    """
+    Windows with samples in them and each column's mean, sample standard
+    deviation and count of non-NaN values within them, with one reduceat per
+    statistic over the samples sorted into windows (already the case for a run
+    in time order).
+
+    """
+    order = np.argsort(window, kind="stable")
+    window, values = window[order], values[order]
+    first = np.searchsorted(window, 0)
+    window, values = window[first:], values[first:]
+    if len(window) == 0:
+        empty = np.empty((0, values.shape[1]))
+        return np.empty(0, dtype=np.int64), empty, empty, empty
+    starts = np.flatnonzero(np.diff(window, prepend=-1))
+    valid = ~np.isnan(values)
+    count = np.add.reduceat(valid, starts, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.add.reduceat(np.where(valid, values, 0), starts, axis=0) / count
+        sizes = np.diff(starts, append=len(window))
+        deviation = np.where(valid, values - np.repeat(mean, sizes, axis=0), 0)
+        std = np.sqrt(np.add.reduceat(deviation**2, starts, axis=0) / (count - 1))
+    return window[starts], mean, std, count
+
+
+def figures_of_merit(steps: Mapping[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Thrust per watt, from both the hall effect motor currents and the battery
+    shunt, and how evenly the load is split between the motors: the ratios of
+    top to bottom speed and current and a normalized torque imbalance (0 when
+    both motors draw the same current, +-1 when only one does). Takes the step
+    means from steady_state, as columns of a DataFrame or arrays.
+
+    """
+    mean = {
+        channel: np.asarray(steps[f"{channel}_mean"], dtype=np.float64)
+        for channel in (
+            "top_motor_rpm",
+            "bottom_motor_rpm",
+            "batt_voltage_V",
+            "batt_current_A",
+            "top_current_A",
+            "bottom_current_A",
+            "thrust_N",
+        )
+    }
+    thrust_g = mean["thrust_N"] / GRAVITY * 1e3
+    hall_current_A = mean["top_current_A"] + mean["bottom_current_A"]
+    hall_power_W = hall_current_A * mean["batt_voltage_V"]
+    shunt_power_W = mean["batt_current_A"] * mean["batt_voltage_V"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        merits = {
+            "thrust_g": thrust_g,
+            "thrust_g_std": np.asarray(steps["thrust_N_std"]) / GRAVITY * 1e3,
+            "hall_power_W": hall_power_W,
+            "shunt_power_W": shunt_power_W,
+            "thrust_per_W": thrust_g / hall_power_W,
+            "shunt_thrust_per_W": thrust_g / shunt_power_W,
+            "rpm_ratio": mean["top_motor_rpm"] / mean["bottom_motor_rpm"],
+            "current_ratio": mean["top_current_A"] / mean["bottom_current_A"],
+            "torque_imbalance": (mean["top_current_A"] - mean["bottom_current_A"])
+            / hall_current_A,
+        }
+    return {
+        name: np.where(np.isinf(value), np.nan, value) for name, value in merits.items()
+    }
+
+
+def steady_state(
+    data: pd.DataFrame,
+    commands: Timeline,
+    settle_ms: float = 2000,
+    tail_ms: float = 0,
+    min_samples: int = 1,
+) -> pd.DataFrame:
+    """
+    Mean and standard deviation of every channel over the settled part of each
+    command, one row per command that has at least `min_samples` samples left
+    after trimming, with the command itself and its figures of merit.
+    `data` is a run as returned by test_run or load_run, indexed by time_ms
+    from the start of the plan.
+
+    """
+    commands = command_timeline(commands)
+    window = assign_windows(data.index.to_numpy(), commands, settle_ms, tail_ms)
+    step, mean, std, count = _window_stats(data.to_numpy(dtype=np.float64), window)
+    samples = count.max(axis=1, initial=0)
+    keep = samples >= min_samples
+    step, mean, std, samples = step[keep], mean[keep], std[keep], samples[keep]
+
+    columns = {name: commands[name][step] for name in COMMAND_DTYPE.names}
+    columns["samples"] = samples
+    for i, channel in enumerate(data.columns):
+        columns[f"{channel}_mean"] = mean[:, i]
+        columns[f"{channel}_std"] = std[:, i]
+    columns.update(figures_of_merit(columns))
+    return pd.DataFrame(columns, index=pd.Index(step, name="step"))
+
+
+def _params_digest(commands: np.ndarray, settle_ms: float, tail_ms: float) -> str:
+    key = f"{STEADY_STATE_VERSION}:{settle_ms}:{tail_ms}:".encode() + commands.tobytes()
+    return hashlib.sha1(key).hexdigest()[:12]
+
+
+def _result_path(
+    filename: Path,
+    commands: np.ndarray,
+    settle_ms: float,
+    tail_ms: float,
+    cache_dir: Path,
+) -> Path:
+    run = cache_path(filename, cache_dir).name
+    return cache_dir / f"{run}-{_params_digest(commands, settle_ms, tail_ms)}.csv"
+
+
+def _analyze(
+    filename: Path,
+    commands: np.ndarray,
+    settle_ms: float,
+    tail_ms: float,
+    cache_dir: Path,
+    data_cache_dir: Path,
+) -> Optional[pd.DataFrame]:
+    path = _result_path(filename, commands, settle_ms, tail_ms, cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        data = load_run(filename, cache_dir=data_cache_dir)
+    except ValueError:
+        # An empty result marks files that aren't runs, so warm calls skip them
+        path.touch()
+        return None
+    steps = steady_state(data, commands, settle_ms, tail_ms)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}")
+    steps.to_csv(tmp)
+    os.replace(tmp, path)
+    return steps
+
+
+def steady_state_runs(
+    directory: str | PathLike[str],
+    commands: Timeline,
+    settle_ms: float = 2000,
+    tail_ms: float = 0,
+    recursive: bool = True,
+    cache_dir: Path = STEADY_STATE_CACHE_DIR,
+    data_cache_dir: Path = CACHE_DIR,
+    workers: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    steady_state for every test run CSV under a directory that was recorded
+    with the same plan, keyed by path relative to the directory in a "run"
+    index level. Runs are analysed in parallel across a process pool and the
+    per-run results cached, keyed by the CSV's path, mtime and size and by the
+    commands and trimming, so only new or changed runs are analysed again.
+    Files that aren't test run CSVs are skipped, with a warning the first time.
+
+    """
+    directory = Path(directory)
+    commands = command_timeline(commands)
+    filenames = find_runs(directory, recursive=recursive)
+    results: Dict[Path, Optional[pd.DataFrame]] = {}
+    stale = []
+    for filename in filenames:
+        path = _result_path(filename, commands, settle_ms, tail_ms, cache_dir)
+        if path.exists():
+            results[filename] = (
+                pd.read_csv(path, index_col="step") if path.stat().st_size else None
+            )
+        else:
+            stale.append(filename)
+
+    if stale:
+        n = len(stale)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, n // (4 * (os.cpu_count() or 1)))
+            steps = executor.map(
+                _analyze,
+                stale,
+                [commands] * n,
+                [settle_ms] * n,
+                [tail_ms] * n,
+                [cache_dir] * n,
+                [data_cache_dir] * n,
+                chunksize=chunksize,
+            )
+            for filename, run_steps in zip(stale, steps):
+                if run_steps is None:
+                    warnings.warn(f"Skipping {filename}: not a test run CSV")
+                results[filename] = run_steps
+
+    runs = {
+        str(filename.relative_to(directory)): results[filename]
+        for filename in filenames
+        if results[filename] is not None
+    }
+    if not runs:
+        return pd.DataFrame()
+    return pd.concat(runs.values(), keys=runs.keys(), names=["run", "step"])
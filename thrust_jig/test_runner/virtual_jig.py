@@ -0,0 +1,622 @@
+from typing import Callable, List, Optional, Tuple
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+import binascii
+import os
+import random
+import select
+import threading
+import time
+import tty
+import numpy as np
+import pandas as pd
+import scipy.signal
+
+from channels import INDEX_MAP
+from closed_loop import THROTTLE_TIMEOUT_MS
+from framing import BINARY_STREAM_ACK, FRAME_FIELDS, FRAME_SIZE, encode_frames
+from spec import SPEC_CAPACITY, SPEC_CHUNK_MAX
+
+
+# Startup and test messages as printed by thrust_jig_fw/src/main.cpp
+BOOT_MSGS = ("Thrust Jig Firmware Program", "Setting up")
+CSV_HEADER = "time_us,top_rpm,bot_rpm,v_bat,i_bat,i_top,i_bot,thrust_N,torque_Nm"
+CSV_ROW_FORMAT = "%d,%d,%d,%f,%f,%f,%f,%f,%f"
+# Raw channels of the python_client load cell board, in config.yml order, and
+# the counts per unit that config.yml calibrates them with
+CLIENT_FIELDS = (
+    "thrust_N",
+    "torque_Nm",
+    "top_rpm",
+    "bot_rpm",
+    "i_top",
+    "i_bot",
+    "v_bat",
+)
+CLIENT_COUNTS_PER_UNIT = (1 / 4.68e-5, 1 / 2.62e-6, 1, 1, 1, 1, 1)
+SATURATION_BATCH = 256
+
+
+def load_replay_rows(path: Path) -> np.ndarray:
+    """
+    Rows of a recorded test_run CSV as the firmware sent them, ordered as
+    FRAME_FIELDS.
+
+    """
+    rows = pd.read_csv(path).to_numpy(dtype=np.float64)
+    rows[:, INDEX_MAP["time_ms"]] *= 1000  # Back to firmware time_us
+    return rows
+
+
+def _parse_command(line: str) -> Optional[Tuple[int, float, float, int, int]]:
+    """
+    The firmware's sscanf("%lu,%lf,%lf,%d,%d") of a spec line.
+
+    """
+    values = line.split(",")
+    if len(values) != 5:
+        return None
+    try:
+        return (
+            int(values[0]),
+            float(values[1]),
+            float(values[2]),
+            int(float(values[3])),
+            int(float(values[4])),
+        )
+    except ValueError:
+        return None
+
+
+def _parse_throttle(line: str) -> Optional[Tuple[int, float, float]]:
+    """
+    receiveThrottleLine's sscanf("Throttle %lu %lf %lf") of a throttle update,
+    with the throttles clamped to 0-100 % and NaN taken as 0.
+
+    """
+    values = line.split()
+    if len(values) != 4 or values[0] != "Throttle":
+        return None
+    try:
+        sample_us, top, bottom = int(values[1]), float(values[2]), float(values[3])
+    except ValueError:
+        return None
+    top, bottom = np.clip(np.nan_to_num([top, bottom]), 0, 100).tolist()
+    return sample_us, top, bottom
+
+
+class SpecLoader:
+    """
+    receiveTestSpec and receiveSpecLine from serialProtocol.cpp, fed one line
+    at a time and answering through `reply`.
+
+    """
+
+    def __init__(
+        self, reply: Callable[[str], None], capacity: int = SPEC_CAPACITY
+    ) -> None:
+        self.reply = reply
+        self.capacity = capacity
+        self.spec: deque = deque()
+        self.binary_stream = False
+        self.spec_complete = True
+        self.changes = 0  # Bumped whenever the spec changes
+        self._waiting = True
+        self._skip_header = False
+        self._chunked = False
+        self._next_chunk = 0
+        self._chunk_left = 0
+        self._chunk: List[Tuple] = []
+        self._chunk_valid = False
+        self._seq = 0
+        self._crc = 0
+        self._expected_crc = 0
+
+    @property
+    def free(self) -> int:
+        return max(0, self.capacity - len(self.spec))
+
+    def ready(self) -> None:
+        self._waiting = True
+        self.reply("Ready to load test spec")
+
+    def _begin(self) -> None:
+        self._waiting = False
+        self._skip_header = True
+        self.spec.clear()
+        self.changes += 1
+        self.binary_stream = False
+        self._chunked = False
+        self.spec_complete = True
+        self._next_chunk = 0
+        self._chunk_left = 0
+
+    def receive(self, line: str) -> bool:
+        """
+        Take a line while setting up a test. Returns True on a valid "Run test".
+
+        """
+        if line == "":
+            return False
+        if self._waiting:
+            if line == "Begin new test spec":
+                self._begin()
+            else:
+                self.reply(f"Invalid command: {line}")
+            return False
+        if self._skip_header:
+            # Ignore CSV header line
+            self._skip_header = False
+            return False
+        if self.receive_spec_line(line):
+            return False
+        if line == "Begin new test spec":
+            self._begin()
+        elif line == "Binary stream":
+            self.binary_stream = True
+            self.reply(BINARY_STREAM_ACK)
+        elif line == "Chunked spec" and len(self.spec) == 0:
+            self._chunked = True
+            self.spec_complete = False
+            self.reply(f"Chunked spec enabled {self.capacity}")
+        elif line == "Run test":
+            if len(self.spec) == 0:
+                self.reply("Invalid state")
+            else:
+                return True
+        else:
+            command = None if self._chunked else _parse_command(line)
+            if command is not None:
+                self.spec.append(command)
+                self.changes += 1
+            else:
+                self.reply(f"Invalid command: {line}")
+        return False
+
+    def receive_spec_line(self, line: str) -> bool:
+        if not self._chunked:
+            return False
+        if self._chunk_left > 0 and not line.startswith("Chunk "):
+            self._crc = binascii.crc_hqx(f"{line}\n".encode(), self._crc)
+            command = _parse_command(line)
+            if command is not None:
+                self._chunk.append(command)
+            else:
+                self._chunk_valid = False
+            self._chunk_left -= 1
+            if self._chunk_left == 0:
+                self._finish_chunk()
+            return True
+        if self._chunk_left > 0:
+            # Lines went missing, so the next header was read as a command
+            self._chunk_valid = False
+            self._chunk_left = 0
+            self._finish_chunk()
+        if line.startswith("Chunk "):
+            try:
+                self._seq, count, self._expected_crc = map(int, line.split()[1:])
+            except ValueError:
+                return False
+            self._crc = 0xFFFF
+            self._chunk_valid = True
+            self._chunk = []
+            if count == 0 or count > SPEC_CHUNK_MAX:
+                self._chunk_valid = False
+                self._finish_chunk()
+            else:
+                self._chunk_left = count
+            return True
+        if line == "Spec end":
+            self.spec_complete = True
+            return True
+        return False
+
+    def _finish_chunk(self) -> None:
+        if self._seq < self._next_chunk:
+            self.reply(f"Chunk {self._seq} ok {self.free}")
+        elif (
+            self._chunk_valid
+            and self._crc == self._expected_crc
+            and self._seq == self._next_chunk
+            and len(self._chunk) <= self.free
+        ):
+            self.spec.extend(self._chunk)
+            self.changes += 1
+            self._next_chunk += 1
+            self.reply(f"Chunk {self._seq} ok {self.free}")
+        else:
+            self.reply(f"Chunk {self._seq} bad {self.free}")
+        self._chunk = []
+
+    def pop(self) -> None:
+        self.spec.popleft()
+        self.changes += 1
+        if not self.spec_complete:
+            self.reply(f"Spec free {self.free}")
+
+
+@dataclass
+class JigModel:
+    """
+    Motor, prop and battery behind the jig's sensors: RPM follows the throttle
+    with a first order lag, thrust and torque go with RPM squared and motor
+    current with RPM cubed, the battery sags through its internal resistance,
+    and every channel gets Gaussian noise.
+
+    Faults can be injected for testing the host's monitoring: a battery of
+    `capacity_Ah` whose open circuit voltage falls linearly to `empty_V` as it
+    discharges, motor `dropout_motor` cutting out `dropout_s` into a test, and
+    the load cell drifting by `thrust_drift_N_per_s`. With `motor_mismatch` the
+    bottom motor only reaches that much less of the top motor's RPM at the same
+    throttle, for the host's RPM balancing.
+
+    """
+
+    max_rpm: float = 12000.0
+    time_constant_s: float = 0.08
+    thrust_per_rpm2: float = 6e-8
+    torque_per_rpm2: float = 1e-9
+    current_per_rpm3: float = 8e-12
+    idle_current_A: float = 0.2
+    battery_V: float = 16.8
+    battery_resistance_ohm: float = 0.03
+    rpm_noise: float = 15.0
+    voltage_noise: float = 0.01
+    current_noise: float = 0.05
+    thrust_noise: float = 0.03
+    torque_noise: float = 0.002
+    capacity_Ah: Optional[float] = None
+    empty_V: float = 12.0
+    dropout_s: Optional[float] = None
+    dropout_motor: int = 0
+    thrust_drift_N_per_s: float = 0.0
+    motor_mismatch: float = 0.0
+    rpm: np.ndarray = field(default_factory=lambda: np.zeros(2), repr=False)
+    used_Ah: float = field(default=0.0, repr=False)
+
+    def reset(self) -> None:
+        # The battery isn't recharged between tests
+        self.rpm = np.zeros(2)
+
+    def rows(
+        self,
+        time_us: np.ndarray,
+        top_throttle: np.ndarray,
+        bottom_throttle: np.ndarray,
+        rng: np.random.Generator,
+    ) -> np.ndarray:
+        """
+        Samples at `time_us` (evenly spaced) for the throttle applied at each,
+        ordered as FRAME_FIELDS.
+
+        """
+        n = len(time_us)
+        dt = (time_us[-1] - time_us[0]) / (n - 1) * 1e-6 if n > 1 else 1e-3
+        decay = np.exp(-dt / self.time_constant_s)
+        rpm = np.empty((n, 2))
+        for i, throttle in enumerate((top_throttle, bottom_throttle)):
+            target = np.clip(throttle, 0, 100) / 100 * self.max_rpm
+            if i == 1:
+                target = target * (1 - self.motor_mismatch)
+            if self.dropout_s is not None and i == self.dropout_motor:
+                target = np.where(time_us >= self.dropout_s * 1e6, 0.0, target)
+            rpm[:, i], _ = scipy.signal.lfilter(
+                [1 - decay], [1, -decay], target, zi=[decay * self.rpm[i]]
+            )
+        self.rpm = rpm[-1].copy()
+
+        motor_current = (
+            self.idle_current_A * (rpm > 0) + self.current_per_rpm3 * rpm**3
+        )
+        battery_current = motor_current.sum(axis=1)
+        rows = np.empty((n, len(FRAME_FIELDS)))
+        rows[:, 0] = time_us
+        rows[:, 1:3] = np.round(rpm + rng.normal(0, self.rpm_noise, (n, 2)) * (rpm > 0))
+        open_circuit_V = self.battery_V
+        if self.capacity_Ah is not None:
+            used_Ah = self.used_Ah + np.cumsum(battery_current) * dt / 3600
+            self.used_Ah = float(used_Ah[-1])
+            open_circuit_V = self.battery_V - (self.battery_V - self.empty_V) * (
+                used_Ah / self.capacity_Ah
+            )
+        rows[:, 3] = open_circuit_V - self.battery_resistance_ohm * battery_current
+        rows[:, 4] = battery_current
+        rows[:, 5:7] = motor_current
+        rows[:, 7] = self.thrust_per_rpm2 * (rpm**2).sum(axis=1)
+        rows[:, 7] += self.thrust_drift_N_per_s * time_us * 1e-6
+        # Counter-rotating props, so the reaction torques cancel when balanced
+        rows[:, 8] = self.torque_per_rpm2 * (rpm[:, 0] ** 2 - rpm[:, 1] ** 2)
+        rows[:, 3] += rng.normal(0, self.voltage_noise, n)
+        rows[:, 4:7] += rng.normal(0, self.current_noise, (n, 3))
+        rows[:, 7] += rng.normal(0, self.thrust_noise, n)
+        rows[:, 8] += rng.normal(0, self.torque_noise, n)
+        rows[:, 1:3] = np.clip(rows[:, 1:3], 0, 0xFFFF)
+        return rows
+
+
+@dataclass
+class VirtualJigStats:
+    tests: int = 0
+    commands_received: int = 0
+    rows_sent: int = 0
+    bytes_sent: int = 0
+    malformed_lines: int = 0
+    dropped_bytes: int = 0
+    stops: int = 0
+    underruns: int = 0
+    throttle_updates: int = 0
+    run_s: float = 0.0
+
+    @property
+    def rows_per_s(self) -> float:
+        return self.rows_sent / self.run_s if self.run_s > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.tests} tests, {self.rows_sent} rows in {self.run_s:.1f} s "
+            f"({self.rows_per_s:.0f} rows/s, {self.bytes_sent / 1024:.1f} KiB), "
+            f"{self.malformed_lines} malformed, {self.dropped_bytes} B dropped, "
+            f"{self.stops} stopped by host, {self.underruns} spec underruns, "
+            f"{self.throttle_updates} throttle updates"
+        )
+
+
+class VirtualJig:
+    """
+    The thrust jig firmware emulated behind a pseudo terminal, so test_run and
+    client.run_experiment can open `port` as if the ESP32 were attached.
+
+    The jig boots, loads test specs (line by line or chunked, CSV or binary
+    stream) and runs them like main.cpp, sending a sample row every 1 /
+    `rate_hz` s through the spec's commands, or at the throttle the host sets
+    with "Throttle" commands. Rows come from `model` or, with
+    `replay`, from recorded rows cycled in order with fresh timestamps. With
+    `rate_hz` None rows go out as fast as the host takes them. `baud` limits
+    the link like the real UART (None for unlimited), bytes the host doesn't
+    read in time are dropped like a full USB serial buffer, and
+    `malformed_rate` of the rows are sent truncated, as garbage or with a
+    corrupt frame. The "client" protocol instead streams the python_client
+    board's whitespace separated raw counts from boot.
+
+    """
+
+    def __init__(
+        self,
+        rate_hz: Optional[float] = 250.0,
+        baud: Optional[int] = 921600,
+        replay: Optional[np.ndarray] = None,
+        model: Optional[JigModel] = None,
+        malformed_rate: float = 0.0,
+        capacity: int = SPEC_CAPACITY,
+        protocol: str = "jig",
+        seed: int = 0,
+    ) -> None:
+        self.rate_hz = rate_hz
+        self.baud = baud
+        self.replay = replay
+        self.model = model or JigModel()
+        self.malformed_rate = malformed_rate
+        self.protocol = protocol
+        self.stats = VirtualJigStats()
+        self.loader = SpecLoader(self._write_line, capacity=capacity)
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        os.set_blocking(self._master, False)
+        self.port = os.ttyname(self._slave)
+        self._rng = np.random.default_rng(seed)
+        self._random = random.Random(seed)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._running = False
+        self._stop_requested = False
+        self._partial_line = b""
+        self._start = 0.0
+        self._t = 0.0
+        self._test_bytes = 0
+        self._row_bytes = FRAME_SIZE
+        self._replay_pos = 0
+        self._spec_changes = -1
+        self._spec_times = np.empty(0)
+        self._spec_throttles = np.empty((0, 2))
+        self._override: Optional[np.ndarray] = None
+        self._override_at = 0.0
+
+    def start(self) -> "VirtualJig":
+        self._thread.start()
+        return self
+
+    def close(self) -> VirtualJigStats:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        if self._running:
+            self.stats.run_s += time.perf_counter() - self._start
+        os.close(self._master)
+        os.close(self._slave)
+        return self.stats
+
+    def __enter__(self) -> "VirtualJig":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _write(self, data: bytes, drop: bool = False) -> None:
+        view = memoryview(data)
+        while view and not self._stop.is_set():
+            try:
+                written = os.write(self._master, view)
+            except BlockingIOError:
+                written = 0
+            view = view[written:]
+            if view and drop:
+                self.stats.dropped_bytes += len(view)
+                return
+            if view:
+                select.select([], [self._master], [], 0.05)
+
+    def _write_line(self, text: str) -> None:
+        self._write(f"{text}\n".encode())
+
+    def _run(self) -> None:
+        for msg in BOOT_MSGS:
+            self._write_line(msg)
+        if self.protocol == "client":
+            self._start_test()
+        else:
+            self.loader.ready()
+        while not self._stop.is_set():
+            timeout = 0.001 if self._running else 0.05
+            readable, _, _ = select.select([self._master], [], [], timeout)
+            if readable:
+                try:
+                    data = os.read(self._master, 4096)
+                except (BlockingIOError, OSError):
+                    data = b""
+                *lines, self._partial_line = (self._partial_line + data).split(b"\n")
+                for line in lines:
+                    self._receive(line.decode(errors="backslashreplace"))
+            if self._running:
+                self._send_rows()
+
+    def _receive(self, line: str) -> None:
+        if self._running:
+            throttle = _parse_throttle(line)
+            if line == "Stop":
+                self._stop_requested = True
+            elif line == "Throttle off":
+                self._override = None
+            elif throttle is not None:
+                sample_us, top, bottom = throttle
+                self._override = np.array([top, bottom])
+                self._override_at = time.perf_counter() - self._start
+                self.stats.throttle_updates += 1
+                self._write_line(f"Throttle {sample_us} {int(self._override_at * 1e6)}")
+            else:
+                self.loader.receive_spec_line(line)
+        elif self.loader.receive(line):
+            self.stats.commands_received += len(self.loader.spec)
+            self._start_test()
+
+    def _start_test(self) -> None:
+        self.stats.tests += 1
+        self.model.reset()
+        if self.protocol != "client":
+            self._write_line("Starting test")
+            self._write_line(CSV_HEADER)
+        self._running = True
+        self._stop_requested = False
+        self._override = None
+        self._start = time.perf_counter()
+        self._t = 0.0
+        self._test_bytes = 0
+
+    def _stop_test(self, msg: str = "Stopped") -> None:
+        self._running = False
+        self.stats.run_s += time.perf_counter() - self._start
+        self._write_line(msg)
+        self.loader.ready()
+
+    def _commands(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._spec_changes != self.loader.changes:
+            spec = np.array(self.loader.spec, dtype=np.float64).reshape(-1, 5)
+            self._spec_times = spec[:, 0]
+            self._spec_throttles = spec[:, 1:3]
+            self._spec_changes = self.loader.changes
+        return self._spec_times, self._spec_throttles
+
+    def _send_rows(self) -> None:
+        now = time.perf_counter() - self._start
+        if self.rate_hz is not None:
+            count = int(now * self.rate_hz) - int(self._t * self.rate_hz)
+        else:
+            count = SATURATION_BATCH
+        if self.baud is not None:
+            budget = now * self.baud / 10 - self._test_bytes
+            count = min(count, int(budget // self._row_bytes))
+        if count <= 0:
+            return
+        times = self._t + (now - self._t) * np.arange(1, count + 1) / count
+        self._t = now
+
+        stop = self._stop_requested
+        if self.protocol == "client":
+            throttle = 30 * (1 - np.cos(2 * np.pi * times / 10))
+            throttles = np.column_stack((throttle, throttle))
+        else:
+            # The firmware moves on to a command once its start time has passed
+            spec_times, spec_throttles = self._commands()
+            index = np.searchsorted(spec_times[1:], times * 1000, side="left")
+            last = len(spec_times) - 1
+            if index[-1] >= last:
+                count = int(np.argmax(index >= last)) + 1
+                times, index = times[:count], index[:count]
+                stop = True
+            for _ in range(int(index[-1])):
+                self.loader.pop()
+            throttles = spec_throttles[index]
+            if self._override is not None:
+                if now - self._override_at > THROTTLE_TIMEOUT_MS / 1000:
+                    # Host stopped updating the throttle, fall back to the spec
+                    self._override = None
+                else:
+                    throttles = np.tile(self._override, (count, 1))
+
+        if self.replay is not None:
+            rows = self.replay[(self._replay_pos + np.arange(count)) % len(self.replay)]
+            self._replay_pos += count
+            rows[:, 0] = times * 1e6
+        else:
+            rows = self.model.rows(
+                times * 1e6, throttles[:, 0], throttles[:, 1], self._rng
+            )
+        data = self._encode(rows)
+        self._row_bytes = len(data) / count
+        self._test_bytes += len(data)
+        self.stats.rows_sent += count
+        self.stats.bytes_sent += len(data)
+        self._write(data, drop=self.rate_hz is not None)
+
+        if self.protocol == "client":
+            return
+        if stop and not self.loader.spec_complete and not self._stop_requested:
+            self.stats.underruns += 1
+            self._write_line("Spec underrun")
+            self._stop_test()
+        elif stop:
+            self.stats.stops += self._stop_requested
+            self._stop_test()
+
+    def _malformed(self, count: int) -> np.ndarray:
+        if self.malformed_rate <= 0:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(self._rng.random(count) < self.malformed_rate)
+
+    def _encode(self, rows: np.ndarray) -> bytes:
+        bad = self._malformed(len(rows))
+        self.stats.malformed_lines += len(bad)
+        if self.protocol == "jig" and self.loader.binary_stream:
+            frames = bytearray(encode_frames(rows))
+            for i in bad:
+                # Flip a payload byte so the checksum fails
+                frames[
+                    i * FRAME_SIZE + self._random.randrange(2, FRAME_SIZE - 1)
+                ] ^= 0xFF
+            return bytes(frames)
+        if self.protocol == "client":
+            counts = rows[:, [FRAME_FIELDS.index(name) for name in CLIENT_FIELDS]]
+            counts = np.trunc(counts * CLIENT_COUNTS_PER_UNIT).astype(np.int64)
+            lines = [" ".join(map(str, row)) for row in counts.tolist()]
+        else:
+            lines = [CSV_ROW_FORMAT % tuple(row) for row in rows.tolist()]
+        for i in bad:
+            # Cut before the last separator so the row is short a value
+            cut = max(lines[i].rfind(","), lines[i].rfind(" "))
+            if self._random.random() < 0.5 and cut > 1:
+                lines[i] = lines[i][: self._random.randrange(1, cut)]
+            else:
+                lines[i] = "".join(
+                    chr(self._random.randrange(32, 127)) for _ in range(len(lines[i]))
+                )
+        return ("\n".join(lines) + "\n").encode()
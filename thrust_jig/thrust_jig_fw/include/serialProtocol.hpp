@@ -3,10 +3,18 @@
 
 /* Includes */
 #include <deque>
+#include <vector>
 #include <HardwareSerial.h>
 
 /* Symbolic constants */
 #define NUM_COMMAND_SET_VALUES 5
+#define DATA_FRAME_SYNC 0x5AA5
+// Chunked spec upload, must match test_runner/spec.py
+#define SPEC_CAPACITY 2048
+#define SPEC_CHUNK_MAX 256
+#define SERIAL_RX_BUFFER 4096
+// Closed loop throttle overrides, must match test_runner/closed_loop.py
+#define THROTTLE_TIMEOUT_US 100000
 
 /* Type definitions */
 struct CommandSet_S
@@ -18,10 +26,31 @@ struct CommandSet_S
     int roll_us;
 };
 
+// Binary sample record, must match FRAME_DTYPE in test_runner/framing.py
+struct __attribute__((packed)) DataFrame_S
+{
+    uint16_t sync;
+    uint32_t time_us;
+    uint16_t top_rpm;
+    uint16_t bot_rpm;
+    float v_bat;
+    float i_bat;
+    float i_top;
+    float i_bot;
+    float thrust_N;
+    float torque_Nm;
+    uint8_t checksum;
+};
+
 /* Global variables */
 extern std::deque<CommandSet_S> test_spec;
+extern bool binary_stream;
+extern bool spec_complete;
 
 /* Function definitions */
 void receiveTestSpec(void);
+bool receiveSpecLine(const String &input);
+void popTestSpec(void);
+void sendDataFrame(DataFrame_S *frame);
 
 #endif
\ No newline at end of file
@@ -8,6 +8,8 @@
 
 void setup()
 {
+    // Room for spec chunks streamed in while the test is running
+    Serial.setRxBufferSize(SERIAL_RX_BUFFER);
     Serial.begin(921600);
     Serial.println("Thrust Jig Firmware Program");
 
@@ -30,6 +32,39 @@ static unsigned long start_time_micros = 0;
 static unsigned long start_time_millis = 0;
 static CommandSet_S current_command;
 static String input = "";
+static bool stop_requested = false;
+// Throttle set by the host's closed loop controller, overriding the spec's
+static bool throttle_override = false;
+static double override_top = 0;
+static double override_bot = 0;
+static unsigned long override_micros = 0;
+
+/*
+ * Handle "Throttle <sample_us> <top> <bot>" from the host during a test,
+ * applying it right away and answering "Throttle <sample_us> <applied_us>" so
+ * the host can time the loop from the sample it acted on. "Throttle off"
+ * hands the motors back to the spec. Returns false for other lines.
+ */
+static bool receiveThrottleLine(const String &input) {
+    unsigned long sample_us;
+    double top, bot;
+    if (input == "Throttle off") {
+        throttle_override = false;
+        return true;
+    }
+    if (sscanf(input.c_str(), "Throttle %lu %lf %lf", &sample_us, &top, &bot) != 3) {
+        return false;
+    }
+    // Whatever the host sends, keep the motors within their range
+    override_top = isnan(top) ? 0 : constrain(top, 0.0, 100.0);
+    override_bot = isnan(bot) ? 0 : constrain(bot, 0.0, 100.0);
+    setThrottlePercent(MOTOR_1, override_top);
+    setThrottlePercent(MOTOR_2, override_bot);
+    override_micros = micros();
+    throttle_override = true;
+    Serial.printf("Throttle %lu %lu\n", sample_us, override_micros - start_time_micros);
+    return true;
+}
 
 void loop()
 {
@@ -55,36 +90,71 @@ void loop()
     
     case RUN_TEST:
         if (test_spec.size() > 1 && test_spec.at(1).time_ms < millis() - start_time_millis) {
-            test_spec.pop_front();
+            popTestSpec();
         }
         current_command = test_spec.front();
-        setThrottlePercent(MOTOR_1, current_command.top_percent);
-        setThrottlePercent(MOTOR_2, current_command.bot_percent);
+        if (throttle_override && micros() - override_micros > THROTTLE_TIMEOUT_US) {
+            // Host stopped updating the throttle, fall back to the spec
+            throttle_override = false;
+        }
+        if (throttle_override) {
+            setThrottlePercent(MOTOR_1, override_top);
+            setThrottlePercent(MOTOR_2, override_bot);
+        } else {
+            setThrottlePercent(MOTOR_1, current_command.top_percent);
+            setThrottlePercent(MOTOR_2, current_command.bot_percent);
+        }
         setServoPwm(PITCH_VANE, current_command.pitch_us);
         setServoPwm(ROLL_VANE, current_command.roll_us);
-        Serial.printf(
-            "%lu,%" PRIu16 ",%" PRIu16 ",%f,%f,%f,%f,%f,%f\n",
-            micros() - start_time_micros,
-            getRpm(MOTOR_1),
-            getRpm(MOTOR_2),
-            getVoltageV(VBAT),
-            getCurrentA(IBAT),
-            getCurrentA(IMOTOR1),
-            getCurrentA(IMOTOR2),
-            getLoadCellValue(THRUST),
-            getLoadCellValue(TORQUE)
-        );
-        // Nonblocking string read persistent over multiple loop iterations
+        if (binary_stream) {
+            DataFrame_S frame;
+            frame.time_us = micros() - start_time_micros;
+            frame.top_rpm = getRpm(MOTOR_1);
+            frame.bot_rpm = getRpm(MOTOR_2);
+            frame.v_bat = getVoltageV(VBAT);
+            frame.i_bat = getCurrentA(IBAT);
+            frame.i_top = getCurrentA(IMOTOR1);
+            frame.i_bot = getCurrentA(IMOTOR2);
+            frame.thrust_N = getLoadCellValue(THRUST);
+            frame.torque_Nm = getLoadCellValue(TORQUE);
+            sendDataFrame(&frame);
+        } else {
+            Serial.printf(
+                "%lu,%" PRIu16 ",%" PRIu16 ",%f,%f,%f,%f,%f,%f\n",
+                micros() - start_time_micros,
+                getRpm(MOTOR_1),
+                getRpm(MOTOR_2),
+                getVoltageV(VBAT),
+                getCurrentA(IBAT),
+                getCurrentA(IMOTOR1),
+                getCurrentA(IMOTOR2),
+                getLoadCellValue(THRUST),
+                getLoadCellValue(TORQUE)
+            );
+        }
+        // Nonblocking line read persistent over multiple loop iterations
         while (Serial.available()) {
             char c = Serial.read();
-            if (c == '\n' && input != "Stop") {
+            if (c == '\n') {
+                if (input == "Stop") {
+                    stop_requested = true;
+                } else if (!receiveThrottleLine(input)) {
+                    receiveSpecLine(input);
+                }
                 input.clear();
             } else if (c >= 0) {
                 input += c;
             }
         }
-        if (test_spec.size() <= 1 || input == "Stop\n") {
+        if (test_spec.size() <= 1 && !spec_complete) {
+            // Streamed spec ran dry, stop rather than hold the last command
+            Serial.println("Spec underrun");
+            stop_requested = true;
+        }
+        if (test_spec.size() <= 1 || stop_requested) {
             input = "";
+            stop_requested = false;
+            throttle_override = false;
             stopBldcMotor(ALL);
             setServoPwm(PITCH_VANE, 1500);
             setServoPwm(ROLL_VANE, 1500);
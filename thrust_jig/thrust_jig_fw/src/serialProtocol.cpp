@@ -1,10 +1,133 @@
 #include "serialProtocol.hpp"
 
 std::deque<CommandSet_S> test_spec;
+bool binary_stream = false;
+// False while a chunked spec may still get more chunks, including during a test
+bool spec_complete = true;
+
+static bool chunked_spec = false;
+static unsigned long next_chunk = 0;
+static unsigned long chunk_seq = 0;
+static int chunk_lines_left = 0;
+static uint16_t chunk_crc = 0;
+static uint16_t chunk_expected_crc = 0;
+static bool chunk_valid = false;
+static std::vector<CommandSet_S> chunk;
+
+// CRC-16/CCITT, the same as Python's binascii.crc_hqx
+static uint16_t crc16(uint16_t crc, const uint8_t *data, size_t length) {
+    for (size_t i = 0; i < length; i++) {
+        crc ^= (uint16_t)data[i] << 8;
+        for (int bit = 0; bit < 8; bit++) {
+            crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+        }
+    }
+    return crc;
+}
+
+static bool parseCommand(const String &input, CommandSet_S *command_set) {
+    int num_values = sscanf(
+        input.c_str(),
+        "%lu,%lf,%lf,%d,%d",
+        &command_set->time_ms,
+        &command_set->top_percent,
+        &command_set->bot_percent,
+        &command_set->pitch_us,
+        &command_set->roll_us
+    );
+    return num_values == NUM_COMMAND_SET_VALUES;
+}
+
+static size_t specFree(void) {
+    return test_spec.size() < SPEC_CAPACITY ? SPEC_CAPACITY - test_spec.size() : 0;
+}
+
+static void resetChunkedSpec(void) {
+    chunked_spec = false;
+    spec_complete = true;
+    next_chunk = 0;
+    chunk_lines_left = 0;
+    chunk.clear();
+}
+
+static void finishChunk(void) {
+    if (chunk_seq < next_chunk) {
+        // Retransmission of a chunk whose ack was lost
+        Serial.printf("Chunk %lu ok %u\n", chunk_seq, specFree());
+    } else if (
+        chunk_valid && chunk_crc == chunk_expected_crc && chunk_seq == next_chunk &&
+        chunk.size() <= specFree()
+    ) {
+        test_spec.insert(test_spec.end(), chunk.begin(), chunk.end());
+        next_chunk++;
+        Serial.printf("Chunk %lu ok %u\n", chunk_seq, specFree());
+    } else {
+        Serial.printf("Chunk %lu bad %u\n", chunk_seq, specFree());
+    }
+    chunk.clear();
+}
+
+/*
+ * Handle a line of a chunked spec: "Chunk <seq> <count> <crc>" followed by
+ * <count> command lines, or "Spec end". Chunks are only appended in sequence
+ * and when the command lines match the CRC, and every chunk is answered with
+ * "Chunk <seq> ok|bad <free>" so the host can resend and never overfill the
+ * spec. Used before and during a test, returns false for other lines.
+ */
+bool receiveSpecLine(const String &input) {
+    if (!chunked_spec) {
+        return false;
+    }
+    if (chunk_lines_left > 0 && !input.startsWith("Chunk ")) {
+        CommandSet_S command_set;
+        chunk_crc = crc16(chunk_crc, (const uint8_t *)input.c_str(), input.length());
+        chunk_crc = crc16(chunk_crc, (const uint8_t *)"\n", 1);
+        if (parseCommand(input, &command_set)) {
+            chunk.push_back(command_set);
+        } else {
+            chunk_valid = false;
+        }
+        if (--chunk_lines_left == 0) {
+            finishChunk();
+        }
+        return true;
+    }
+    if (chunk_lines_left > 0) {
+        // Lines went missing, so the next header was read as a command
+        chunk_valid = false;
+        chunk_lines_left = 0;
+        finishChunk();
+    }
+    unsigned int count, crc;
+    if (sscanf(input.c_str(), "Chunk %lu %u %u", &chunk_seq, &count, &crc) == 3) {
+        chunk_expected_crc = crc;
+        chunk_crc = 0xFFFF;
+        chunk_valid = true;
+        chunk.clear();
+        if (count == 0 || count > SPEC_CHUNK_MAX) {
+            chunk_valid = false;
+            finishChunk();
+        } else {
+            chunk_lines_left = count;
+        }
+        return true;
+    }
+    if (input == "Spec end") {
+        spec_complete = true;
+        return true;
+    }
+    return false;
+}
+
+void popTestSpec(void) {
+    test_spec.pop_front();
+    if (!spec_complete) {
+        Serial.printf("Spec free %u\n", specFree());
+    }
+}
 
 void receiveTestSpec(void) {
     String input;
-    int num_values;
     Serial.println("Ready to load test spec");
     while (true) {
         input = Serial.readStringUntil('\n');
@@ -16,6 +139,8 @@ void receiveTestSpec(void) {
     }
     while (true) {
         test_spec.clear();
+        binary_stream = false;
+        resetChunkedSpec();
         // Ignore CSV header line
         do {
             input = Serial.readStringUntil('\n');
@@ -24,8 +149,17 @@ void receiveTestSpec(void) {
             do {
                 input = Serial.readStringUntil('\n');
             } while (input == "");
-            if (input == "Begin new test spec") {
+            if (receiveSpecLine(input)) {
+                continue;
+            } else if (input == "Begin new test spec") {
                 break;
+            } else if (input == "Binary stream") {
+                binary_stream = true;
+                Serial.println("Binary stream enabled");
+            } else if (input == "Chunked spec" && test_spec.size() == 0) {
+                chunked_spec = true;
+                spec_complete = false;
+                Serial.printf("Chunked spec enabled %u\n", SPEC_CAPACITY);
             } else if (input == "Run test") {
                 if (test_spec.size() == 0) {
                     Serial.println("Invalid state");
@@ -35,16 +169,8 @@ void receiveTestSpec(void) {
                 }
             } else {
                 CommandSet_S command_set;
-                num_values = sscanf(
-                    input.c_str(),
-                    "%lu,%lf,%lf,%d,%d",
-                    &command_set.time_ms,
-                    &command_set.top_percent,
-                    &command_set.bot_percent,
-                    &command_set.pitch_us,
-                    &command_set.roll_us
-                );
-                if (num_values == NUM_COMMAND_SET_VALUES) {
+                // Chunked specs only take commands inside checksummed chunks
+                if (!chunked_spec && parseCommand(input, &command_set)) {
                     test_spec.push_back(command_set);
                 } else {
                     Serial.printf("Invalid command: %s\n", input);
@@ -53,3 +179,13 @@ void receiveTestSpec(void) {
         }
     }
 }
+
+void sendDataFrame(DataFrame_S *frame) {
+    const uint8_t *bytes = (const uint8_t *)frame;
+    frame->sync = DATA_FRAME_SYNC;
+    frame->checksum = 0;
+    for (size_t i = sizeof(frame->sync); i < sizeof(DataFrame_S) - 1; i++) {
+        frame->checksum ^= bytes[i];
+    }
+    Serial.write(bytes, sizeof(DataFrame_S));
+}